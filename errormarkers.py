@@ -1,5 +1,6 @@
 import sublime
 import sublime_plugin
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 try:
     from .internals.common import get_setting, sdecode, sencode
@@ -10,6 +11,10 @@ except:
 ERRORS = {}
 WARNINGS = {}
 
+# The ViewMarks shown in each view, by view id
+VIEW_MARKS = {}
+polling_visible_marks = False
+
 ERROR = "error"
 WARNING = "warning"
 clang_view = None
@@ -60,14 +65,38 @@ class ClangPrevious(sublime_plugin.TextCommand):
 
 
 class ClangErrorPanelFlush(sublime_plugin.TextCommand):
-    def run(self, edit, data):
-        self.view.erase(edit, sublime.Region(0, self.view.size()))
-        self.view.insert(edit, 0, data)
+    def run(self, edit, data, begin=0, end=-1):
+        if end == -1:
+            end = self.view.size()
+        self.view.replace(edit, sublime.Region(begin, end), data)
+
+
+def get_changed_lines(old, new):
+    """
+    Returns the (begin, end, data) replacement of the lines that differ
+    between old and new, leaving alone the lines they start and end with
+    in common.
+    """
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    n = min(len(old_lines), len(new_lines))
+    start = 0
+    while start < n and old_lines[start] == new_lines[start]:
+        start += 1
+    end = 0
+    while end < n - start and old_lines[-1 - end] == new_lines[-1 - end]:
+        end += 1
+    begin = sum([len(l) for l in old_lines[:start]])
+    old_end = len(old) - sum([len(l) for l in old_lines[len(old_lines) - end:]])
+    return begin, old_end, "".join(new_lines[start:len(new_lines) - end])
+
 
 class ClangErrorPanel(object):
     def __init__(self):
         self.view = None
         self.data = ""
+        # What the panel view contains right now
+        self.shown = None
 
     def set_data(self, data):
         self.data = sdecode(data)
@@ -85,18 +114,26 @@ class ClangErrorPanel(object):
 
     def set_view(self, view):
         self.view = view
+        self.shown = None
 
     def flush(self):
+        if self.shown == self.data:
+            return
+        args = {"data": self.data}
+        if self.shown != None:
+            begin, end, data = get_changed_lines(self.shown, self.data)
+            args = {"data": data, "begin": begin, "end": end}
         self.view.set_read_only(False)
         self.view.set_scratch(True)
-        self.view.run_command("clang_error_panel_flush", {"data": self.data})
+        self.view.run_command("clang_error_panel_flush", args)
         self.view.set_read_only(True)
+        self.shown = self.data
 
     def open(self, window=None):
         if window == None:
             window = sublime.active_window()
         if not self.is_visible(window):
-            self.view = window.get_output_panel("clang")
+            self.set_view(window.get_output_panel("clang"))
             self.view.settings().set("result_file_regex", "^(.+):([0-9]+),([0-9]+)")
             if get_setting("output_panel_use_syntax_file", False):
                 fileName = get_setting("output_panel_syntax_file", None)
@@ -135,46 +172,142 @@ def clear_error_marks():
     WARNINGS = defaultdict(listdict)
 
 
+def set_error_marks(errors, warnings):
+    """
+    Replaces the error marks with the {filename: {line: [messages]}}
+    dictionaries of a DiagnosticsModel. The per file dictionaries are used
+    as they are, so that showing the same model again is recognized.
+    """
+    clear_error_marks()
+    ERRORS.update(errors)
+    WARNINGS.update(warnings)
+
+
 def add_error_mark(severity, filename, line, message):
     if severity.lower() == ERROR:
-        ERRORS[filename][line].append(message)
+        ERRORS[filename].setdefault(line, []).append(message)
     else:
-        WARNINGS[filename][line].append(message)
+        WARNINGS[filename].setdefault(line, []).append(message)
+
+
+class ViewMarks(object):
+    """
+    The error and warning lines marked in a view and the rows they've
+    been rendered for, None when all of them are. Files with more marks
+    than "error_marks_lazy_threshold" only get the ones around the visible
+    part rendered.
+    """
+    def __init__(self, errors, warnings, change_count):
+        self.errors = errors
+        self.warnings = warnings
+        self.error_lines = sorted((errors or {}).keys())
+        self.warning_lines = sorted((warnings or {}).keys())
+        self.change_count = change_count
+        self.rendered = None
+        self.lazy = len(self.error_lines) + len(self.warning_lines) > \
+            get_setting("error_marks_lazy_threshold", 1000)
+
+    def is_for(self, errors, warnings):
+        return self.errors is errors and self.warnings is warnings
+
+    def same_lines(self, other):
+        return self.error_lines == other.error_lines and self.warning_lines == other.warning_lines
+
+    def get_visible_rows(self, view):
+        region = view.visible_region()
+        return view.rowcol(region.begin())[0], view.rowcol(region.end())[0]
+
+    def needs_render(self, view):
+        if not self.lazy:
+            return False
+        first, last = self.get_visible_rows(view)
+        return self.rendered == None or first < self.rendered[0] or last > self.rendered[1]
+
+    def get_lines(self, lines):
+        if self.rendered == None:
+            return lines
+        return lines[bisect_left(lines, self.rendered[0]):bisect_right(lines, self.rendered[1])]
+
+    def render(self, view):
+        if self.lazy:
+            margin = get_setting("error_marks_margin", 200)
+            first, last = self.get_visible_rows(view)
+            self.rendered = (max(0, first - margin), last + margin)
+        fill_outlines = False
+        gutter_mark = 'dot'
+        outlines = {'warning': self.get_lines(self.warning_lines),
+                    'illegal': self.get_lines(self.error_lines)}
+        markers = {'warning':  get_setting("marker_warning_scope", "comment"),
+                    'illegal': get_setting("marker_error_scope", "invalid")
+                    }
+
+        for lint_type in outlines:
+            key = 'sublimeclang-outlines-{0}'.format(lint_type)
+            if not outlines[lint_type]:
+                view.erase_regions(key)
+                continue
+            args = [
+                key,
+                [view.full_line(view.text_point(line, 0)) for line in outlines[lint_type]],
+                markers[lint_type],
+                gutter_mark
+            ]
+            if not fill_outlines:
+                args.append(sublime.DRAW_OUTLINED)
+            view.add_regions(*args)
 
 
 def show_error_marks(view):
     '''Adds error marks to view.'''
-    erase_error_marks(view)
     if not get_setting("show_visual_error_marks", True):
+        erase_error_marks(view)
         return
-    fill_outlines = False
-    gutter_mark = 'dot'
-    outlines = {'warning': [], 'illegal': []}
     fn = sencode(view.file_name())
-    markers = {'warning':  get_setting("marker_warning_scope", "comment"),
-                'illegal': get_setting("marker_error_scope", "invalid")
-                }
+    errors = ERRORS.get(fn)
+    warnings = WARNINGS.get(fn)
+    marks = VIEW_MARKS.get(view.id())
+    if marks != None and marks.is_for(errors, warnings):
+        if marks.needs_render(view):
+            marks.render(view)
+        return
+    new_marks = ViewMarks(errors, warnings, view.change_count())
+    VIEW_MARKS[view.id()] = new_marks
+    if marks != None and marks.same_lines(new_marks) and marks.change_count == new_marks.change_count \
+            and not marks.needs_render(view):
+        # Regions move along with edits, so as long as the buffer and the
+        # lines to mark are the same the regions already there are right
+        new_marks.rendered = marks.rendered
+        return
+    new_marks.render(view)
+    if new_marks.lazy:
+        poll_visible_marks()
 
-    for line in ERRORS[fn].keys():
-        outlines['illegal'].append(view.full_line(view.text_point(line, 0)))
-    for line in WARNINGS[fn].keys():
-        outlines['warning'].append(view.full_line(view.text_point(line, 0)))
 
-    for lint_type in outlines:
-        if outlines[lint_type]:
-            args = [
-                'sublimeclang-outlines-{0}'.format(lint_type),
-                outlines[lint_type],
-                markers[lint_type],
-                gutter_mark
-            ]
-            if not fill_outlines:
-                args.append(sublime.DRAW_OUTLINED)
-            view.add_regions(*args)
+def poll_visible_marks():
+    '''Renders the marks scrolled into view, for as long as there are lazily rendered marks.'''
+    global polling_visible_marks
+    if polling_visible_marks:
+        return
+    polling_visible_marks = True
+
+    def poll():
+        global polling_visible_marks
+        if len([m for m in VIEW_MARKS.values() if m.lazy]) == 0:
+            polling_visible_marks = False
+            return
+        window = sublime.active_window()
+        view = window.active_view() if window != None else None
+        if view != None:
+            marks = VIEW_MARKS.get(view.id())
+            if marks != None and marks.needs_render(view):
+                marks.render(view)
+        sublime.set_timeout(poll, 250)
+    sublime.set_timeout(poll, 250)
 
 
 def erase_error_marks(view):
     '''erase all error marks from view'''
+    VIEW_MARKS.pop(view.id(), None)
     view.erase_regions('sublimeclang-outlines-illegal')
     view.erase_regions('sublimeclang-outlines-warning')
 
@@ -235,5 +368,8 @@ class SublimeClangStatusbarUpdater(sublime_plugin.EventListener):
     def on_activated(self, view):
         self.show_errors(view)
 
+    def on_close(self, view):
+        VIEW_MARKS.pop(view.id(), None)
+
     def on_load(self, view):
         self.show_errors(view)
@@ -1,2 +1,2 @@
-__all__ = ['parsehelp', 'common', 'translationunitcache', 'clang']
+__all__ = ['parsehelp', 'common', 'translationunitcache', 'clang', 'unsavedfiles', 'symbolindex', 'fileinventory', 'candidatescan', 'searchresults', 'companions', 'filewatcher', 'cacheworker', 'remotecache', 'cacheserver', 'diagnostics', 'plistreader', 'analyzercache']
 
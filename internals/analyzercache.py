@@ -0,0 +1,169 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+from .common import get_cache_dir, get_mtimes
+
+ANALYZER_CACHE_VERSION = 1
+
+
+def parse_dependencies(data):
+    """
+    Returns the prerequisites listed in a make rule, as written by
+    clang -MD -MF.
+    """
+    data = data.replace("\\\r\n", " ").replace("\\\n", " ")
+    colon = re.search(r":(\s|$)", data)
+    if colon == None:
+        return []
+    # Spaces in names are escaped with a backslash
+    deps = re.findall(r"(?:\\ |[^\s])+", data[colon.end():])
+    return [d.replace("\\ ", " ") for d in deps]
+
+
+def get_key(filename, cmdline):
+    """
+    Returns the hash of the contents of filename and the command line it's
+    analyzed with, or None if the file can't be read.
+    """
+    try:
+        f = open(filename, "rb")
+        try:
+            contents = f.read()
+        finally:
+            f.close()
+    except IOError:
+        return None
+    h = hashlib.sha1(contents)
+    h.update(json.dumps(cmdline).encode("utf-8"))
+    return h.hexdigest()
+
+
+class AnalyzerResultCache(object):
+    """
+    Remembers the static analyzer results per file, persisted in the
+    cache dir. A result is used for as long as the contents of the file,
+    the command line it was analyzed with and the mtimes of the files it
+    includes are the same.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = None
+        self.dirty = False
+
+    def get_filename(self):
+        return os.path.join(get_cache_dir(), "analyzer.json")
+
+    def load(self):
+        self.entries = {}
+        try:
+            f = open(self.get_filename())
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except:
+            return
+        if data.get("version") != ANALYZER_CACHE_VERSION:
+            return
+        self.entries = data["entries"]
+
+    def get_entries(self):
+        if self.entries == None:
+            self.load()
+        return self.entries
+
+    def lookup(self, filename, key):
+        """
+        Returns the (diagnostics, files) analyzed for filename with the
+        given key, or None if they're out of date or weren't analyzed.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.get_entries().get(filename)
+            if entry == None or key == None or entry["key"] != key:
+                return None
+            if get_mtimes(entry["mtimes"].keys()) != entry["mtimes"]:
+                del self.entries[filename]
+                self.dirty = True
+                return None
+            return entry["diagnostics"], entry["files"]
+        finally:
+            self.lock.release()
+
+    def store(self, filename, key, includes, diagnostics, files):
+        if key == None:
+            return
+        # The file itself is covered by the key
+        includes = [i for i in includes if i != filename]
+        self.lock.acquire()
+        try:
+            self.get_entries()[filename] = {"key": key, "mtimes": get_mtimes(includes),
+                                            "diagnostics": diagnostics, "files": files}
+            self.dirty = True
+        finally:
+            self.lock.release()
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            if not self.dirty:
+                return
+            self.dirty = False
+            entries = dict([(k, e) for k, e in self.entries.items() if os.path.exists(k)])
+            data = json.dumps({"version": ANALYZER_CACHE_VERSION, "entries": entries})
+            tmp = "%s.tmp" % self.get_filename()
+            f = open(tmp, "w")
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            if os.path.exists(self.get_filename()):
+                os.remove(self.get_filename())
+            os.rename(tmp, self.get_filename())
+        except:
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries = {}
+            self.dirty = False
+            if os.path.exists(self.get_filename()):
+                os.remove(self.get_filename())
+        except OSError:
+            pass
+        finally:
+            self.lock.release()
+
+
+analyzerCache = AnalyzerResultCache()
@@ -0,0 +1,255 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+import optparse
+import os
+import socket
+import sys
+
+from .common import get_cache_dir, get_setting, LockedVariable
+from .cacheworker import CacheService, decline_user_selection, handle_request, serve
+from . import translationunitcache
+
+SEVERITIES = ["ignored", "note", "warning", "error", "fatal"]
+
+
+class RpcError(Exception):
+    INVALID_REQUEST  = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS   = -32602
+    INTERNAL_ERROR   = -32603
+
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+
+
+def get_offset(contents, line, column):
+    """Returns the character offset of the 1-based line and column."""
+    offset = 0
+    for i in range(line - 1):
+        offset = contents.find("\n", offset)
+        if offset == -1:
+            raise RpcError(RpcError.INVALID_PARAMS, "line %d is past the end of the file" % line)
+        offset += 1
+    return offset + column - 1
+
+
+def format_diagnostics(diagnostics):
+    if diagnostics == None:
+        return None
+    return [{"file": f, "line": line, "column": column, "severity": SEVERITIES[severity],
+             "message": spelling, "option": option}
+            for f, line, column, severity, spelling, option in diagnostics]
+
+
+class CacheServer(object):
+    """
+    Shares one translation unit cache between every client connected to
+    it, speaking JSON-RPC 2.0 with one request per line. A client opens a
+    file with the options to parse it with, and sends the contents of the
+    file with change while it differs from what's on disk. The contents
+    last sent for a file are used for all clients.
+
+    Requests that are JSON lists instead are handled as in a worker
+    process, so the editor can use a running server as its worker with
+    the "worker_socket" setting.
+    """
+    def __init__(self, service, default_opts=[]):
+        self.service = service
+        self.default_opts = default_opts
+        self.files = LockedVariable({})
+
+    def get_file(self, filename):
+        files = self.files.lock()
+        try:
+            if filename not in files:
+                raise RpcError(RpcError.INVALID_PARAMS, "%s isn't open" % filename)
+            return dict(files[filename])
+        finally:
+            self.files.unlock()
+
+    def get_contents(self, filename, state):
+        if state["contents"] != None:
+            return state["contents"]
+        f = open(filename)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def get_unsaved_files(self, filename, state):
+        if state["contents"] == None:
+            return []
+        return [(filename, state["contents"])]
+
+    def rpc_open(self, file, options=None, options_script=None, contents=None):
+        if options == None:
+            options = list(self.default_opts)
+        files = self.files.lock()
+        try:
+            files[file] = {"opts": options, "opts_script": options_script, "contents": contents}
+        finally:
+            self.files.unlock()
+        if contents != None:
+            return self.rpc_change(file, contents)
+        tu = self.service.parse(file, options, options_script)
+        if tu == None:
+            return None
+        return format_diagnostics(tu["diagnostics"])
+
+    def rpc_change(self, file, contents=None):
+        files = self.files.lock()
+        try:
+            if file not in files:
+                raise RpcError(RpcError.INVALID_PARAMS, "%s isn't open" % file)
+            files[file]["contents"] = contents
+            state = dict(files[file])
+        finally:
+            self.files.unlock()
+        tu = self.service.reparse(file, state["opts"], state["opts_script"],
+                                  self.get_unsaved_files(file, state))
+        if tu == None:
+            return None
+        return format_diagnostics(tu["diagnostics"])
+
+    def rpc_close(self, file):
+        files = self.files.lock()
+        try:
+            if file in files:
+                del files[file]
+        finally:
+            self.files.unlock()
+        return self.service.remove(file)
+
+    def rpc_complete(self, file, line, column, prefix="", member=False):
+        """
+        Completes prefix, typed at the 1-based line and column. member
+        tells whether it's a member being completed.
+        """
+        state = self.get_file(file)
+        contents = self.get_contents(file, state)
+        offset = get_offset(contents, line, column)
+        ret = self.service.complete(file, state["opts"], state["opts_script"],
+                                    contents[:offset + len(prefix)], prefix)
+        if ret == None:
+            ret = self.service.clangcomplete(file, state["opts"], state["opts_script"], line, column,
+                                             self.get_unsaved_files(file, state), member)
+        return ret
+
+    def rpc_definition(self, file, line, column, folders=[]):
+        state = self.get_file(file)
+        contents = self.get_contents(file, state)
+        return self.service.goto("definition", file, state["opts"], state["opts_script"],
+                                 contents, get_offset(contents, line, column), folders)
+
+    def rpc_diagnostics(self, file):
+        return format_diagnostics(self.service.diagnostics(file))
+
+    def handle(self, request):
+        if isinstance(request, list):
+            return handle_request(self.service, request)
+        if not isinstance(request, dict):
+            return {"jsonrpc": "2.0", "id": None,
+                    "error": {"code": RpcError.INVALID_REQUEST, "message": "Invalid request"}}
+        id = request.get("id")
+        response = {"jsonrpc": "2.0", "id": id}
+        try:
+            method = getattr(self, "rpc_%s" % request.get("method"), None)
+            if method == None:
+                raise RpcError(RpcError.METHOD_NOT_FOUND, "No such method: %s" % request.get("method"))
+            params = request.get("params", {})
+            try:
+                if isinstance(params, dict):
+                    response["result"] = method(**params)
+                else:
+                    response["result"] = method(*params)
+            except TypeError as e:
+                raise RpcError(RpcError.INVALID_PARAMS, str(e))
+        except RpcError as e:
+            response["error"] = {"code": e.code, "message": str(e)}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            response["error"] = {"code": RpcError.INTERNAL_ERROR, "message": str(e)}
+        if id == None:
+            # A notification
+            return None
+        return response
+
+
+class ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        if sys.version[0] == '2':
+            infile = self.request.makefile("r")
+            outfile = self.request.makefile("w")
+        else:
+            infile = self.request.makefile("r", encoding="utf-8")
+            outfile = self.request.makefile("w", encoding="utf-8")
+        try:
+            serve(self.server.cacheserver.handle, infile, outfile,
+                  get_setting("worker_threadcount", -1))
+        finally:
+            infile.close()
+            outfile.close()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def get_default_socket():
+    return os.path.join(get_cache_dir(), "server.sock")
+
+
+def main(args):
+    parser = optparse.OptionParser(usage="%prog [--socket PATH] [-- default clang options]")
+    parser.add_option("-s", "--socket", default=get_default_socket(),
+                      help="the unix socket to listen on [default: %default]")
+    options, default_opts = parser.parse_args(args)
+    if os.path.exists(options.socket):
+        # A server that's still running would answer
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(options.socket)
+            s.close()
+            parser.error("a server is already listening on %s" % options.socket)
+        except socket.error:
+            os.remove(options.socket)
+
+    translationunitcache.display_user_selection = decline_user_selection
+    server = UnixServer(options.socket, ConnectionHandler)
+    server.cacheserver = CacheServer(CacheService(), default_opts)
+    print("Listening on %s" % options.socket)
+    try:
+        server.serve_forever()
+    finally:
+        os.remove(options.socket)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
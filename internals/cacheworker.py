@@ -0,0 +1,312 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import json
+import os
+import sys
+import threading
+
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
+from .common import sencode, bdecode, get_cpu_count, get_setting
+from . import translationunitcache
+
+
+def get_rss():
+    """Returns the resident set size of this process in kB."""
+    try:
+        f = open("/proc/self/statm")
+        try:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            rss //= 1024
+        return rss
+    except ImportError:
+        return 0
+
+
+def format_diagnostic(diag):
+    f = diag.location
+    filename = ""
+    if f.file != None:
+        filename = f.file.name
+    option = ""
+    try:
+        option = diag.disable_option or ""
+        if isinstance(option, bytes):
+            option = bdecode(option)
+    except AttributeError:
+        pass
+    return [filename, f.line, f.column, diag.severity, diag.spelling, option]
+
+
+def make_unsaved_files(unsaved_files):
+    return [(name, contents) for name, contents in unsaved_files]
+
+
+def encode_strings(value):
+    """
+    JSON decodes to unicode strings while ctypes wants utf-8 encoded ones
+    with Python 2.
+    """
+    if isinstance(value, list):
+        return [encode_strings(v) for v in value]
+    elif isinstance(value, dict):
+        return dict([(encode_strings(k), encode_strings(v)) for k, v in value.items()])
+    elif sys.version[0] == '2' and isinstance(value, unicode):
+        return sencode(value)
+    return value
+
+
+class CacheService(object):
+    """
+    The operations of the translation unit cache on plain data only, so
+    that the cache can be hosted outside of the editor. Every call that
+    needs a translation unit includes the options to parse it with, in
+    case it isn't in the cache (anymore). Parsing and reparsing return the
+    diagnostics and includes of the translation unit, so that a client
+    doesn't need to ask for them separately.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache or translationunitcache.tuCache
+
+    def get_tu(self, filename, opts, opts_script, parse_options=None, unsaved_files=[]):
+        return self.cache.get_translation_unit(filename, opts, opts_script, make_unsaved_files(unsaved_files),
+                                               parse_options)
+
+    def get_cached(self, filename):
+        tus = self.cache.translationUnits.lock()
+        try:
+            return tus.get(filename)
+        finally:
+            self.cache.translationUnits.unlock()
+
+    def describe(self, tu):
+        if tu == None:
+            return None
+        tu.lock()
+        try:
+            return {
+                "diagnostics": [format_diagnostic(d) for d in tu.get_diagnostics()],
+                "includes": list(tu.includes)
+            }
+        finally:
+            tu.unlock()
+
+    def parse(self, filename, opts, opts_script, parse_options=None):
+        return self.describe(self.get_tu(filename, opts, opts_script, parse_options))
+
+    def reparse(self, filename, opts, opts_script, unsaved_files, parse_options=None):
+        if self.get_cached(filename) == None:
+            return self.describe(self.get_tu(filename, opts, opts_script, parse_options, unsaved_files))
+        pl = self.cache.parsingList.lock()
+        try:
+            queued = filename not in pl
+            if queued:
+                pl.append(filename)
+        finally:
+            self.cache.parsingList.unlock()
+        if queued:
+            done = threading.Event()
+            self.cache.tasks.put((
+                self.cache.task_reparse,
+                (filename, opts, opts_script, make_unsaved_files(unsaved_files), done.set)))
+            done.wait()
+        return self.describe(self.get_cached(filename))
+
+    def complete(self, filename, opts, opts_script, data, prefix):
+        tu = self.get_tu(filename, opts, opts_script)
+        if tu == None:
+            return None
+        tu.lock()
+        try:
+            return tu.cache.complete(data, prefix)
+        finally:
+            tu.unlock()
+
+    def clangcomplete(self, filename, opts, opts_script, row, col, unsaved_files, membercomp):
+        tu = self.get_tu(filename, opts, opts_script)
+        if tu == None:
+            return None
+        tu.lock()
+        try:
+            return tu.cache.clangcomplete(filename, row, col, make_unsaved_files(unsaved_files), membercomp)
+        finally:
+            tu.unlock()
+
+    def locate(self, kind, filename, opts, opts_script, data, offset):
+        tu = self.get_tu(filename, opts, opts_script)
+        if tu == None:
+            return None
+        return tu.locate(kind, data, offset)
+
+    def companion(self, source, location, opts, opts_script):
+        return translationunitcache.find_in_companion(source, location, opts, opts_script)
+
+    def goto(self, kind, filename, opts, opts_script, data, offset, folders):
+        """
+        Does the whole goto here for clients that don't have a symbol index
+        of their own. Nobody could be asked about an extensive search, so
+        there isn't one.
+        """
+        plan = self.locate(kind, filename, opts, opts_script, data, offset)
+        if plan == None:
+            return None
+        plan.pop("search", None)
+        result = []
+        translationunitcache.finish_goto(
+            plan, filename, result.append, folders, opts, opts_script,
+            lambda source, location: self.companion(source, location, opts, opts_script))
+        return result[0]
+
+    def diagnostics(self, filename):
+        tu = self.describe(self.get_cached(filename))
+        if tu == None:
+            return None
+        return tu["diagnostics"]
+
+    def status(self, filename):
+        return self.cache.get_status(filename)
+
+    def includes(self, filename):
+        includes = self.cache.get_includes(filename)
+        if includes == None:
+            return None
+        return list(includes)
+
+    def dependents(self, filename):
+        return self.cache.get_dependents(filename)
+
+    def remove(self, filename):
+        self.cache.remove(filename)
+        return True
+
+    def clear(self):
+        self.cache.clear()
+        return True
+
+    def memory(self):
+        return get_rss()
+
+
+def decline_user_selection(options, callback):
+    """Nobody can answer a prompt in a worker process, so it's declined."""
+    callback(-1)
+
+
+def handle_request(service, request):
+    """
+    Handles one [id, method, params] request, returning the
+    [id, error, result, rss] response.
+    """
+    id, method, params = request
+    error = None
+    result = None
+    try:
+        result = getattr(service, method)(*params)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        error = str(e)
+    return [id, error, result, get_rss()]
+
+
+def serve(handle, infile, outfile, threadcount=-1):
+    """
+    Serves the JSON requests read from infile, one per line, with
+    threadcount threads, or one per cpu if it's less than 1. The JSON
+    encoded return values of handle(request) are written to outfile, one
+    per line in the order they finish. A None return value isn't answered.
+    Returns once infile ends and every request read has been answered.
+    """
+    if threadcount < 1:
+        threadcount = get_cpu_count()
+    lock = threading.Lock()
+    requests = Queue.Queue()
+
+    def run():
+        while True:
+            request = requests.get()
+            if request == None:
+                break
+            try:
+                response = handle(request)
+            except:
+                import traceback
+                traceback.print_exc()
+                continue
+            if response == None:
+                continue
+            lock.acquire()
+            try:
+                outfile.write(json.dumps(response) + "\n")
+                outfile.flush()
+            except (IOError, OSError, ValueError):
+                # The other end went away
+                pass
+            finally:
+                lock.release()
+
+    threads = []
+    for i in range(threadcount):
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    while True:
+        line = infile.readline()
+        if not line:
+            break
+        try:
+            request = encode_strings(json.loads(line))
+        except ValueError:
+            print("Ignoring malformed request: %s" % line.strip())
+            continue
+        requests.put(request)
+    # The threads are done once the requests already read are answered,
+    # which a client that closed its end for writing still waits for
+    for i in range(threadcount):
+        requests.put(None)
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    # Anything printed would end up in the responses
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    translationunitcache.display_user_selection = decline_user_selection
+    service = CacheService()
+    serve(lambda request: handle_request(service, request), sys.stdin, out,
+          get_setting("worker_threadcount", -1))
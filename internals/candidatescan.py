@@ -0,0 +1,218 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import json
+import mmap
+import os
+import re
+import subprocess
+import sys
+import threading
+
+from .common import get_setting, get_cpu_count, bencode
+
+scriptpath = os.path.dirname(os.path.abspath(__file__))
+regex_cache = {}
+
+
+def get_regex(pattern):
+    if pattern not in regex_cache:
+        regex_cache[pattern] = re.compile(bencode(pattern))
+    return regex_cache[pattern]
+
+
+def scan_file(args):
+    """
+    Scans a file for matches of pattern. The file is memory mapped and
+    skipped as soon as possible if it doesn't contain the literal at all.
+    Returns the filename and a list of (match, line, column) tuples.
+
+    This is a module level function so that it can be run in a process pool.
+    """
+    name, literal, pattern = args
+    ret = []
+    try:
+        f = open(name, "rb")
+    except IOError:
+        return name, ret
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            return name, ret
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data.find(literal) == -1:
+                return name, ret
+            # The matches are in order, so newlines are only counted since
+            # the previous one
+            last_loc = 0
+            line = 1
+            for match in get_regex(pattern).finditer(data):
+                loc = match.start()
+                for i in range(len(match.groups())+1):
+                    m = match.group(i)
+                    if m != None and literal in m:
+                        loc = match.start(i)
+                line += data[last_loc:loc].count(b"\n")
+                last_loc = loc
+                column = loc - data.rfind(b"\n", 0, loc)
+                ret.append((match.group(0).decode("utf-8", "replace"), line, column))
+        finally:
+            data.close()
+    except (IOError, OSError, ValueError):
+        pass
+    finally:
+        f.close()
+    return name, ret
+
+
+def can_use_processes():
+    # Inside the editor sys.executable is the editor itself, so
+    # multiprocessing can't start worker processes with it.
+    exe = os.path.basename(sys.executable or "").lower()
+    return os.name == "posix" and exe.startswith("python")
+
+
+class ScanProcesses(object):
+    """
+    Scan processes started with the worker_python setting, for when
+    multiprocessing can't be used. Each process is handed a slice of every
+    batch as a line of json and answers with a line of results.
+    """
+    def __init__(self, count):
+        self.lock = threading.Lock()
+        self.processes = [None] * count
+
+    def get_process(self, i):
+        process = self.processes[i]
+        if process == None or process.poll() != None:
+            process = subprocess.Popen(
+                [get_setting("worker_python", "python"), "-m", "internals.candidatescan"],
+                cwd=os.path.dirname(scriptpath),
+                universal_newlines=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.processes[i] = process
+        return process
+
+    def scan(self, files, literal, pattern):
+        """Returns the (filename, matches) results of the files, in order."""
+        size = (len(files) + len(self.processes) - 1) // len(self.processes)
+        slices = [files[i:i+size] for i in range(0, len(files), size)]
+        ret = []
+        self.lock.acquire()
+        try:
+            sent = []
+            for i, names in enumerate(slices):
+                try:
+                    process = self.get_process(i)
+                    process.stdin.write(json.dumps([names, literal, pattern]) + "\n")
+                    process.stdin.flush()
+                    sent.append(process)
+                except (IOError, OSError, ValueError):
+                    sent.append(None)
+            for names, process in zip(slices, sent):
+                line = None
+                if process != None:
+                    try:
+                        line = process.stdout.readline()
+                    except (IOError, OSError, ValueError):
+                        pass
+                if not line:
+                    # The process couldn't be started or died, it's
+                    # restarted for the next batch
+                    encoded = bencode(literal)
+                    ret.extend([scan_file((name, encoded, pattern)) for name in names])
+                    continue
+                for name, matches in json.loads(line):
+                    ret.append((name, [tuple(m) for m in matches]))
+        finally:
+            self.lock.release()
+        return ret
+
+
+class CandidateScanner(object):
+    """
+    Runs scan_file over a list of files in a process pool when possible,
+    and in a thread pool otherwise.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def get_pool(self):
+        self.lock.acquire()
+        try:
+            if self.pool == None:
+                try:
+                    if not get_setting("search_use_processes", True):
+                        from multiprocessing.pool import ThreadPool
+                        self.pool = ThreadPool(get_cpu_count())
+                    elif can_use_processes():
+                        import multiprocessing
+                        self.pool = multiprocessing.Pool(get_cpu_count())
+                    else:
+                        self.pool = ScanProcesses(get_cpu_count())
+                except:
+                    import traceback
+                    traceback.print_exc()
+                    self.pool = False
+            return self.pool
+        finally:
+            self.lock.release()
+
+    def scan(self, files, literal, pattern, stopped=None):
+        """
+        Yields the (filename, matches) results of the files, in the same
+        order as the files were given. The files are handed to the pool in
+        batches, so once stopped() returns True the pool is free for other
+        scans as soon as the current batch is done.
+        """
+        encoded = bencode(literal)
+        pool = self.get_pool()
+        batch = get_cpu_count() * 16
+        for i in range(0, len(files), batch):
+            if stopped != None and stopped():
+                return
+            args = [(name, encoded, pattern) for name in files[i:i+batch]]
+            if not pool:
+                results = (scan_file(a) for a in args)
+            elif isinstance(pool, ScanProcesses):
+                results = pool.scan(files[i:i+batch], literal, pattern)
+            else:
+                results = pool.imap(scan_file, args, 4)
+            for result in results:
+                yield result
+
+
+candidateScanner = CandidateScanner()
+
+
+if __name__ == "__main__":
+    # Started by ScanProcesses, scans the files of each line of input
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        names, literal, pattern = json.loads(line)
+        literal = literal.encode("utf-8")
+        results = [scan_file((name, literal, pattern)) for name in names]
+        sys.stdout.write(json.dumps(results) + "\n")
+        sys.stdout.flush()
@@ -1079,8 +1079,21 @@ class Cursor(Structure):
             self._translation_unit = TranslationUnit(Cursor_getTranslationUnit(self), False)
         return self._translation_unit
 
-    def get_children(self):
-        """Return an iterator for accessing the children of this cursor."""
+    def get_children(self, kind=None):
+        """
+        Return a list of the children of this cursor, only those of the
+        given kind if one is given.
+        """
+        if Cursor_getChildren != None:
+            # Filled in natively, which saves a Python callback per child
+            kind_id = -1 if kind == None else kind.value
+            size = 64
+            while True:
+                children = (Cursor * size)()
+                count = Cursor_getChildren(self, kind_id, children, size)
+                if count <= size:
+                    return children[:count]
+                size = count
 
         # FIXME: Expose iteration from CIndex, PR6125.
         def visitor(child, parent, children):
@@ -1103,6 +1116,8 @@ class Cursor(Structure):
             return 1 # continue
         children = []
         Cursor_visit(self, Cursor_visit_callback(visitor), children)
+        if kind != None:
+            children = [c for c in children if c.kind == kind]
         return children
 
     def get_returned_pointer_level(self, curr=0):
@@ -1332,11 +1347,10 @@ class Cursor(Structure):
                         return child
 
         # Not found in this class, try base class
-        for child in self.get_children():
-            if child.kind == CursorKind.CXX_BASE_SPECIFIER:
-                ret = child.get_reference().get_member(membername, function)
-                if ret:
-                    return ret
+        for child in self.get_children(CursorKind.CXX_BASE_SPECIFIER):
+            ret = child.get_reference().get_member(membername, function)
+            if ret:
+                return ret
         return None
 
     @staticmethod
@@ -1765,6 +1779,25 @@ def makeString(value):
         raise(TypeError,'Unexpected unsaved file contents.')
     return value
 
+def make_unsaved_files_array(unsaved_files):
+    """
+    Convert a list of (filename, contents) pairs into the _CXUnsavedFile
+    array libclang expects. An already built _CXUnsavedFile array is
+    passed through as is, so callers that keep their buffers encoded
+    don't pay for another copy on every call.
+    """
+    if isinstance(unsaved_files, Array):
+        return unsaved_files if len(unsaved_files) else 0
+    unsaved_files_array = 0
+    if len(unsaved_files):
+        unsaved_files_array = (_CXUnsavedFile * len(unsaved_files))()
+        for i,(name,value) in enumerate(unsaved_files):
+            value = bencode(makeString(value))
+            unsaved_files_array[i].name = bencode(name)
+            unsaved_files_array[i].contents = value
+            unsaved_files_array[i].length = len(value)
+    return unsaved_files_array
+
 class Index(ClangObject):
     """
     The Index type provides the primary interface to the Clang CIndex library,
@@ -1804,14 +1837,7 @@ class Index(ClangObject):
         if len(args):
             args = [bencode(a) for a in args]
             arg_array = (c_char_p * len(args))(*args)
-        unsaved_files_array = 0
-        if len(unsaved_files):
-            unsaved_files_array = (_CXUnsavedFile * len(unsaved_files))()
-            for i,(name,value) in enumerate(unsaved_files):
-                value = bencode(makeString(value))
-                unsaved_files_array[i].name = bencode(name)
-                unsaved_files_array[i].contents = value
-                unsaved_files_array[i].length = len(value)
+        unsaved_files_array = make_unsaved_files_array(unsaved_files)
         ptr = TranslationUnit_parse(self, path, arg_array, len(args),
                                     unsaved_files_array, len(unsaved_files),
                                     options)
@@ -1891,17 +1917,19 @@ class TranslationUnit(ClangObject):
         and the second should be the contents to be substituted for the
         file. The contents may be passed as strings or file objects.
         """
-        unsaved_files_array = 0
-        if len(unsaved_files):
-            unsaved_files_array = (_CXUnsavedFile * len(unsaved_files))()
-            for i,(name,value) in enumerate(unsaved_files):
-                value = bencode(makeString(value))
-                unsaved_files_array[i].name = bencode(name)
-                unsaved_files_array[i].contents = value
-                unsaved_files_array[i].length = len(value)
+        unsaved_files_array = make_unsaved_files_array(unsaved_files)
         ptr = TranslationUnit_reparse(self, len(unsaved_files),
                                       unsaved_files_array,
                                       options)
+
+    def save(self, filename):
+        """
+        Saves the translation unit to filename. A header parsed with the
+        CXTranslationUnit_Incomplete option is saved as a precompiled header
+        that can be used with -include-pch. Returns True on success.
+        """
+        return TranslationUnit_save(self, bencode(filename), 0) == 0
+
     def codeComplete(self, path, line, column, unsaved_files = [], options = 0):
         """
         Code complete in this translation unit.
@@ -2198,6 +2226,10 @@ if isWin64:
     Cursor_visit_callback = CFUNCTYPE(c_int, POINTER(Cursor), POINTER(Cursor), py_object)
     Cursor_visit.argtypes = [POINTER(Cursor), Cursor_visit_callback, py_object]
 
+# Set by translationunitcache to the libcache function filling an array
+# with the children of a cursor, when libcache has it
+Cursor_getChildren = None
+
 Cursor_getOverridden = lib.clang_getOverriddenCursors
 Cursor_getOverridden.argtypes = [Cursor, POINTER(POINTER(Cursor)), POINTER(c_int)]
 if isWin64:
@@ -2282,6 +2314,10 @@ TranslationUnit_reparse = lib.clang_reparseTranslationUnit
 TranslationUnit_reparse.argtypes = [TranslationUnit, c_int, c_void_p, c_int]
 TranslationUnit_reparse.restype = c_int
 
+TranslationUnit_save = lib.clang_saveTranslationUnit
+TranslationUnit_save.argtypes = [TranslationUnit, c_char_p, c_uint]
+TranslationUnit_save.restype = c_int
+
 TranslationUnit_codeComplete = lib.clang_codeCompleteAt
 TranslationUnit_codeComplete.argtypes = [TranslationUnit, c_char_p, c_int,
                                          c_int, c_void_p, c_int, c_int]
@@ -31,6 +31,8 @@ import os
 import re
 import sys
 import glob
+import shlex
+import subprocess
 
 if sys.version[0] == '2':
     def sencode(s):
@@ -174,6 +176,13 @@ try:
     def display_user_selection(options, callback):
         sublime.active_window().show_quick_panel(options, callback)
 
+    def refresh_user_selection(options, callback):
+        # Re-shows the selection with the options found so far
+        sublime.active_window().show_quick_panel(options, callback)
+
+    def hide_user_selection():
+        sublime.active_window().run_command("hide_overlay")
+
     def look_for_file(filename, current_dir, levels_up):
         """Look for file up to #levels_up dir levels, starting from #current_dir."""
         while current_dir != os.path.dirname(current_dir):
@@ -185,8 +194,21 @@ try:
             current_dir = os.path.dirname(current_dir)
         return None
 
+    def get_cache_dir():
+        if hasattr(sublime, "cache_path"):
+            path = os.path.join(sublime.cache_path(), "SublimeClang")
+        else:
+            path = os.path.join(sublime.packages_path(), "User", "SublimeClang.cache")
+        if not os.path.exists(path):
+            os.makedirs(path)
+        return path
+
 except:
-    # Just used for unittesting
+    # Just used for unittesting and when running outside of the editor.
+    # Settings can be handed down in the environment as a JSON object.
+    import json
+    settings = json.loads(os.environ.get("SUBLIMECLANG_SETTINGS", "{}"))
+
     def are_we_there_yet(f):
         f()
 
@@ -194,7 +216,7 @@ except:
         raise Exception(msg)
 
     def get_setting(key, default=None, view=None):
-        return default
+        return settings.get(key, default)
 
     def get_language(view):
         return "c++"
@@ -211,9 +233,21 @@ except:
     def display_user_selection(options, callback):
         callback(0)
 
+    def refresh_user_selection(options, callback):
+        pass
+
+    def hide_user_selection():
+        pass
+
     def look_for_file(filename, current_dir, levels_up):
         return None
 
+    def get_cache_dir():
+        path = os.path.join(os.path.expanduser("~"), ".sublimeclang")
+        if not os.path.exists(path):
+            os.makedirs(path)
+        return path
+
 
 class LockedVariable:
     def __init__(self, var):
@@ -293,6 +327,25 @@ def complete_path(value):
         return [value]
 
 
+def get_compile_args(filename, opts, opts_script):
+    opts2 = []
+    for option in opts:
+        opts2.extend(complete_path(option))
+    opts = opts2
+
+    if opts_script:
+        # shlex.split barfs if fed with an unicode strings
+        args = shlex.split(sencode(opts_script)) + [filename]
+        process = subprocess.Popen(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        output = process.communicate()
+        if process.returncode:
+            print("The options_script failed with code [%s]" % process.returncode)
+            print(output[1])
+        else:
+            opts += shlex.split(bdecode(output[0]))
+    return opts
+
+
 def get_path_setting(key, default=None, view=None):
     value = get_setting(key, default, view)
     opts = []
@@ -304,6 +357,45 @@ def get_path_setting(key, default=None, view=None):
     return opts
 
 
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def get_extension(filename):
+    idx = filename.rfind(".")
+    if idx == -1:
+        return ""
+    return filename[idx+1:]
+
+
+LANGUAGES = ["c", "c++", "objc", "objc++"]
+# Like gcc, .C and .M are C++ and Objective-C++, other extensions are
+# looked up in lower case too
+EXTENSION_LANGUAGES = {"c": "c", "C": "c++", "m": "objc", "M": "objc++", "mm": "objc++"}
+
+
+def get_file_language(filename):
+    """
+    Returns the language of a file that isn't open, going by its
+    extension. Unlike get_language it doesn't need a view.
+    """
+    extension = get_extension(filename)
+    language = EXTENSION_LANGUAGES.get(extension)
+    if language == None:
+        language = EXTENSION_LANGUAGES.get(extension.lower(), "c++")
+    return language
+
+
+def get_mtimes(files):
+    mtimes = {}
+    for filename in files:
+        try:
+            mtimes[filename] = os.path.getmtime(filename)
+        except OSError:
+            mtimes[filename] = None
+    return mtimes
+
+
 def get_cpu_count():
     cpus = 1
     try:
@@ -312,3 +404,29 @@ def get_cpu_count():
     except:
         pass
     return cpus
+
+
+def get_free_memory():
+    """
+    Returns how many kB of memory are available for new processes, or None
+    if it isn't known.
+    """
+    try:
+        f = open("/proc/meminfo")
+        try:
+            meminfo = f.read()
+        finally:
+            f.close()
+    except IOError:
+        return None
+    match = re.search(r"^MemAvailable:\s+(\d+)", meminfo, re.MULTILINE)
+    if match == None:
+        # Older kernels
+        free = 0
+        for key in ("MemFree", "Buffers", "Cached"):
+            match = re.search(r"^%s:\s+(\d+)" % key, meminfo, re.MULTILINE)
+            if match == None:
+                return None
+            free += int(match.group(1))
+        return free
+    return int(match.group(1))
@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import os
+import threading
+
+from .common import normalize_path
+from .fileinventory import fileInventory, get_extension
+
+HEADER_EXTENSIONS = ["h", "hh", "hpp", "hxx"]
+SOURCE_EXTENSIONS = ["cpp", "c", "cc", "cxx", "m", "mm"]
+
+
+def is_header(filename):
+    return get_extension(filename).lower() in HEADER_EXTENSIONS
+
+
+def get_stem(filename):
+    name = os.path.basename(filename)
+    idx = name.rfind(".")
+    if idx != -1:
+        name = name[:idx]
+    return name.lower()
+
+
+def get_common_prefix_length(a, b):
+    a = os.path.dirname(normalize_path(a)).split(os.sep)
+    b = os.path.dirname(normalize_path(b)).split(os.sep)
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class CompanionIndex(object):
+    """
+    Maps headers to the source files implementing them. Sources are found
+    by basename among the project files, and by which headers the parsed
+    translation units include directly, so split include/ and src/ layouts
+    work too.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stems = {}
+        self.generations = {}
+        self.includers = {}
+        self.included = {}
+
+    def update_stems(self, folders):
+        # Only rebuilt when the inventory saw files being added or removed
+        key = tuple(folders)
+        generation = fileInventory.get_generation(folders)
+        self.lock.acquire()
+        try:
+            if self.generations.get(key) == generation:
+                return self.stems[key]
+        finally:
+            self.lock.release()
+        files = fileInventory.get_files(folders, SOURCE_EXTENSIONS)
+        stems = {}
+        for filename in files:
+            stems.setdefault(get_stem(filename), []).append(filename)
+        self.lock.acquire()
+        try:
+            self.generations[key] = generation
+            self.stems[key] = stems
+        finally:
+            self.lock.release()
+        return stems
+
+    def set_includes(self, source, includes):
+        """
+        Records the files source includes directly, as reported by its
+        translation unit.
+        """
+        if is_header(source):
+            return
+        includes = set([normalize_path(i) for i in includes])
+        self.lock.acquire()
+        try:
+            for header in self.included.get(source, set()) - includes:
+                includers = self.includers.get(header)
+                if includers != None:
+                    includers.discard(source)
+                    if len(includers) == 0:
+                        del self.includers[header]
+            for header in includes:
+                self.includers.setdefault(header, set()).add(source)
+            self.included[source] = includes
+        finally:
+            self.lock.release()
+
+    def get_sources(self, header, folders):
+        """
+        Returns the source files likely to implement header, best first.
+        Sources with the same basename come first, those that include the
+        header and those closest to it in the tree before the others. Then
+        any other source that includes the header directly.
+        """
+        header_key = normalize_path(header)
+        stem = get_stem(header)
+        candidates = list(self.update_stems(folders or []).get(stem, []))
+        self.lock.acquire()
+        try:
+            includers = set(self.includers.get(header_key, set()))
+        finally:
+            self.lock.release()
+        for source in includers:
+            if get_stem(source) == stem and source not in candidates:
+                candidates.append(source)
+
+        # Files next to the header might not be in any of the project folders
+        base = header[:header.rfind(".")]
+        for ending in SOURCE_EXTENSIONS:
+            f = "%s.%s" % (base, ending)
+            if os.access(f, os.R_OK):
+                if f not in candidates:
+                    candidates.append(f)
+                break
+
+        def score(source):
+            return (source not in includers, -get_common_prefix_length(source, header), source)
+        ret = sorted(candidates, key=score)
+        ret.extend(sorted([s for s in includers if s not in candidates]))
+        return ret
+
+
+companionIndex = CompanionIndex()
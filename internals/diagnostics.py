@@ -0,0 +1,174 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import os
+
+from .common import Worker, LockedVariable
+from .clang import cindex
+
+
+class DiagnosticFile(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class DiagnosticLocation(object):
+    def __init__(self, file, line, column):
+        self.file = file
+        self.line = line
+        self.column = column
+
+
+class DiagnosticData(object):
+    """
+    A diagnostic as plain data, quacking like a cindex.Diagnostic for the
+    parts that are displayed. file is a DiagnosticFile, shared by all the
+    diagnostics in the same file, or None. The fixits are (file, start
+    line, start column, end line, end column, value) tuples.
+    """
+    def __init__(self, file, line, column, severity, spelling, disable_option, fixits=[]):
+        self.location = DiagnosticLocation(file, line, column)
+        self.severity = severity
+        self.spelling = spelling
+        self.disable_option = disable_option
+        self.fixits = fixits
+
+    @property
+    def severityName(self):
+        return cindex.Diagnostic.severityNames[self.severity]
+
+
+def normalize_dir(path):
+    return os.path.abspath(os.path.normpath(os.path.normcase(path)))
+
+
+class DiagnosticsModel(object):
+    """
+    The diagnostics of a translation unit the way they're displayed. The
+    error and warning messages are indexed per file and 0-based line, and
+    the lines of the output panel are kept in order.
+    """
+    def __init__(self):
+        self.errors = {}
+        self.warnings = {}
+        self.panel_lines = []
+        self.text = ""
+        self.error_count = 0
+        self.warning_count = 0
+
+    def get_text(self):
+        return self.text
+
+
+def build_model(diagnostics, ignore_dirs, ignore_regex):
+    """
+    Formats diagnostics, leaving out those in any of ignore_dirs or
+    matching ignore_regex.
+    """
+    model = DiagnosticsModel()
+    ignore_dirs = [normalize_dir(d) for d in ignore_dirs]
+    ignored = {}
+    for diag in diagnostics:
+        f = diag.location
+        filename = ""
+        if f.file != None:
+            filename = f.file.name
+
+        # Most diagnostics come from a handful of files
+        if filename not in ignored:
+            path = normalize_dir(filename)
+            ignored[filename] = len([d for d in ignore_dirs if path.startswith(d)]) > 0
+        if ignored[filename]:
+            continue
+
+        err = "%s:%d,%d - %s - %s" % (filename, f.line, f.column,
+                                      diag.severityName,
+                                      diag.spelling)
+
+        if ignore_regex and ignore_regex.search(err):
+            continue
+
+        try:
+            if len(diag.disable_option) > 0:
+                err = "%s [Disable with %s]" % (err, diag.disable_option)
+        except AttributeError:
+            pass
+        if diag.severity == cindex.Diagnostic.Fatal and \
+                "not found" in diag.spelling:
+            err = "%s\nDid you configure the include path used by clang properly?\n" \
+                  "See http://github.com/quarnster/SublimeClang for more details on "\
+                  "how to configure SublimeClang." % (err)
+        model.panel_lines.append("%s\n" % err)
+        if diag.severity == cindex.Diagnostic.Warning:
+            model.warning_count += 1
+        elif diag.severity >= cindex.Diagnostic.Error:
+            model.error_count += 1
+        if diag.severityName.lower() == "error":
+            marks = model.errors
+        else:
+            marks = model.warnings
+        marks.setdefault(filename, {}).setdefault(f.line - 1, []).append(diag.spelling)
+    model.text = "".join(model.panel_lines)
+    return model
+
+
+class DiagnosticsBuilder(Worker):
+    """
+    Builds the diagnostics models of translation units off the main thread.
+    Only the latest request for a file is built, the ones it superseded are
+    dropped.
+    """
+    def __init__(self):
+        super(DiagnosticsBuilder, self).__init__(1)
+        self.latest = LockedVariable({})
+        self.generation = 0
+
+    def build(self, filename, tu, ignore_dirs, ignore_regex, on_done):
+        """Calls on_done(model) from the builder thread when done."""
+        latest = self.latest.lock()
+        try:
+            self.generation += 1
+            latest[filename] = self.generation
+            data = (filename, self.generation, tu, ignore_dirs, ignore_regex, on_done)
+        finally:
+            self.latest.unlock()
+        self.tasks.put((self.task_build, data))
+
+    def task_build(self, data):
+        filename, generation, tu, ignore_dirs, ignore_regex, on_done = data
+        latest = self.latest.lock()
+        try:
+            if latest.get(filename) != generation:
+                return
+            del latest[filename]
+        finally:
+            self.latest.unlock()
+        tu.lock()
+        try:
+            model = build_model(tu.get_diagnostics(), ignore_dirs, ignore_regex)
+        finally:
+            tu.unlock()
+        on_done(model)
+
+
+diagnosticsBuilder = DiagnosticsBuilder()
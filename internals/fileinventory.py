@@ -0,0 +1,182 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import fnmatch
+import os
+import threading
+import time
+
+from .common import get_setting, normalize_path, get_extension
+
+
+class FolderInventory(object):
+    """
+    The files in one project folder, indexed by extension. A refresh only
+    lists the directories whose mtime changed since the last refresh, the
+    others are just stat:ed.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.dirs = {}
+        self.files = {}
+        self.last_refresh = 0
+        self.excludes = None
+        self.generation = 0
+
+    def is_excluded(self, path, name):
+        rel = os.path.relpath(path, self.folder).replace("\\", "/")
+        for pattern in self.excludes:
+            if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel, pattern):
+                return True
+        return False
+
+    def scan_dir(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        cached = self.dirs.get(path)
+        if cached != None and cached[0] == mtime:
+            return cached
+        files = []
+        subdirs = []
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        for name in names:
+            full_path = os.path.join(path, name)
+            if self.is_excluded(full_path, name):
+                continue
+            if os.path.isdir(full_path):
+                # Like os.walk, symlinked directories aren't followed as
+                # they could loop
+                if not os.path.islink(full_path):
+                    subdirs.append(full_path)
+            else:
+                files.append(full_path)
+        cached = (mtime, files, subdirs)
+        self.dirs[path] = cached
+        return cached
+
+    def refresh(self, excludes):
+        if excludes != self.excludes:
+            # Everything cached was filtered with the old patterns
+            self.excludes = excludes
+            self.dirs = {}
+        seen = {}
+        changed = False
+        stack = [self.folder]
+        while len(stack):
+            path = stack.pop()
+            old = self.dirs.get(path)
+            cached = self.scan_dir(path)
+            if cached == None:
+                continue
+            if cached is not old:
+                changed = True
+            seen[path] = cached
+            stack.extend(cached[2])
+        if changed or len(seen) != len(self.dirs):
+            self.dirs = seen
+            files = {}
+            for mtime, filenames, subdirs in seen.values():
+                for filename in filenames:
+                    files.setdefault(get_extension(filename), []).append(filename)
+            self.files = files
+            self.generation += 1
+        self.last_refresh = time.time()
+
+    def refresh_if_old(self, excludes, max_age):
+        self.lock.acquire()
+        try:
+            if excludes != self.excludes or time.time() - self.last_refresh > max_age:
+                self.refresh(excludes)
+            return self.generation
+        finally:
+            self.lock.release()
+
+    def get_files(self, extensions, excludes, max_age):
+        self.lock.acquire()
+        try:
+            if excludes != self.excludes or time.time() - self.last_refresh > max_age:
+                self.refresh(excludes)
+            if extensions == None:
+                ret = []
+                for files in self.files.values():
+                    ret.extend(files)
+                return ret
+            ret = []
+            for extension in extensions:
+                ret.extend(self.files.get(extension, []))
+            return ret
+        finally:
+            self.lock.release()
+
+
+class FileInventory(object):
+    """
+    Keeps track of the files in all project folders so that searches and
+    project analysis don't have to walk the folders every time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders = {}
+
+    def get_folder(self, folder):
+        key = normalize_path(folder)
+        self.lock.acquire()
+        try:
+            if key not in self.folders:
+                self.folders[key] = FolderInventory(folder)
+            return self.folders[key]
+        finally:
+            self.lock.release()
+
+    def get_files(self, folders, extensions=None, max_age=None):
+        """
+        Returns the files with any of the given extensions (or all files if
+        extensions is None) in the given folders. Folders that haven't been
+        refreshed in max_age seconds are refreshed first.
+        """
+        excludes = get_setting("file_inventory_exclude", [".*"])
+        if max_age == None:
+            max_age = get_setting("file_inventory_max_age", 5)
+        ret = []
+        for folder in folders:
+            ret.extend(self.get_folder(folder).get_files(extensions, excludes, max_age))
+        return ret
+
+    def get_generation(self, folders, max_age=None):
+        """
+        Returns a value that changes whenever a file is added to or removed
+        from the given folders. Folders are refreshed like in get_files.
+        """
+        excludes = get_setting("file_inventory_exclude", [".*"])
+        if max_age == None:
+            max_age = get_setting("file_inventory_max_age", 5)
+        return tuple([self.get_folder(folder).refresh_if_old(excludes, max_age) for folder in folders])
+
+
+fileInventory = FileInventory()
@@ -0,0 +1,202 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import os
+import threading
+import time
+
+from .common import get_setting, normalize_path
+from .fileinventory import fileInventory
+from .companions import HEADER_EXTENSIONS, SOURCE_EXTENSIONS
+from .symbolindex import symbolIndexer
+from .remotecache import get_tu_cache
+from . import translationunitcache
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# The longest time changes are held back while more keep coming in
+MAX_BACKOFF = 30
+
+
+class FileWatcher(object):
+    """
+    Notices files changed outside of the editor, like by a git checkout or
+    a code generator. The files of the watched project folders and the
+    files included by cached translation units are polled for changed
+    mtimes, or watched with inotify when pyinotify is available. Changes
+    are collected until none have come in for a while, and then the
+    affected translation units, search results and index shards are
+    updated in one go with the reparses done a few at a time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders = set()
+        self.mtimes = None
+        self.pending = set()
+        self.notified = set()
+        self.rebaseline = False
+        self.thread = None
+        self.notifier = None
+        self.watch_manager = None
+
+    def watch(self, folders):
+        if get_setting("file_watcher_interval", 2) <= 0:
+            return
+        self.lock.acquire()
+        try:
+            new_folders = [f for f in folders if f not in self.folders]
+            self.folders.update(new_folders)
+            if len(new_folders) > 0:
+                # All the files in the new folders would look new otherwise
+                self.rebaseline = True
+            if self.thread == None:
+                self.thread = threading.Thread(target=self.worker)
+                self.thread.daemon = True
+                self.thread.start()
+        finally:
+            self.lock.release()
+        for folder in new_folders:
+            self.add_inotify_watch(folder)
+
+    def add_inotify_watch(self, folder):
+        if pyinotify == None or not get_setting("file_watcher_use_inotify", True):
+            return
+        try:
+            if self.notifier == None:
+                self.watch_manager = pyinotify.WatchManager()
+                self.notifier = pyinotify.ThreadedNotifier(self.watch_manager, self.on_inotify_event)
+                self.notifier.daemon = True
+                self.notifier.start()
+            mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM | \
+                   pyinotify.IN_CREATE | pyinotify.IN_DELETE
+            self.watch_manager.add_watch(folder, mask, rec=True, auto_add=True)
+        except:
+            import traceback
+            traceback.print_exc()
+
+    def on_inotify_event(self, event):
+        self.lock.acquire()
+        try:
+            self.notified.add(normalize_path(event.pathname))
+        finally:
+            self.lock.release()
+
+    def get_watched_files(self):
+        self.lock.acquire()
+        try:
+            folders = list(self.folders)
+            use_inotify = self.notifier != None
+        finally:
+            self.lock.release()
+        files = set()
+        if not use_inotify:
+            for filename in fileInventory.get_files(folders, HEADER_EXTENSIONS + SOURCE_EXTENSIONS):
+                files.add(normalize_path(filename))
+        tuCache = get_tu_cache()
+        if tuCache != None:
+            # Files outside of the project folders, like system and third
+            # party headers, are only polled while something includes them.
+            includers = tuCache.includers.lock()
+            try:
+                files.update(includers.keys())
+            finally:
+                tuCache.includers.unlock()
+        return files
+
+    def poll(self):
+        """Returns the paths that changed since the last poll."""
+        mtimes = {}
+        for filename in self.get_watched_files():
+            try:
+                mtimes[filename] = os.path.getmtime(filename)
+            except OSError:
+                pass
+        self.lock.acquire()
+        try:
+            if self.rebaseline:
+                self.rebaseline = False
+                self.mtimes = None
+        finally:
+            self.lock.release()
+        changed = set()
+        if self.mtimes != None:
+            for filename, mtime in mtimes.items():
+                if self.mtimes.get(filename) != mtime:
+                    changed.add(filename)
+            for filename in self.mtimes.keys():
+                if filename not in mtimes:
+                    changed.add(filename)
+        self.mtimes = mtimes
+        self.lock.acquire()
+        try:
+            changed |= self.notified
+            self.notified = set()
+        finally:
+            self.lock.release()
+        return changed
+
+    def worker(self):
+        backoff = 0
+        deadline = 0
+        while True:
+            interval = get_setting("file_watcher_interval", 2)
+            time.sleep(max(interval, 0.5))
+            try:
+                changed = self.poll()
+                if len(changed) > 0:
+                    # Still changing, so wait a while longer before acting
+                    self.pending |= changed
+                    backoff = min(max(backoff * 2, interval), MAX_BACKOFF)
+                    deadline = time.time() + backoff
+                elif len(self.pending) > 0 and time.time() >= deadline:
+                    pending = self.pending
+                    self.pending = set()
+                    backoff = 0
+                    self.dispatch(pending)
+            except:
+                import traceback
+                traceback.print_exc()
+
+    def dispatch(self, paths):
+        translationunitcache.searchcache.files_changed(paths)
+        symbolIndexer.files_changed(paths)
+        tuCache = get_tu_cache()
+        if tuCache == None:
+            return
+        dirty = tuCache.files_changed(paths)
+        batch = max(1, get_setting("file_watcher_batch_size", 4))
+        for i in range(0, len(dirty), batch):
+            events = []
+            for filename in dirty[i:i+batch]:
+                event = threading.Event()
+                if tuCache.reparse_dirty(filename, event.set):
+                    events.append(event)
+            for event in events:
+                # Don't hang the watcher if a reparse fails without calling back
+                event.wait(60)
+
+
+fileWatcher = FileWatcher()
@@ -0,0 +1,124 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+
+import base64
+from xml.parsers import expat
+
+
+class PlistReader(object):
+    """
+    Reads a property list while it's being fed, with expat. The items of
+    the arrays in the root dictionary that are listed in stream_keys are
+    handed to on_item(key, item) as soon as they're read rather than kept,
+    and on_value(key, value) is called for every value of the root
+    dictionary once it has been read.
+    """
+    def __init__(self, stream_keys=(), on_item=None, on_value=None):
+        self.stream_keys = stream_keys
+        self.on_item = on_item
+        self.on_value = on_value
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        try:
+            # Keep strings utf-8 encoded like the rest of the plugin
+            self.parser.returns_unicode = False
+        except AttributeError:
+            pass
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        # [container, pending key] of every dict and array being read
+        self.stack = []
+        # The text of the element being read, appended to by expat directly
+        self.text = []
+        self.parser.CharacterDataHandler = self.text.append
+        self.result = None
+
+    def feed(self, data, final=False):
+        self.parser.Parse(data, final)
+
+    def close(self):
+        self.feed(b"", True)
+        return self.result
+
+    def start_element(self, name, attributes):
+        if name == "dict":
+            self.stack.append([{}, None])
+        elif name == "array":
+            self.stack.append([[], None])
+        else:
+            del self.text[:]
+
+    def end_element(self, name):
+        # The most common elements first, this is called for every element
+        if name == "key":
+            self.stack[-1][1] = "".join(self.text)
+            return
+        elif name == "string" or name == "date":
+            value = "".join(self.text)
+        elif name == "integer":
+            value = int("".join(self.text))
+        elif name == "dict" or name == "array":
+            value = self.stack.pop()[0]
+        elif name == "real":
+            value = float("".join(self.text))
+        elif name == "true":
+            value = True
+        elif name == "false":
+            value = False
+        elif name == "data":
+            value = base64.b64decode("".join(self.text))
+        else:
+            return
+        self.add_value(value)
+
+    def add_value(self, value):
+        stack = self.stack
+        if len(stack) == 0:
+            self.result = value
+            return
+        top = stack[-1]
+        key = top[1]
+        if key != None:
+            # Only dicts have keys
+            top[0][key] = value
+            top[1] = None
+            if len(stack) == 1 and self.on_value != None:
+                self.on_value(key, value)
+        elif len(stack) == 2 and stack[0][1] in self.stream_keys:
+            self.on_item(stack[0][1], value)
+        else:
+            top[0].append(value)
+
+
+def parse(data):
+    """
+    Returns the root object of the property list in data, or None if it
+    isn't a complete property list.
+    """
+    reader = PlistReader()
+    try:
+        reader.feed(data, True)
+    except expat.ExpatError:
+        return None
+    return reader.result
@@ -0,0 +1,599 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .common import get_setting, LockedVariable, run_in_main_thread, status_message, \
+                    bdecode, normalize_path
+from .unsavedfiles import unsaved_buffers
+from .diagnostics import DiagnosticFile, DiagnosticData
+from . import translationunitcache
+
+scriptpath = os.path.dirname(os.path.abspath(__file__))
+
+# Settings that matter to the translation unit cache in a worker process
+WORKER_SETTINGS = [
+    "worker_threadcount", "scratch_parse_options", "scratch_parse_threadcount",
+    "shared_pch", "shared_pch_min_files", "shared_pch_min_includes",
+    "search_use_processes", "search_cache_size", "debug_options"
+]
+
+
+def get_unsaved_pairs(unsaved_files):
+    """
+    Returns unsaved files, either (name, contents) pairs or a _CXUnsavedFile
+    array, as a list of decoded (name, contents) pairs.
+    """
+    ret = []
+    for f in unsaved_files:
+        if isinstance(f, tuple) or isinstance(f, list):
+            ret.append((f[0], f[1]))
+        else:
+            ret.append((bdecode(f.name), bdecode(f.contents)))
+    return ret
+
+
+class RemoteTranslationUnitData(object):
+    def __init__(self, diagnostics):
+        files = {}
+        self.diagnostics = []
+        for filename, line, column, severity, spelling, disable_option in diagnostics:
+            f = None
+            if filename:
+                if filename not in files:
+                    files[filename] = DiagnosticFile(filename)
+                f = files[filename]
+            self.diagnostics.append(DiagnosticData(f, line, column, severity, spelling, disable_option))
+
+
+class RemoteCompletionCache(object):
+    def __init__(self, tu):
+        self.tu = tu
+
+    def complete(self, data, prefix):
+        tu = self.tu
+        return tu.worker.call("complete", [tu.fn, tu.opts, tu.opts_script, data, prefix])
+
+    def clangcomplete(self, filename, row, col, unsaved_files, membercomp):
+        tu = self.tu
+        return tu.worker.call("clangcomplete", [tu.fn, tu.opts, tu.opts_script, row, col,
+                                                get_unsaved_pairs(unsaved_files), membercomp])
+
+
+class RemoteTranslationUnit(LockedVariable):
+    """
+    Stands in for a LockedTranslationUnit living in a worker process. The
+    diagnostics and includes are those of the last (re)parse, everything
+    else is asked from the worker.
+    """
+    def __init__(self, worker, fn, opts, opts_script, description):
+        LockedVariable.__init__(self, RemoteTranslationUnitData(description["diagnostics"]))
+        self.worker = worker
+        self.fn = fn
+        self.opts = opts
+        self.opts_script = opts_script
+        self.includes = set(description["includes"])
+        self.cache = RemoteCompletionCache(self)
+        self.dirty = False
+        self.parse_time = time.time()
+        self.generation = translationunitcache.next_generation()
+
+    def release(self):
+        pass
+
+    def get_diagnostics(self):
+        return self.var.diagnostics
+
+    def goto(self, kind, data, offset, found_callback, folders):
+        # The worker only locates what's under the cursor, the project's
+        # symbol index and the user are in the editor
+        def callback(error, plan):
+            run_in_main_thread(lambda: translationunitcache.finish_goto(
+                plan or {}, self.fn, found_callback, folders, self.opts, self.opts_script,
+                self.find_in_companion))
+        self.worker.call_async("locate", [kind, self.fn, self.opts, self.opts_script, data, offset], callback)
+
+    def find_in_companion(self, source, location):
+        return self.worker.call("companion", [source, location, self.opts, self.opts_script])
+
+    def get_definition(self, data, offset, found_callback, folders):
+        self.goto("definition", data, offset, found_callback, folders)
+
+    def get_implementation(self, data, offset, found_callback, folders):
+        self.goto("implementation", data, offset, found_callback, folders)
+
+    def find_references(self, data, offset, found_callback, folders):
+        self.goto("references", data, offset, found_callback, folders)
+
+
+class RemoteWorker(object):
+    """
+    One worker process hosting a translation unit cache, talked to with
+    newline delimited JSON over its stdin and stdout, or a connection to a
+    cache server when "worker_socket" is set. Every request gets an
+    id and the responses, which also carry the worker's resident memory
+    size, may come back in any order. on_exit is called once the process
+    is gone, whether it exited, crashed or was retired.
+    """
+    def __init__(self, on_exit):
+        self.on_exit = on_exit
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_id = 0
+        self.rss = 0
+        self.alive = True
+        self.retiring = False
+        self.files = set()
+
+        self.process = None
+        self.socket = None
+        socket_path = get_setting("worker_socket", "")
+        try:
+            if socket_path:
+                self.connect(socket_path)
+            else:
+                self.spawn()
+        except (IOError, OSError, socket.error) as e:
+            # Calls fail right away until the settings are changed and the
+            # cache is cleared
+            self.alive = False
+            status_message("Couldn't start a SublimeClang worker: %s" % e)
+            return
+        self.thread = threading.Thread(target=self.reader)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def spawn(self):
+        env = dict(os.environ)
+        settings = {}
+        for key in WORKER_SETTINGS:
+            value = get_setting(key, None)
+            if value != None:
+                settings[key] = value
+        env["SUBLIMECLANG_SETTINGS"] = json.dumps(settings)
+        self.process = subprocess.Popen(
+            [get_setting("worker_python", "python"), "-m", "internals.cacheworker"],
+            cwd=os.path.dirname(scriptpath), env=env, universal_newlines=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.input = self.process.stdin
+        self.output = self.process.stdout
+
+    def connect(self, path):
+        """Uses a cache server shared with other editors and tools instead."""
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        if sys.version[0] == '2':
+            self.input = self.socket.makefile("w")
+            self.output = self.socket.makefile("r")
+        else:
+            self.input = self.socket.makefile("w", encoding="utf-8")
+            self.output = self.socket.makefile("r", encoding="utf-8")
+
+    def call_async(self, method, params, callback):
+        """Calls callback(error, result) from another thread when done."""
+        error = None
+        self.lock.acquire()
+        try:
+            if not self.alive:
+                error = "worker process not running"
+            else:
+                self.next_id += 1
+                id = self.next_id
+                self.pending[id] = callback
+                try:
+                    self.input.write(json.dumps([id, method, params]) + "\n")
+                    self.input.flush()
+                except (IOError, OSError, ValueError) as e:
+                    del self.pending[id]
+                    error = str(e)
+        finally:
+            self.lock.release()
+        if error != None:
+            callback(error, None)
+
+    def call(self, method, params, timeout=None):
+        """Returns the result of method, or None if it failed or timed out."""
+        if timeout == None:
+            timeout = get_setting("worker_timeout", 30)
+        done = threading.Event()
+        ret = [None, None]
+
+        def callback(error, result):
+            ret[0] = error
+            ret[1] = result
+            done.set()
+        self.call_async(method, params, callback)
+        done.wait(timeout)
+        if not done.is_set():
+            print("Worker call %s timed out" % method)
+            return None
+        if ret[0] != None:
+            print("Worker call %s failed: %s" % (method, ret[0]))
+        return ret[1]
+
+    def reader(self):
+        try:
+            while True:
+                line = self.output.readline()
+                if not line:
+                    break
+                id, error, result, rss = json.loads(line)
+                self.lock.acquire()
+                try:
+                    self.rss = rss
+                    callback = self.pending.pop(id, None)
+                    retire = self.retiring and len(self.pending) == 0
+                finally:
+                    self.lock.release()
+                if callback != None:
+                    try:
+                        callback(error, result)
+                    except:
+                        import traceback
+                        traceback.print_exc()
+                if retire:
+                    self.stop()
+        except:
+            import traceback
+            traceback.print_exc()
+        self.stop()
+        if self.process != None:
+            try:
+                self.process.wait()
+            except OSError:
+                pass
+        self.lock.acquire()
+        try:
+            self.alive = False
+            pending = self.pending
+            self.pending = {}
+        finally:
+            self.lock.release()
+        for callback in pending.values():
+            callback("worker process exited", None)
+        self.on_exit(self)
+
+    def is_over_limit(self):
+        # A shared server isn't ours to restart
+        return self.socket == None and self.rss > get_setting("worker_memory_limit", 1024) * 1024
+
+    def retire(self):
+        """Stops the worker once the requests it's working on are done."""
+        self.lock.acquire()
+        try:
+            self.retiring = True
+            idle = len(self.pending) == 0
+        finally:
+            self.lock.release()
+        if idle:
+            self.stop()
+
+    def stop(self):
+        try:
+            # The worker exits when its stdin is closed
+            self.input.close()
+            if self.socket != None:
+                self.socket.shutdown(socket.SHUT_RDWR)
+                self.socket.close()
+        except (IOError, OSError, socket.error):
+            pass
+
+
+class RemoteTranslationUnitCache(object):
+    """
+    Hosts the translation units in "worker_processes" worker processes
+    instead of in the editor, so that a libclang crash doesn't take the
+    editor down with it and the memory libclang holds on to is given back
+    when a worker is restarted. A worker is restarted once it uses more
+    than "worker_memory_limit" MB, and its files are parsed again by
+    whichever worker they're assigned to next. A file sticks to the worker
+    it was first assigned to, picked by the fewest files.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workers = []
+        self.translationUnits = LockedVariable({})
+        self.parsingList = LockedVariable([])
+        self.includers = LockedVariable({})
+
+    def get_worker(self, filename):
+        self.lock.acquire()
+        try:
+            count = max(1, get_setting("worker_processes", 0))
+            for worker in self.workers:
+                if filename in worker.files:
+                    return worker
+            if len(self.workers) < count:
+                self.workers.append(RemoteWorker(self.worker_exited))
+            worker = min(self.workers, key=lambda w: len(w.files))
+            worker.files.add(filename)
+            return worker
+        finally:
+            self.lock.release()
+
+    def worker_exited(self, worker):
+        self.lock.acquire()
+        try:
+            if worker in self.workers:
+                self.workers.remove(worker)
+        finally:
+            self.lock.release()
+        if not worker.retiring:
+            status_message("SublimeClang worker process exited unexpectedly")
+        tus = self.translationUnits.lock()
+        try:
+            for filename, tu in list(tus.items()):
+                if tu.worker is worker:
+                    self.update_include_graph(filename, tu.includes, set())
+                    del tus[filename]
+        finally:
+            self.translationUnits.unlock()
+
+    def check_memory(self, worker):
+        if worker.is_over_limit() and not worker.retiring:
+            self.lock.acquire()
+            try:
+                if worker in self.workers:
+                    self.workers.remove(worker)
+            finally:
+                self.lock.release()
+            status_message("Restarting SublimeClang worker using %d MB" % (worker.rss // 1024))
+            worker.retire()
+
+    def get_status(self, filename):
+        tu = self.translationUnits.lock()
+        pl = self.parsingList.lock()
+        a = filename in tu
+        b = filename in pl
+        self.translationUnits.unlock()
+        self.parsingList.unlock()
+        if a and b:
+            return translationunitcache.TranslationUnitCache.STATUS_REPARSING
+        elif a:
+            return translationunitcache.TranslationUnitCache.STATUS_READY
+        elif b:
+            return translationunitcache.TranslationUnitCache.STATUS_PARSING
+        else:
+            return translationunitcache.TranslationUnitCache.STATUS_NOT_IN_CACHE
+
+    def set_translation_unit(self, worker, filename, opts, opts_script, description):
+        tus = self.translationUnits.lock()
+        try:
+            old = tus.get(filename)
+            old_includes = old.includes if old != None else set()
+            if description == None:
+                if old != None:
+                    del tus[filename]
+                tu = None
+                new_includes = set()
+            else:
+                tu = RemoteTranslationUnit(worker, filename, opts, opts_script, description)
+                tus[filename] = tu
+                new_includes = tu.includes
+            self.update_include_graph(filename, old_includes, new_includes)
+            return tu
+        finally:
+            self.translationUnits.unlock()
+
+    def start_request(self, filename):
+        """
+        Marks a parse or reparse of filename as on its way, returning False
+        if one already is.
+        """
+        pl = self.parsingList.lock()
+        try:
+            if filename in pl:
+                return False
+            pl.append(filename)
+            return True
+        finally:
+            self.parsingList.unlock()
+
+    def send(self, method, filename, opts, opts_script, params, on_done):
+        worker = self.get_worker(filename)
+
+        def callback(error, result):
+            if error == None:
+                self.set_translation_unit(worker, filename, opts, opts_script, result)
+            pl = self.parsingList.lock()
+            try:
+                pl.remove(filename)
+            finally:
+                self.parsingList.unlock()
+            self.check_memory(worker)
+            if on_done != None:
+                run_in_main_thread(on_done)
+        worker.call_async(method, [filename, opts, opts_script] + params, callback)
+
+    def request(self, method, filename, opts, opts_script, params, on_done):
+        """
+        Sends a parse or reparse of filename to its worker unless one is
+        already on its way. Returns whether it was sent.
+        """
+        if not self.start_request(filename):
+            return False
+        self.send(method, filename, opts, opts_script, params, on_done)
+        return True
+
+    def add(self, view, filename, on_done=None):
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                return False
+        finally:
+            self.translationUnits.unlock()
+        opts = self.get_opts(view)
+        return self.request("parse", filename, opts, self.get_opts_script(view),
+                            [get_setting("index_parse_options", 13, view)], on_done)
+
+    def reparse(self, view, filename, unsaved_files=[], on_done=None):
+        opts = self.get_opts(view)
+        return self.request("reparse", filename, opts, self.get_opts_script(view),
+                            [get_unsaved_pairs(unsaved_files), get_setting("index_parse_options", 13, view)], on_done)
+
+    def get_translation_unit(self, filename, opts=[], opts_script=None, unsaved_files=[]):
+        tus = self.translationUnits.lock()
+        try:
+            tu = tus.get(filename)
+            if tu != None:
+                # The worker notices changed options itself
+                tu.opts = opts
+                tu.opts_script = opts_script
+                return tu
+        finally:
+            self.translationUnits.unlock()
+        worker = self.get_worker(filename)
+        description = worker.call("parse", [filename, opts, opts_script])
+        return self.set_translation_unit(worker, filename, opts, opts_script, description)
+
+    def update_include_graph(self, filename, old_includes, new_includes):
+        includers = self.includers.lock()
+        try:
+            for inc in old_includes - new_includes:
+                s = includers.get(inc)
+                if s != None:
+                    s.discard(filename)
+                    if len(s) == 0:
+                        del includers[inc]
+            for inc in new_includes - old_includes:
+                includers.setdefault(inc, set()).add(filename)
+        finally:
+            self.includers.unlock()
+
+    def files_changed(self, paths):
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                mtimes[path] = time.time()
+        affected = {}
+        includers = self.includers.lock()
+        try:
+            for path in paths:
+                for filename in includers.get(path, set()):
+                    affected[filename] = max(affected.get(filename, 0), mtimes[path])
+        finally:
+            self.includers.unlock()
+        ret = []
+        tus = self.translationUnits.lock()
+        try:
+            for filename, tu in tus.items():
+                mtime = max(affected.get(filename, 0), mtimes.get(normalize_path(filename), 0))
+                if mtime > tu.parse_time:
+                    tu.dirty = True
+                if tu.dirty:
+                    ret.append(filename)
+            return sorted(ret)
+        finally:
+            self.translationUnits.unlock()
+
+    def reparse_dirty(self, filename, on_done=None):
+        tus = self.translationUnits.lock()
+        try:
+            tu = tus.get(filename)
+        finally:
+            self.translationUnits.unlock()
+        if tu == None or not tu.dirty or not self.start_request(filename):
+            return False
+        # The dirty buffers are read from their views, which is only done
+        # in the main thread
+        run_in_main_thread(lambda: self.send(
+            "reparse", filename, tu.opts, tu.opts_script,
+            [get_unsaved_pairs(unsaved_buffers.get(filename, tu.includes)), None], on_done))
+        return True
+
+    def get_dependents(self, filename):
+        includers = self.includers.lock()
+        try:
+            return [f for f in includers.get(normalize_path(filename), set()) if f != filename]
+        finally:
+            self.includers.unlock()
+
+    def get_includes(self, filename):
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                return tus[filename].includes
+        finally:
+            self.translationUnits.unlock()
+        return None
+
+    def get_opts(self, view):
+        return translationunitcache.tuCache.get_opts(view)
+
+    def get_opts_script(self, view):
+        return translationunitcache.tuCache.get_opts_script(view)
+
+    def remove(self, filename):
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                self.update_include_graph(filename, tus[filename].includes, set())
+                del tus[filename]
+        finally:
+            self.translationUnits.unlock()
+        self.lock.acquire()
+        try:
+            workers = [w for w in self.workers if filename in w.files]
+            for worker in workers:
+                worker.files.discard(filename)
+        finally:
+            self.lock.release()
+        for worker in workers:
+            worker.call_async("remove", [filename], lambda error, result: None)
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            workers = self.workers
+            self.workers = []
+        finally:
+            self.lock.release()
+        self.translationUnits.lock().clear()
+        self.translationUnits.unlock()
+        self.includers.lock().clear()
+        self.includers.unlock()
+        # Fresh processes give all the memory back
+        for worker in workers:
+            worker.retire()
+
+
+remoteCache = RemoteTranslationUnitCache()
+
+
+def get_tu_cache():
+    """
+    Returns the translation unit cache to use, the one hosted in worker
+    processes or a cache server when "worker_processes" or
+    "worker_socket" is set.
+    """
+    if get_setting("worker_processes", 0) > 0 or get_setting("worker_socket", ""):
+        return remoteCache
+    return translationunitcache.tuCache
@@ -0,0 +1,203 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import json
+import os
+import re
+import threading
+
+from .common import get_setting, get_cache_dir, normalize_path, get_mtimes
+from .symbolindex import get_project_key
+
+SEARCH_CACHE_VERSION = 1
+
+
+def get_result_files(result):
+    """Returns the files an extensive search result points to."""
+    if result == None:
+        return []
+    if not isinstance(result, list):
+        result = [[None, result]]
+    ret = []
+    for display, pos in result:
+        match = re.match(r"(.*):\d+:\d+$", pos)
+        if match != None:
+            ret.append(match.group(1))
+    return ret
+
+
+class ProjectSearchResults(object):
+    """
+    The extensive search results of one project, each entry stored with
+    the mtimes of the files it points to and evicted least recently used
+    first once there are more than "search_cache_size" entries.
+    """
+    def __init__(self, folders):
+        self.key = get_project_key(folders)
+        self.persistent = len(folders) > 0
+        self.entries = {}
+        self.counter = 0
+        self.dirty = False
+
+    def get_filename(self):
+        return os.path.join(get_cache_dir(), "search-%s.json" % self.key)
+
+    def load(self):
+        if not self.persistent:
+            return
+        try:
+            f = open(self.get_filename())
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except:
+            return
+        if data.get("version") != SEARCH_CACHE_VERSION:
+            return
+        for key, entry in data["entries"].items():
+            self.counter = max(self.counter, entry["used"])
+            self.entries[key] = entry
+
+    def save(self):
+        if not self.persistent or not self.dirty:
+            return
+        # Results with no hits can't be validated by mtimes since any file
+        # might contain what was searched for now, so they aren't kept
+        # between sessions.
+        entries = dict([(k, e) for k, e in self.entries.items() if e["result"] != None])
+        data = json.dumps({"version": SEARCH_CACHE_VERSION, "entries": entries})
+        self.dirty = False
+        tmp = "%s.tmp" % self.get_filename()
+        f = open(tmp, "w")
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        if os.path.exists(self.get_filename()):
+            os.remove(self.get_filename())
+        os.rename(tmp, self.get_filename())
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry == None:
+            return None
+        if get_mtimes(entry["mtimes"].keys()) != entry["mtimes"]:
+            del self.entries[key]
+            self.dirty = True
+            return None
+        self.counter += 1
+        entry["used"] = self.counter
+        return entry
+
+    def set(self, key, result):
+        self.counter += 1
+        self.entries[key] = {"result": result, "used": self.counter,
+                             "mtimes": get_mtimes(get_result_files(result))}
+        size = max(1, get_setting("search_cache_size", 100))
+        while len(self.entries) > size:
+            oldest = min(self.entries.keys(), key=lambda k: self.entries[k]["used"])
+            del self.entries[oldest]
+        self.dirty = True
+
+    def files_changed(self, paths):
+        for key, entry in list(self.entries.items()):
+            for filename in entry["mtimes"].keys():
+                if normalize_path(filename) in paths:
+                    del self.entries[key]
+                    self.dirty = True
+                    break
+
+
+class SearchResultCache(object):
+    """
+    Remembers the results of extensive searches per project, persisted in
+    the cache dir so that a repeated goto is answered right away even after
+    a restart. An entry is dropped as soon as a file it points to changes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.projects = {}
+
+    def get_project(self, folders):
+        folders = folders or []
+        key = get_project_key(folders)
+        if key not in self.projects:
+            project = ProjectSearchResults(folders)
+            project.load()
+            self.projects[key] = project
+        return self.projects[key]
+
+    def save(self, project):
+        try:
+            project.save()
+        except:
+            import traceback
+            traceback.print_exc()
+
+    def lookup(self, folders, key):
+        """
+        Returns a (found, result) tuple for the given search key.
+        """
+        self.lock.acquire()
+        try:
+            project = self.get_project(folders)
+            entry = project.get(key)
+            self.save(project)
+            if entry == None:
+                return False, None
+            return True, entry["result"]
+        finally:
+            self.lock.release()
+
+    def store(self, folders, key, result):
+        self.lock.acquire()
+        try:
+            project = self.get_project(folders)
+            project.set(key, result)
+            self.save(project)
+        finally:
+            self.lock.release()
+
+    def files_changed(self, paths):
+        """Drops the entries pointing into any of the given normalized paths."""
+        self.lock.acquire()
+        try:
+            for project in self.projects.values():
+                project.files_changed(paths)
+                self.save(project)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.projects.clear()
+            cache_dir = get_cache_dir()
+            for name in os.listdir(cache_dir):
+                if name.startswith("search-") and name.endswith(".json"):
+                    os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass
+        finally:
+            self.lock.release()
@@ -0,0 +1,548 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .common import Worker, LockedVariable, get_setting, get_compile_args, get_cache_dir, \
+                    normalize_path, bencode, bdecode
+from .clang import cindex
+from .fileinventory import fileInventory, get_extension
+
+INDEX_VERSION = 2
+
+# Cursors visited per lock of a translation unit shared with the editor
+WALK_STEP = 500
+
+# Declarations inside these are indexed too
+CONTAINER_KINDS = set([k.value for k in [
+    cindex.CursorKind.NAMESPACE,
+    cindex.CursorKind.LINKAGE_SPEC,
+    cindex.CursorKind.UNEXPOSED_DECL,
+    cindex.CursorKind.CLASS_DECL,
+    cindex.CursorKind.STRUCT_DECL,
+    cindex.CursorKind.UNION_DECL,
+    cindex.CursorKind.ENUM_DECL,
+    cindex.CursorKind.CLASS_TEMPLATE,
+    cindex.CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION,
+    cindex.CursorKind.OBJC_INTERFACE_DECL,
+    cindex.CursorKind.OBJC_CATEGORY_DECL,
+    cindex.CursorKind.OBJC_PROTOCOL_DECL,
+    cindex.CursorKind.OBJC_IMPLEMENTATION_DECL,
+    cindex.CursorKind.OBJC_CATEGORY_IMPL_DECL]])
+
+# Expressions referring to a declaration, located at the name
+REFERENCE_EXPRESSION_KINDS = set([k.value for k in [
+    cindex.CursorKind.DECL_REF_EXPR,
+    cindex.CursorKind.MEMBER_REF_EXPR,
+    cindex.CursorKind.OBJC_MESSAGE_EXPR]])
+
+
+def get_project_key(folders):
+    folders = sorted([normalize_path(f) for f in folders])
+    return hashlib.md5(bencode("\n".join(folders))).hexdigest()
+
+
+def get_cursor_usr(cursor):
+    if cursor == None or cursor.kind.is_invalid():
+        return None
+    ref = cursor.get_reference()
+    if ref != None:
+        cursor = ref
+    usr = cursor.get_usr()
+    if not usr:
+        return None
+    return bdecode(usr)
+
+
+def format_location(cursor):
+    loc = cursor.location
+    return "%s:%d:%d" % (loc.file.name, loc.line, loc.column)
+
+
+def format_display(cursor):
+    parent = cursor.get_semantic_parent()
+    if parent != None and parent.kind.is_declaration() and \
+            parent.kind != cindex.CursorKind.TRANSLATION_UNIT:
+        return "%s::%s" % (parent.spelling, cursor.displayname)
+    return cursor.displayname
+
+
+def location_key(loc):
+    filename, line, column = loc.rsplit(":", 2)
+    return filename, int(line), int(column)
+
+
+class SymbolCollector(object):
+    """
+    Collects the symbols and references found in each file that
+    wanted(filename) accepts. Only declarations at namespace or class
+    scope are symbols, references are collected from function bodies too.
+    The translation unit is walked a step at a time, so that it only needs
+    to be locked while stepping.
+    """
+    def __init__(self, tu, wanted):
+        self.wanted = wanted
+        # filename -> (symbols, references)
+        self.shards = {}
+        self.accepted = {}
+        # (cursor, context, declarations) of the cursors left to visit, the
+        # next one last
+        self.stack = []
+        self.push_children(tu.cursor, "", True)
+
+    def push_children(self, cursor, context, declarations):
+        children = [(child, context, declarations) for child in cursor.get_children()]
+        children.reverse()
+        self.stack.extend(children)
+
+    def is_done(self):
+        return len(self.stack) == 0
+
+    def step(self, count):
+        """Visits up to count cursors."""
+        while len(self.stack) > 0 and count > 0:
+            count -= 1
+            child, context, declarations = self.stack.pop()
+            f = child.location.file
+            if f == None:
+                continue
+            name = f.name
+            if name not in self.accepted:
+                self.accepted[name] = self.wanted(name)
+                if self.accepted[name]:
+                    self.shards[name] = ([], [])
+            if not self.accepted[name]:
+                continue
+            symbols, refs = self.shards[name]
+            kind = child.kind
+            child_context = context
+            if kind.is_declaration():
+                usr = child.get_usr()
+                if usr:
+                    child_context = format_display(child)
+                    if declarations:
+                        symbols.append((bdecode(usr), child.spelling, child_context,
+                                        format_location(child), bool(child.is_definition())))
+            elif kind.is_reference() or kind.value in REFERENCE_EXPRESSION_KINDS:
+                usr = get_cursor_usr(child)
+                if usr:
+                    refs.append((usr, context or child.spelling, format_location(child)))
+            self.push_children(child, child_context, declarations and kind.value in CONTAINER_KINDS)
+
+
+def collect_symbols(tu, wanted):
+    """
+    Walks the translation unit and returns a dict with the symbols and
+    references found in each file that wanted(filename) accepts.
+    """
+    collector = SymbolCollector(tu, wanted)
+    while not collector.is_done():
+        collector.step(WALK_STEP)
+    return collector.shards
+
+
+class ProjectSymbols(object):
+    """
+    The symbol index of one project. Symbols and references to them are
+    stored in shards, one per file they are located in, so that a shard
+    can be replaced as soon as its file changes. Each shard remembers which
+    source file it was extracted from so that a changed header can be
+    reindexed.
+    """
+    def __init__(self, folders):
+        self.folders = [normalize_path(f) for f in folders]
+        self.key = get_project_key(folders)
+        self.lock = threading.RLock()
+        self.shards = {}
+        self.usrs = {}
+        self.names = {}
+        self.refs = {}
+        self.dirty = False
+        self.opts = None
+        self.opts_script = None
+
+    def get_filename(self):
+        return os.path.join(get_cache_dir(), "symbols-%s.json" % self.key)
+
+    def in_project(self, filename):
+        filename = normalize_path(filename)
+        for folder in self.folders:
+            if filename.startswith(os.path.join(folder, "")):
+                return True
+        return False
+
+    def load(self):
+        try:
+            f = open(self.get_filename())
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except:
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        self.lock.acquire()
+        try:
+            for filename, shard in data["shards"].items():
+                self.set_shard(filename, shard["mtime"], shard["source"], shard["symbols"], shard["refs"])
+            self.dirty = False
+        finally:
+            self.lock.release()
+
+    def save(self):
+        self.lock.acquire()
+        try:
+            if not self.dirty:
+                return
+            data = {"version": INDEX_VERSION, "folders": self.folders, "shards": self.shards}
+            data = json.dumps(data)
+            self.dirty = False
+        finally:
+            self.lock.release()
+        tmp = "%s.tmp" % self.get_filename()
+        f = open(tmp, "w")
+        try:
+            f.write(data)
+        finally:
+            f.close()
+        if os.path.exists(self.get_filename()):
+            os.remove(self.get_filename())
+        os.rename(tmp, self.get_filename())
+
+    def is_fresh(self, filename, mtime):
+        self.lock.acquire()
+        try:
+            return filename in self.shards and self.shards[filename]["mtime"] == mtime
+        finally:
+            self.lock.release()
+
+    def get_stale_sources(self):
+        """Returns the source files of shards whose files changed on disk."""
+        ret = set()
+        self.lock.acquire()
+        try:
+            shards = list(self.shards.items())
+        finally:
+            self.lock.release()
+        for filename, shard in shards:
+            try:
+                if os.path.getmtime(filename) != shard["mtime"]:
+                    ret.add(shard["source"])
+            except OSError:
+                self.remove_shard(filename)
+        return ret
+
+    def get_sources_for(self, paths):
+        """
+        Returns the source files of the shards for the given normalized
+        paths. Shards of files that no longer exist are removed.
+        """
+        ret = set()
+        self.lock.acquire()
+        try:
+            shards = list(self.shards.items())
+        finally:
+            self.lock.release()
+        for filename, shard in shards:
+            if normalize_path(filename) in paths:
+                if os.path.exists(filename):
+                    ret.add(shard["source"])
+                else:
+                    self.remove_shard(filename)
+        return ret
+
+    def remove_shard(self, filename):
+        self.lock.acquire()
+        try:
+            if filename not in self.shards:
+                return
+            for usr, name, display, loc, isdef in self.shards[filename]["symbols"]:
+                locs = self.usrs.get(usr)
+                if locs == None:
+                    continue
+                locs.pop(loc, None)
+                if len(locs) == 0:
+                    del self.usrs[usr]
+                    usrs = self.names.get(name)
+                    if usrs != None:
+                        usrs.discard(usr)
+                        if len(usrs) == 0:
+                            del self.names[name]
+            for usr, display, loc in self.shards[filename]["refs"]:
+                locs = self.refs.get(usr)
+                if locs == None:
+                    continue
+                locs.pop(loc, None)
+                if len(locs) == 0:
+                    del self.refs[usr]
+            del self.shards[filename]
+            self.dirty = True
+        finally:
+            self.lock.release()
+
+    def set_shard(self, filename, mtime, source, symbols, refs):
+        self.lock.acquire()
+        try:
+            self.remove_shard(filename)
+            self.shards[filename] = {"mtime": mtime, "source": source, "symbols": symbols, "refs": refs}
+            for usr, name, display, loc, isdef in symbols:
+                self.usrs.setdefault(usr, {})[loc] = (display, isdef)
+                self.names.setdefault(name, set()).add(usr)
+            for usr, display, loc in refs:
+                self.refs.setdefault(usr, {})[loc] = display
+            self.dirty = True
+        finally:
+            self.lock.release()
+
+    def lookup(self, usr, definition):
+        """Returns a list of (display, location) pairs for the given usr."""
+        self.lock.acquire()
+        try:
+            locs = self.usrs.get(usr, {})
+            return sorted([(display, loc) for loc, (display, isdef) in locs.items() if isdef == definition])
+        finally:
+            self.lock.release()
+
+    def lookup_name(self, name, definition):
+        self.lock.acquire()
+        try:
+            ret = []
+            for usr in self.names.get(name, []):
+                ret.extend(self.lookup(usr, definition))
+            return sorted(ret)
+        finally:
+            self.lock.release()
+
+    def lookup_references(self, usr):
+        """
+        Returns a list of (display, location) pairs of the declarations of
+        and references to the given usr.
+        """
+        self.lock.acquire()
+        try:
+            ret = [(display, loc) for loc, (display, isdef) in self.usrs.get(usr, {}).items()]
+            ret.extend([(display, loc) for loc, display in self.refs.get(usr, {}).items()])
+            return sorted(ret, key=lambda r: location_key(r[1]))
+        finally:
+            self.lock.release()
+
+
+class SymbolIndexer(Worker):
+    """
+    Builds and maintains the symbol index of each project in a single low
+    priority background thread.
+    """
+    def __init__(self):
+        self.projects = LockedVariable({})
+        self.index = None
+        super(SymbolIndexer, self).__init__(1)
+
+    def display_status(self):
+        if get_setting("parse_status_messages", True):
+            super(SymbolIndexer, self).display_status()
+
+    def get_project(self, folders, create=False):
+        if not folders:
+            return None
+        key = get_project_key(folders)
+        projects = self.projects.lock()
+        try:
+            if key not in projects:
+                if not create:
+                    return None
+                projects[key] = ProjectSymbols(folders)
+                self.tasks.put((self.task_load, projects[key]))
+            return projects[key]
+        finally:
+            self.projects.unlock()
+
+    def index_project(self, folders, opts, opts_script):
+        if self.get_project(folders) != None:
+            return
+        project = self.get_project(folders, True)
+        project.opts = opts
+        project.opts_script = opts_script
+        self.tasks.put((self.task_index_project, (project, opts, opts_script)))
+
+    def index_file(self, folders, filename, opts, opts_script):
+        project = self.get_project(folders)
+        if project != None and project.in_project(filename):
+            self.tasks.put((self.task_index_file, (project, filename, opts, opts_script, True)))
+
+    def files_changed(self, paths):
+        """
+        Reindexes what is affected by the given normalized paths having
+        changed on disk.
+        """
+        projects = self.projects.lock()
+        try:
+            projects = list(projects.values())
+        finally:
+            self.projects.unlock()
+        extensions = get_setting("index_extensions", ["c", "cc", "cpp", "cxx", "m", "mm"])
+        for project in projects:
+            if project.opts == None:
+                continue
+            sources = project.get_sources_for(paths)
+            for path in paths:
+                if get_extension(path) in extensions and project.in_project(path) and os.path.exists(path):
+                    sources.add(path)
+            for source in sorted(sources):
+                self.tasks.put((self.task_index_file, (project, source, project.opts, project.opts_script, False)))
+            if len(sources) > 0:
+                self.tasks.put((self.task_save, project))
+
+    def task_load(self, project):
+        project.load()
+
+    def get_sources(self, project):
+        extensions = get_setting("index_extensions", ["c", "cc", "cpp", "cxx", "m", "mm"])
+        return fileInventory.get_files(project.folders, extensions)
+
+    def task_index_project(self, data):
+        project, opts, opts_script = data
+        sources = set()
+        for source in self.get_sources(project):
+            try:
+                if not project.is_fresh(source, os.path.getmtime(source)):
+                    sources.add(source)
+            except OSError:
+                pass
+        sources |= project.get_stale_sources()
+        for source in sorted(sources):
+            self.tasks.put((self.task_index_file, (project, source, opts, opts_script, False)))
+        self.tasks.put((self.task_save, project))
+
+    def task_save(self, project):
+        try:
+            project.save()
+        except:
+            import traceback
+            traceback.print_exc()
+        self.set_status("Indexing %s done" % ", ".join(project.folders))
+
+    def task_index_file(self, data):
+        project, filename, opts, opts_script, save = data
+        if not os.path.exists(filename):
+            project.remove_shard(filename)
+            return
+        self.set_status("Indexing %s" % filename)
+        if self.index == None:
+            self.index = cindex.Index.create()
+        args = get_compile_args(filename, opts, opts_script)
+        args.append(filename)
+        tu = self.index.parse(None, args, [], 0)
+        if tu == None:
+            return
+
+        mtimes = {}
+        def wanted(name):
+            if not project.in_project(name):
+                return False
+            try:
+                mtime = os.path.getmtime(name)
+            except OSError:
+                return False
+            if name != filename and project.is_fresh(name, mtime):
+                return False
+            mtimes[name] = mtime
+            return True
+        shards = collect_symbols(tu, wanted)
+        for name, (symbols, refs) in shards.items():
+            project.set_shard(name, mtimes[name], filename, symbols, refs)
+        if save:
+            self.tasks.put((self.task_save, project))
+        # Be nice to the rest of the editor
+        time.sleep(0.01)
+
+    def get_project_for(self, filename):
+        projects = self.projects.lock()
+        try:
+            for project in projects.values():
+                if project.in_project(filename):
+                    return project
+        finally:
+            self.projects.unlock()
+        return None
+
+    def index_translation_unit(self, filename, tu):
+        """
+        Updates the shard of filename from its already parsed translation
+        unit, so that references are current after each reparse.
+        """
+        project = self.get_project_for(filename)
+        if project != None:
+            self.tasks.put((self.task_index_translation_unit, (project, filename, tu)))
+
+    def task_index_translation_unit(self, data):
+        project, filename, tu = data
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            return
+        # Completions and reparses get the translation unit in between
+        # steps. A reparse makes the cursors invalid, but it's indexed again
+        # after that anyway.
+        tu.lock()
+        try:
+            generation = tu.generation
+            collector = SymbolCollector(tu.var, lambda name: name == filename)
+        finally:
+            tu.unlock()
+        while not collector.is_done():
+            tu.lock()
+            try:
+                if tu.generation != generation:
+                    return
+                collector.step(WALK_STEP)
+            finally:
+                tu.unlock()
+        if filename in collector.shards:
+            symbols, refs = collector.shards[filename]
+            project.set_shard(filename, mtime, filename, symbols, refs)
+
+    def lookup(self, folders, usr, definition):
+        project = self.get_project(folders)
+        if project == None or usr == None:
+            return []
+        return project.lookup(usr, definition)
+
+    def lookup_name(self, folders, name, definition):
+        project = self.get_project(folders)
+        if project == None:
+            return []
+        return project.lookup_name(name, definition)
+
+    def lookup_references(self, folders, usr):
+        project = self.get_project(folders)
+        if project == None or usr == None:
+            return []
+        return project.lookup_references(usr)
+
+
+symbolIndexer = SymbolIndexer()
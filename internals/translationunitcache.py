@@ -24,11 +24,19 @@ freely, subject to the following restrictions:
 import os
 import sys
 
-from .common import Worker, complete_path, expand_path, get_setting, get_path_setting,\
+from .common import Worker, expand_path, get_setting, get_path_setting,\
                     get_language, LockedVariable, run_in_main_thread, error_message,\
-                    display_user_selection, get_cpu_count, status_message, bencode, bdecode,\
-                    sencode, sdecode, are_we_there_yet, look_for_file
+                    display_user_selection, bencode, bdecode,\
+                    sdecode, are_we_there_yet, look_for_file, normalize_path,\
+                    get_compile_args, refresh_user_selection, hide_user_selection, get_cache_dir
 from .clang import cindex
+from .symbolindex import symbolIndexer, get_cursor_usr
+from .fileinventory import fileInventory
+from .candidatescan import candidateScanner
+from .searchresults import SearchResultCache
+from .companions import companionIndex, is_header
+from .diagnostics import DiagnosticFile, DiagnosticData
+from .unsavedfiles import unsaved_buffers
 from .parsehelp.parsehelp import *
 
 try:
@@ -38,13 +46,13 @@ except:
 
 
 import time
-import shlex
-import subprocess
 import sys
-from ctypes import cdll, Structure, POINTER, c_char_p, c_void_p, c_uint, c_bool
+from ctypes import cdll, Structure, POINTER, c_char_p, c_void_p, c_uint, c_int, c_bool
 
 import re
 import threading
+import hashlib
+import itertools
 
 scriptpath = os.path.dirname(os.path.abspath(__file__))
 
@@ -159,6 +167,92 @@ cache_clangComplete.argtypes = [POINTER(_Cache), c_char_p, c_uint, c_uint, POINT
 cache_clangComplete.restype = POINTER(CacheCompletionResults)
 
 
+class PackedDiagnostic(Structure):
+    _fields_ = [("severity", c_uint), ("file", c_uint), ("line", c_uint), ("column", c_uint),
+                ("spelling", c_char_p), ("disable_option", c_char_p),
+                ("fixit_start", c_uint), ("fixit_count", c_uint)]
+
+
+class PackedFixIt(Structure):
+    _fields_ = [("file", c_uint), ("start_line", c_uint), ("start_column", c_uint),
+                ("end_line", c_uint), ("end_column", c_uint), ("value", c_char_p)]
+
+
+class PackedDiagnostics(Structure):
+    _fields_ = [("count", c_uint), ("diagnostics", POINTER(PackedDiagnostic)),
+                ("file_count", c_uint), ("files", POINTER(c_char_p)),
+                ("fixit_count", c_uint), ("fixits", POINTER(PackedFixIt))]
+
+try:
+    diagnostics_get = cachelib.diagnostics_get
+    diagnostics_get.argtypes = [cindex.TranslationUnit]
+    diagnostics_get.restype = POINTER(PackedDiagnostics)
+    diagnostics_dispose = cachelib.diagnostics_dispose
+    diagnostics_dispose.argtypes = [POINTER(PackedDiagnostics)]
+except AttributeError:
+    # A libcache from before the export was added
+    diagnostics_get = None
+
+try:
+    cursor_getChildren = cachelib.cursor_getChildren
+    cursor_getChildren.argtypes = [cindex.Cursor, c_int, POINTER(cindex.Cursor), c_uint]
+    if cindex.isWin64:
+        cursor_getChildren.argtypes = [POINTER(cindex.Cursor), c_int, POINTER(cindex.Cursor), c_uint]
+    cursor_getChildren.restype = c_uint
+    cindex.Cursor_getChildren = cursor_getChildren
+except AttributeError:
+    # A libcache from before the export was added, children are then
+    # visited with a Python callback
+    pass
+
+
+def get_diagnostics(tu):
+    """
+    Returns the diagnostics of the cindex translation unit tu as a list of
+    DiagnosticData, extracted in one call when libcache can do it.
+    """
+    if diagnostics_get == None:
+        ret = []
+        files = {}
+        for diag in tu.diagnostics:
+            f = diag.location
+            filename = None
+            if f.file != None:
+                filename = f.file.name
+                if filename not in files:
+                    files[filename] = DiagnosticFile(filename)
+            fixits = []
+            for fixit in diag.fixits:
+                start = fixit.range.start
+                end = fixit.range.end
+                fixits.append((start.file.name if start.file != None else None, start.line, start.column,
+                               end.line, end.column, bdecode(fixit.value)))
+            option = diag.disable_option
+            ret.append(DiagnosticData(files.get(filename), f.line, f.column, diag.severity,
+                                      diag.spelling, bdecode(option) if option else "", fixits))
+        return ret
+
+    packed = diagnostics_get(tu)
+    try:
+        p = packed[0]
+        names = [bdecode(p.files[i]) for i in range(p.file_count)]
+        files = [None] + [DiagnosticFile(name) for name in names[1:]]
+        fixits = []
+        for i in range(p.fixit_count):
+            f = p.fixits[i]
+            fixits.append((names[f.file] or None, f.start_line, f.start_column,
+                           f.end_line, f.end_column, bdecode(f.value)))
+        ret = []
+        for i in range(p.count):
+            d = p.diagnostics[i]
+            ret.append(DiagnosticData(files[d.file], d.line, d.column, d.severity,
+                                      bdecode(d.spelling), bdecode(d.disable_option),
+                                      fixits[d.fixit_start:d.fixit_start + d.fixit_count]))
+        return ret
+    finally:
+        diagnostics_dispose(packed)
+
+
 def remove_duplicates(data):
     if data == None:
         return None
@@ -272,11 +366,10 @@ class Cache:
             if temp != None and not temp.kind.is_invalid():
                 if temp.kind == cindex.CursorKind.TEMPLATE_TYPE_PARAMETER:
                     off = 0
-                    for child in typecursor.get_children():
-                        if child.kind == cindex.CursorKind.TEMPLATE_TYPE_PARAMETER:
-                            if child == temp:
-                                break
-                            off += 1
+                    for child in typecursor.get_children(cindex.CursorKind.TEMPLATE_TYPE_PARAMETER):
+                        if child == temp:
+                            break
+                        off += 1
                     if template[1] and off < len(template[1]):
                         template = template[1][off]
                         if isinstance(template[0], cindex.Cursor):
@@ -293,12 +386,10 @@ class Cache:
             return False
         if parent == child:
             return True
-        for c in child.get_children():
-            if c.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
-                for c2 in c.get_children():
-                    if c2.kind == cindex.CursorKind.TYPE_REF:
-                        c2 = c2.get_reference()
-                        return self.inherits(parent, c2)
+        for c in child.get_children(cindex.CursorKind.CXX_BASE_SPECIFIER):
+            for c2 in c.get_children(cindex.CursorKind.TYPE_REF):
+                c2 = c2.get_reference()
+                return self.inherits(parent, c2)
         return False
 
     def filter(self, ret, constr=False):
@@ -670,16 +761,7 @@ class Cache:
 
     def clangcomplete(self, filename, row, col, unsaved_files, membercomp):
         ret = None
-        unsaved = None
-        if len(unsaved_files):
-            unsaved = (cindex._CXUnsavedFile * len(unsaved_files))()
-            for i, (name, value) in enumerate(unsaved_files):
-                if not isinstance(value, str):
-                    value = value.encode("ascii", "ignore")
-                value = bencode(value)
-                unsaved[i].name = bencode(name)
-                unsaved[i].contents = value
-                unsaved[i].length = len(value)
+        unsaved = cindex.make_unsaved_files_array(unsaved_files) or None
         comp = cache_clangComplete(self.cache, bencode(filename), row, col, unsaved, len(unsaved_files), membercomp)
 
         if comp:
@@ -697,16 +779,110 @@ def get_cursor_spelling(cursor):
         cursor_spelling = re.sub(r"^(enum\s+|(class|struct)\s+(\w+::)*)", "", cursor_spelling)
     return cursor_spelling
 
-searchcache = {}
+class SearchJob(object):
+    """
+    Handle for one search running on the searchExecutor. It keeps track of
+    how many of the search's tasks are still queued or running so that the
+    search can be finished once the last one is done.
+    """
+    def __init__(self, on_done):
+        self.on_done = on_done
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.stopped = False
+        self.cancelled = False
+
+    def stop(self):
+        """Makes the remaining tasks of the job return right away."""
+        self.stopped = True
+
+    def cancel(self):
+        """Stops the job without it reporting a result."""
+        self.cancelled = True
+        self.stopped = True
+
+    def add_task(self):
+        self.lock.acquire()
+        try:
+            self.pending += 1
+        finally:
+            self.lock.release()
+
+    def task_done(self):
+        self.lock.acquire()
+        try:
+            self.pending -= 1
+            last = self.pending == 0
+        finally:
+            self.lock.release()
+        if last and not self.cancelled:
+            self.on_done()
+
+
+class SearchExecutor(Worker):
+    """
+    The threads shared by all extensive searches. Only one search runs at
+    a time, starting a new one cancels the previous one.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = None
+        self.status = ""
+        self.timer = None
+        super(SearchExecutor, self).__init__()
+
+    def start(self, on_done):
+        self.lock.acquire()
+        try:
+            if self.current != None:
+                self.current.cancel()
+            self.current = SearchJob(on_done)
+            return self.current
+        finally:
+            self.lock.release()
+
+    def submit(self, job, task, data):
+        job.add_task()
+        self.tasks.put((self.task_run, (job, task, data)))
+
+    def task_run(self, data):
+        job, task, data = data
+        try:
+            if not job.stopped:
+                task(data)
+        finally:
+            job.task_done()
+
+    def set_status(self, msg):
+        # Searches update the status for every file, so only the latest
+        # message is shown at most every 100 ms.
+        self.lock.acquire()
+        try:
+            self.status = msg
+            if self.timer == None:
+                self.timer = threading.Timer(0.1, self.flush_status)
+                self.timer.start()
+        finally:
+            self.lock.release()
+
+    def flush_status(self):
+        self.lock.acquire()
+        try:
+            self.timer = None
+        finally:
+            self.lock.release()
+        run_in_main_thread(self.display_status)
+
+
+searchExecutor = SearchExecutor()
+searchcache = SearchResultCache()
 
 class ExtensiveSearch:
 
     def quickpanel_extensive_search(self, idx):
         if idx == 0:
-            for cpu in range(get_cpu_count()):
-                t = threading.Thread(target=self.worker)
-                t.start()
-            self.queue.put((0, "*/+"))
+            self.job = searchExecutor.start(lambda: run_in_main_thread(self.done))
+            searchExecutor.submit(self.job, self.task_scan, None)
         elif len(self.options) > 2:
             self.found_callback(self.options[idx][1])
 
@@ -728,21 +904,21 @@ class ExtensiveSearch:
         self.opts_script = opts_script
         self.impl = impl
         self.target = ""
-        self.cursor = None
-        if cursor:
-            self.cursor = format_cursor(cursor)
-        self.queue = Queue.PriorityQueue()
+        # Formatted with format_cursor, or None
+        self.cursor = cursor
+        self.job = None
         self.candidates = Queue.Queue()
         self.lock = threading.RLock()
-        self.timer = None
-        self.status_count = 0
         self.found_callback = found_callback
+        self.finished = False
+        self.streamed = []
+        self.panel_timer = None
+        self.panel_generation = 0
         self.options = [["Yes", "Do extensive search"], ["No", "Don't do extensive search"]]
-        k = self.key()
-        if k in searchcache:
+        found, targets = searchcache.lookup(self.folders, self.key())
+        if found:
             self.options = [["Redo search", "Redo extensive search"], ["Don't redo", "Don't redo extensive search"]]
-            targets = searchcache[k]
-            if isinstance(targets, str):
+            if targets != None and not isinstance(targets, list):
                 # An exact match is known, we're done here
                 found_callback(targets)
                 return
@@ -754,9 +930,16 @@ class ExtensiveSearch:
         return str((self.cursor, self.spelling, self.impre.pattern, self.re.pattern, self.impl, str(self.folders)))
 
     def done(self):
+        if self.finished:
+            return
+        self.finished = True
+        # Any callback from the streamed selection is stale from now on
+        self.panel_generation += 1
         cache = None
         if len(self.target) > 0:
             cache = self.target
+            if len(self.streamed) > 0:
+                hide_user_selection()
         elif not self.candidates.empty():
             cache = []
             while not self.candidates.empty():
@@ -764,125 +947,241 @@ class ExtensiveSearch:
                 pos = "%s:%d:%d" % (name, line, column)
                 cache.append([function, pos])
                 self.candidates.task_done()
-        searchcache[self.key()] = cache
+        searchcache.store(self.folders, self.key(), cache)
         self.found_callback(cache)
 
-    def do_message(self):
+    def add_candidate(self, name, function, line, column):
+        self.candidates.put((name, function, line, column))
         try:
             self.lock.acquire()
-            run_in_main_thread(lambda: status_message(self.status))
-            self.status_count = 0
-            self.timer = None
+            self.streamed.append([function, "%s:%d:%d" % (name, line, column)])
+            if self.panel_timer == None:
+                self.panel_timer = threading.Timer(0.25, lambda: run_in_main_thread(self.show_streamed))
+                self.panel_timer.start()
         finally:
             self.lock.release()
 
-    def set_status(self, message):
+    def show_streamed(self):
         try:
             self.lock.acquire()
-            self.status = message
-            if self.timer:
-                self.timer.cancel()
-                self.timer = None
-            self.status_count += 1
-            if self.status_count == 30:
-                self.do_message()
-            else:
-                self.timer = threading.Timer(0.1, self.do_message)
+            self.panel_timer = None
+            options = list(self.streamed)
         finally:
             self.lock.release()
+        if self.finished or self.job.stopped:
+            return
+        self.panel_generation += 1
+        generation = self.panel_generation
+        refresh_user_selection(options, lambda idx: self.quickpanel_streamed(generation, options, idx))
 
-    def worker(self):
+    def quickpanel_streamed(self, generation, options, idx):
+        if generation != self.panel_generation:
+            # Closed because it was re-shown with more candidates
+            return
+        # The user either picked a candidate or gave up on the search,
+        # either way the rest of the search isn't needed.
+        self.finished = True
+        self.job.cancel()
+        if idx != -1:
+            self.found_callback(options[idx][1])
+
+    def task_scan(self, data):
+        searchExecutor.set_status("Searching for %s..." % ("implementation" if self.impl else "definition"))
+        name = os.path.basename(self.name)
+        files = []
+        for full_path in fileInventory.get_files(self.folders):
+            filename = os.path.basename(full_path)
+            if self.impre.search(filename) != None:
+                score = 1000
+                for i in range(min(len(filename), len(name))):
+                    if filename[i] == name[i]:
+                        score -= 1
+                    else:
+                        break
+                files.append((score, full_path))
+        files.sort()
+
+        # The regex scan runs in a pool, candidates found are streamed
+        # to the user and verified with libclang by the executor.
+        fine_search = self.cursor and self.impl
+        for name, matches in candidateScanner.scan([f[1] for f in files], self.spelling, self.re.pattern, lambda: self.job.stopped):
+            if self.job.stopped:
+                break
+            searchExecutor.set_status("Searching %s" % name)
+            fine_cands = []
+            for function, line, column in matches:
+                fine_cands.append((name, line, column))
+                self.add_candidate(name, function, line, column)
+            if fine_search and len(fine_cands) > 0:
+                searchExecutor.submit(self.job, self.task_verify, fine_cands)
+
+    def task_verify(self, fine_cands):
+        name = fine_cands[0][0]
+        tu2 = tuCache.get_scratch_translation_unit(name, self.opts, self.opts_script)
+        if tu2 == None:
+            return
+        tu2.lock()
         try:
-            while len(self.target) == 0:
-                prio, name = self.queue.get(timeout=60)
-                if name == "*/+":
-                    run_in_main_thread(lambda: status_message("Searching for %s..." % ("implementation" if self.impl else "definition")))
-                    name = os.path.basename(self.name)
-                    for folder in self.folders:
-                        for dirpath, dirnames, filenames in os.walk(folder):
-                            for filename in filenames:
-                                full_path = os.path.join(dirpath, filename)
-                                ok = not "./src/build" in full_path and not "\\src\\build" in full_path
-                                if not ok:
-                                    full_path = os.path.abspath(full_path)
-                                    ok = not "SublimeClang" in full_path and not "Y:\\src\\build" in full_path
-                                if ok and self.impre.search(filename) != None:
-                                    score = 1000
-                                    for i in range(min(len(filename), len(name))):
-                                        if filename[i] == name[i]:
-                                            score -= 1
-                                        else:
-                                            break
-                                    self.queue.put((score, full_path))
-                    for i in range(get_cpu_count()-1):
-                        self.queue.put((1001, "*/+++"))
-
-                    self.queue.put((1010, "*/++"))
-                    self.queue.task_done()
-                    continue
-                elif name == "*/++":
-                    run_in_main_thread(self.done)
-                    break
-                elif name == "*/+++":
-                    self.queue.task_done()
+            for cand in fine_cands:
+                if self.job.stopped:
                     break
+                cursor2 = cindex.Cursor.get(
+                        tu2.var, cand[0],
+                        cand[1],
+                        cand[2])
+                if cursor2 != None:
+                    d = cursor2.get_canonical_cursor()
+                    if d != None and cursor2 != d:
+                        if format_cursor(d) == self.cursor:
+                            self.target = format_cursor(cursor2)
+                            # No need for the other tasks to keep looking
+                            self.job.stop()
+                            break
+        finally:
+            tu2.unlock()
+            tu2.release()
 
-                remove = tuCache.get_status(name) == TranslationUnitCache.STATUS_NOT_IN_CACHE
-                fine_search = not remove
 
-                self.set_status("Searching %s" % name)
+generations = itertools.count(1)
 
-                # try a regex search first
-                f = open(name, "r")
-                data = f.read()
-                f.close()
-                fine_cands = []
-                for match in self.re.finditer(data):
-                    fine_search = True
-                    loc = match.start()
-                    for i in range(len(match.groups())+1):
-                        m = match.group(i)
-                        if self.spelling in m:
-                            loc = match.start(i)
-
-                    line, column = get_line_and_column_from_offset(data, loc)
-                    fine_cands.append((name, line, column))
-                    self.candidates.put((name, match.group(0), line, column))
-
-                if fine_search and self.cursor and self.impl:
-                    tu2 = tuCache.get_translation_unit(name, self.opts, self.opts_script)
-                    if tu2 != None:
-                        tu2.lock()
-                        try:
-                            for cand in fine_cands:
-                                cursor2 = cindex.Cursor.get(
-                                        tu2.var, cand[0],
-                                        cand[1],
-                                        cand[2])
-                                if cursor2 != None:
-                                    d = cursor2.get_canonical_cursor()
-                                    if d != None and cursor2 != d:
-                                        if format_cursor(d) == self.cursor:
-                                            self.target = format_cursor(cursor2)
-                                            run_in_main_thread(self.done)
-                                            break
-                        finally:
-                            tu2.unlock()
-                        if remove:
-                            tuCache.remove(name)
-                self.queue.task_done()
-        except Queue.Empty as e:
-            pass
-        except:
-            import traceback
-            traceback.print_exc()
+
+def next_generation():
+    """Returns a generation no translation unit parse has had before."""
+    return next(generations)
+
+
+class ScratchTranslationUnit(LockedVariable):
+    """
+    A throwaway translation unit with just the declarations of a file.
+    It isn't part of the cache and holds one of the cache's scratch slots
+    until released.
+    """
+    def __init__(self, var, fn, slots):
+        LockedVariable.__init__(self, var)
+        self.fn = fn
+        self.slots = slots
+
+    def release(self):
+        if self.var != None:
+            self.var = None
+            self.slots.release()
+
+
+def get_index_lookup(cursor, word, definition):
+    """
+    Returns what find_indexed looks up for the cursor, or just the word if
+    there's no usable cursor.
+    """
+    if cursor == None:
+        return {"usr": None, "word": word, "exclude": None, "definition": definition}
+    lookup = {"usr": get_cursor_usr(cursor), "word": None, "exclude": None, "definition": definition}
+    if cursor.location.file != None:
+        lookup["word"] = word
+        lookup["exclude"] = format_cursor(cursor)
+    return lookup
+
+
+def find_indexed(folders, lookup):
+    """
+    Look up the symbol's usr, or else its name, in the project's symbol
+    index. Returns a target, a list of quick panel targets or None if the
+    index doesn't know about it.
+    """
+    targets = []
+    if lookup["usr"] != None:
+        targets = symbolIndexer.lookup(folders, lookup["usr"], lookup["definition"])
+    if not targets and lookup["word"] != None:
+        targets = [t for t in symbolIndexer.lookup_name(folders, lookup["word"], lookup["definition"])
+                   if t[1] != lookup["exclude"]]
+    if len(targets) == 0:
+        return None
+    elif len(targets) == 1:
+        return targets[0][1]
+    return [list(t) for t in targets]
+
+
+def find_in_companion(source, location, opts, opts_script):
+    """
+    Looks for the definition of what's declared at location, a
+    [filename, line, column] list, in a scratch parse of source.
+    """
+    tu = tuCache.get_scratch_translation_unit(source, opts, opts_script)
+    if tu == None:
+        return None
+    tu.lock()
+    try:
+        cursor = cindex.Cursor.get(tu.var, location[0], location[1], location[2])
+        if cursor != None:
+            d = cursor.get_definition()
+            if d != None and cursor != d:
+                return format_cursor(d)
+    finally:
+        tu.unlock()
+        tu.release()
+    return None
+
+
+def finish_goto(plan, filename, found_callback, folders, opts, opts_script, companion_finder):
+    """
+    Finishes a goto with the plan from LockedTranslationUnit.locate. This
+    needs the project so it's done in the editor: the symbol index is
+    looked up, then companion_finder(source, location) is asked about the
+    best companion source and last, after asking the user, there's an
+    extensive search.
+    """
+    target = plan.get("target")
+    if plan.get("references") != None:
+        target = [list(t) for t in symbolIndexer.lookup_references(folders, plan["references"])] or None
+    if target == None and "index" in plan:
+        target = find_indexed(folders, plan["index"])
+    if target == None and "companion" in plan:
+        # Only the best companion is parsed, if that doesn't have it the
+        # extensive search will find it.
+        sources = [s for s in companionIndex.get_sources(plan["companion"][0], folders) if s != filename]
+        if len(sources) > 0:
+            target = companion_finder(sources[0], plan["companion"])
+    if target == None and "search" in plan:
+        search = plan["search"]
+        ExtensiveSearch(search["cursor"], search["word"], found_callback, folders, opts, opts_script)
+        return
+    found_callback(target)
 
 
 class LockedTranslationUnit(LockedVariable):
-    def __init__(self, var, fn):
+    def __init__(self, var, fn, pch=None):
         LockedVariable.__init__(self, var)
         self.cache = Cache(var, fn)
         self.fn = fn
+        self.dirty = False
+        self.parse_time = time.time()
+        # The SharedPch it was parsed with, if any
+        self.pch = pch
+        # Changes on every reparse
+        self.generation = next_generation()
+        self.diagnostics = None
+        self.update_includes()
+
+    def release(self):
+        # Only scratch translation units need releasing
+        pass
+
+    def get_diagnostics(self):
+        """
+        Returns the diagnostics as a list of DiagnosticData, extracted once
+        per parse. Must be called with the lock held.
+        """
+        if self.diagnostics == None or self.diagnostics[0] != self.generation:
+            self.diagnostics = (self.generation, get_diagnostics(self.var))
+        return self.diagnostics[1]
+
+    def update_includes(self):
+        # Must be called with the lock held (or before the tu is shared)
+        includes = list(self.var.get_includes())
+        self.includes = set([normalize_path(inc.include.name) for inc in includes])
+        if self.pch != None:
+            # libclang doesn't list what came from the precompiled header
+            self.includes.update([normalize_path(f) for f in self.pch.includes])
+        companionIndex.set_includes(self.fn, [inc.include.name for inc in includes if inc.depth == 1])
 
     def quickpanel_format(self, cursor):
         return ["%s::%s" % (cursor.get_semantic_parent().spelling,
@@ -901,103 +1200,195 @@ class LockedTranslationUnit(LockedVariable):
                 word_under_cursor = match.group(1)
         return cursor, cursor_spelling, word_under_cursor
 
-    def get_implementation(self, data, offset, found_callback, folders):
-        target = None
+    def locate(self, kind, data, offset):
+        """
+        Finds what a goto of the given kind ("definition", "implementation"
+        or "references") can from the translation unit alone. Returns the
+        plan finish_goto completes with what needs the project, which is
+        plain data so that it can come from a worker process.
+        """
         try:
             self.lock()
+            if kind == "references":
+                # Not reparsed since the index is only as current as the
+                # last reparse anyway
+                cursor, cursor_spelling, word_under_cursor = self.get_impdef_prep(data, offset)
+                return {"references": get_cursor_usr(cursor)}
             self.var.reparse([(self.fn, data)])
             cursor, cursor_spelling, word_under_cursor = self.get_impdef_prep(data, offset)
             if len(word_under_cursor) == 0:
-                found_callback(None)
-                return
-            if cursor == None or cursor.kind.is_invalid() or cursor_spelling != word_under_cursor:
-                if cursor == None or cursor.kind.is_invalid():
-                    cursor = None
-                ExtensiveSearch(cursor, word_under_cursor, found_callback, folders, self.opts, self.opts_script)
-                return
-            d = cursor.get_definition()
-            if d != None and cursor != d:
-                target = format_cursor(d)
-            elif d != None and cursor == d and \
-                    (cursor.kind == cindex.CursorKind.VAR_DECL or \
-                    cursor.kind == cindex.CursorKind.PARM_DECL or \
-                    cursor.kind == cindex.CursorKind.FIELD_DECL):
-                for child in cursor.get_children():
-                    if child.kind == cindex.CursorKind.TYPE_REF:
-                        d = child.get_definition()
-                        if d != None:
-                            target = format_cursor(d)
-                        break
-            elif cursor.kind == cindex.CursorKind.CLASS_DECL:
-                for child in cursor.get_children():
-                    if child.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
-                        d = child.get_definition()
-                        if d != None:
-                            target = format_cursor(d)
-            elif d == None:
-                if cursor.kind == cindex.CursorKind.DECL_REF_EXPR or \
-                        cursor.kind == cindex.CursorKind.MEMBER_REF_EXPR or \
-                        cursor.kind == cindex.CursorKind.CALL_EXPR:
-                    cursor = cursor.get_reference()
-
-                if cursor.kind == cindex.CursorKind.CXX_METHOD or \
-                        cursor.kind == cindex.CursorKind.FUNCTION_DECL or \
-                        cursor.kind == cindex.CursorKind.CONSTRUCTOR or \
-                        cursor.kind == cindex.CursorKind.DESTRUCTOR:
-                    f = cursor.location.file.name
-                    if f.endswith(".h"):
-                        endings = ["cpp", "c", "cc", "m", "mm"]
-                        for ending in endings:
-                            f = "%s.%s" % (f[:f.rfind(".")], ending)
-                            if f != self.fn and os.access(f, os.R_OK):
-                                tu2 = tuCache.get_translation_unit(f, self.opts, self.opts_script)
-                                if tu2 == None:
-                                    continue
-                                tu2.lock()
-                                try:
-                                    cursor2 = cindex.Cursor.get(
-                                            tu2.var, cursor.location.file.name,
-                                            cursor.location.line,
-                                            cursor.location.column)
-                                    if cursor2 != None:
-                                        d = cursor2.get_definition()
-                                        if d != None and cursor2 != d:
-                                            target = format_cursor(d)
-                                            break
-                                finally:
-                                    tu2.unlock()
-                    if not target:
-                        ExtensiveSearch(cursor, word_under_cursor, found_callback, folders, self.opts, self.opts_script)
-                        return
-            else:
-                target = format_cursor(d)
+                return {}
+            if kind == "definition":
+                return self.locate_definition(cursor, word_under_cursor)
+            return self.locate_implementation(cursor, cursor_spelling, word_under_cursor)
         finally:
             self.unlock()
-        found_callback(target)
 
-    def get_definition(self, data, offset, found_callback, folders):
+    def locate_definition(self, cursor, word_under_cursor):
+        ref = cursor.get_reference()
+        if ref != None:
+            return {"target": format_cursor(ref)}
+        elif cursor.kind == cindex.CursorKind.INCLUSION_DIRECTIVE:
+            f = cursor.get_included_file()
+            if not f is None:
+                return {"target": f.name}
+            return {}
+        return {"index": get_index_lookup(None, word_under_cursor, False)}
+
+    def locate_implementation(self, cursor, cursor_spelling, word_under_cursor):
+        if cursor == None or cursor.kind.is_invalid() or cursor_spelling != word_under_cursor:
+            search = {"cursor": None, "word": word_under_cursor}
+            if cursor != None and not cursor.kind.is_invalid():
+                search["cursor"] = format_cursor(cursor)
+            return {"index": get_index_lookup(None, word_under_cursor, True), "search": search}
         target = None
+        d = cursor.get_definition()
+        if d != None and cursor != d:
+            target = format_cursor(d)
+        elif d != None and cursor == d and \
+                (cursor.kind == cindex.CursorKind.VAR_DECL or \
+                cursor.kind == cindex.CursorKind.PARM_DECL or \
+                cursor.kind == cindex.CursorKind.FIELD_DECL):
+            for child in cursor.get_children():
+                if child.kind == cindex.CursorKind.TYPE_REF:
+                    d = child.get_definition()
+                    if d != None:
+                        target = format_cursor(d)
+                    break
+        elif cursor.kind == cindex.CursorKind.CLASS_DECL:
+            for child in cursor.get_children():
+                if child.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
+                    d = child.get_definition()
+                    if d != None:
+                        target = format_cursor(d)
+        elif d == None:
+            if cursor.kind == cindex.CursorKind.DECL_REF_EXPR or \
+                    cursor.kind == cindex.CursorKind.MEMBER_REF_EXPR or \
+                    cursor.kind == cindex.CursorKind.CALL_EXPR:
+                cursor = cursor.get_reference()
+
+            if cursor.kind == cindex.CursorKind.CXX_METHOD or \
+                    cursor.kind == cindex.CursorKind.FUNCTION_DECL or \
+                    cursor.kind == cindex.CursorKind.CONSTRUCTOR or \
+                    cursor.kind == cindex.CursorKind.DESTRUCTOR:
+                plan = {
+                    "index": get_index_lookup(cursor, word_under_cursor, True),
+                    "search": {"cursor": format_cursor(cursor), "word": word_under_cursor}
+                }
+                f = cursor.location.file
+                if f != None and is_header(f.name):
+                    plan["companion"] = [f.name, cursor.location.line, cursor.location.column]
+                return plan
+        else:
+            target = format_cursor(d)
+        return {"target": target}
+
+    def goto(self, kind, data, offset, found_callback, folders):
+        finish_goto(self.locate(kind, data, offset), self.fn, found_callback, folders,
+                    self.opts, self.opts_script,
+                    lambda source, location: find_in_companion(source, location, self.opts, self.opts_script))
+
+    def get_implementation(self, data, offset, found_callback, folders):
+        self.goto("implementation", data, offset, found_callback, folders)
+
+    def get_definition(self, data, offset, found_callback, folders):
+        self.goto("definition", data, offset, found_callback, folders)
+
+    def find_references(self, data, offset, found_callback, folders):
+        """
+        Looks up the declarations of and references to the symbol under the
+        cursor in the project's symbol index.
+        """
+        self.goto("references", data, offset, found_callback, folders)
+
+
+
+include_re = re.compile(r"#\s*(include|import)\s*([<\"])([^>\"]+)[>\"]")
+block_comment_re = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+def get_include_prefix(filename):
+    """
+    Returns the #include lines at the start of filename as a tuple.
+    Quoted includes found next to the file are made absolute so that the
+    lines mean the same thing in any file.
+    """
+    try:
+        f = open(filename)
         try:
-            self.lock()
-            self.var.reparse([(self.fn, data)])
-            cursor, cursor_spelling, word_under_cursor = self.get_impdef_prep(data, offset)
-            if len(word_under_cursor) == 0:
-                found_callback(None)
-                return
-            ref = cursor.get_reference()
-            target = None
-
-            if ref != None:
-                target = format_cursor(ref)
-            elif cursor.kind == cindex.CursorKind.INCLUSION_DIRECTIVE:
-                f = cursor.get_included_file()
-                if not f is None:
-                    target = f.name
+            data = f.read(65536)
         finally:
-            self.unlock()
+            f.close()
+    except (IOError, UnicodeDecodeError):
+        return ()
+    data = block_comment_re.sub("", data)
+    dirname = os.path.dirname(filename)
+    ret = []
+    for line in data.split("\n"):
+        line = line.strip()
+        if len(line) == 0 or line.startswith("//") or line.startswith("#pragma once"):
+            continue
+        match = include_re.match(line)
+        if match == None:
+            break
+        name = match.group(3)
+        if match.group(2) == "\"" and os.path.isfile(os.path.join(dirname, name)):
+            name = os.path.abspath(os.path.join(dirname, name)).replace("\\", "/")
+            ret.append("#%s \"%s\"" % (match.group(1), name))
+        else:
+            ret.append(line[:match.end()])
+    return tuple(ret)
+
+
+def get_common_include_prefix(prefixes, min_files, min_includes):
+    """
+    Returns the longest include prefix shared by at least min_files of the
+    given prefixes, or None if there's no such prefix with at least
+    min_includes lines.
+    """
+    counts = {}
+    for prefix in prefixes:
+        for i in range(min_includes, len(prefix)+1):
+            counts[prefix[:i]] = counts.get(prefix[:i], 0) + 1
+    best = None
+    for prefix, count in counts.items():
+        if count >= min_files and (best == None or len(prefix) > len(best)):
+            best = prefix
+    return best
+
+
+def get_pch_args(args):
+    """Returns the arguments for parsing the prefix header as a header."""
+    args = list(args)
+    if "-x" in args:
+        i = args.index("-x") + 1
+        if i < len(args) and not args[i].endswith("-header"):
+            args[i] = "%s-header" % args[i]
+    elif "-ObjC++" in args:
+        args.extend(["-x", "objective-c++-header"])
+    elif "-ObjC" in args:
+        args.extend(["-x", "objective-c-header"])
+    return args
+
+
+class SharedPch(object):
+    """A precompiled header built from an include prefix shared by several files."""
+    def __init__(self, filename, prefix, includes, build_time):
+        self.filename = filename
+        self.prefix = prefix
+        self.includes = includes
+        self.build_time = build_time
 
-        found_callback(target)
+    def matches(self, prefix):
+        return prefix[:len(self.prefix)] == self.prefix
 
+    def is_stale(self):
+        for filename in self.includes:
+            try:
+                if os.path.getmtime(filename) > self.build_time:
+                    return True
+            except OSError:
+                return True
+        return False
 
 
 class TranslationUnitCache(Worker):
@@ -1015,8 +1406,12 @@ class TranslationUnitCache(Worker):
         self.translationUnits = LockedVariable({})
         self.parsingList = LockedVariable([])
         self.busyList = LockedVariable([])
+        self.includers = LockedVariable({})
+        self.pch_groups = LockedVariable({})
         self.index_parse_options = 13
         self.index = None
+        self.scratch_index = None
+        self.scratch_slots = threading.Semaphore(max(1, get_setting("scratch_parse_threadcount", 2)))
         self.debug_options = False
         self.__options_cache = LockedVariable({})
 
@@ -1092,11 +1487,24 @@ class TranslationUnitCache(Worker):
         try:
             self.set_status("Reparsing %s" % filename)
             tu = self.get_translation_unit(filename, opts, opts_script, unsaved_files)
-            if tu != None:
+            if tu != None and tu.pch != None and tu.pch.is_stale():
+                # Reparsing would just complain about the precompiled
+                # header being out of date
+                self.drop_translation_unit(filename)
+                tu = self.get_translation_unit(filename, opts, opts_script, unsaved_files, tu.parse_options)
+            elif tu != None:
                 tu.lock()
                 try:
+                    parse_time = time.time()
                     tu.var.reparse(unsaved_files)
                     tu.cache = Cache(tu.var, filename)
+                    old_includes = tu.includes
+                    tu.update_includes()
+                    tu.dirty = False
+                    tu.parse_time = parse_time
+                    tu.generation = next_generation()
+                    self.update_include_graph(filename, old_includes, tu.includes)
+                    symbolIndexer.index_translation_unit(filename, tu)
                     self.set_status("Reparsing %s done" % filename)
                 finally:
                     tu.unlock()
@@ -1114,25 +1522,136 @@ class TranslationUnitCache(Worker):
         tus = self.translationUnits.lock()
         try:
             tus.clear()
-            searchcache.clear()
         finally:
             self.translationUnits.unlock()
+        includers = self.includers.lock()
+        try:
+            includers.clear()
+        finally:
+            self.includers.unlock()
         cache = self.__options_cache.lock()
         try:
             cache.clear()
         finally:
             self.__options_cache.unlock()
+        groups = self.pch_groups.lock()
+        try:
+            groups.clear()
+        finally:
+            self.pch_groups.unlock()
+        self.remove_unused_pchs()
+
+    def drop_translation_unit(self, filename):
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                self.update_include_graph(filename, tus[filename].includes, set())
+                del tus[filename]
+        finally:
+            self.translationUnits.unlock()
+
+    def get_shared_pch(self, filename, args):
+        """
+        Records the include prefix of filename among the files parsed with
+        the same arguments, and returns the SharedPch to parse it with, if
+        there is one. Once enough files share an include prefix, building
+        a precompiled header for it is queued.
+        """
+        if not get_setting("shared_pch", True):
+            return None
+        prefix = get_include_prefix(filename)
+        key = tuple(args)
+        groups = self.pch_groups.lock()
+        try:
+            group = groups.get(key)
+            if group == None:
+                group = {"prefixes": {}, "pch": None, "building": False}
+                groups[key] = group
+            group["prefixes"][filename] = prefix
+            pch = group["pch"]
+            if pch != None and pch.is_stale():
+                pch = group["pch"] = None
+            common = get_common_include_prefix(group["prefixes"].values(),
+                                               get_setting("shared_pch_min_files", 3),
+                                               get_setting("shared_pch_min_includes", 2))
+            if common != None and not group["building"] and (pch == None or pch.prefix != common):
+                group["building"] = True
+                self.tasks.put((self.task_build_pch, (key, common)))
+            if pch != None and pch.matches(prefix):
+                return pch
+            return None
+        finally:
+            self.pch_groups.unlock()
+
+    def task_build_pch(self, data):
+        key, prefix = data
+        name = hashlib.md5(bencode("\n".join(key + prefix))).hexdigest()
+        header = os.path.join(get_cache_dir(), "pch-%s.h" % name)
+        output = os.path.join(get_cache_dir(), "pch-%s-%d.pch" % (name, int(time.time() * 1000)))
+        pch = None
+        try:
+            self.set_status("Building shared precompiled header for %d includes" % len(prefix))
+            f = open(header, "w")
+            try:
+                f.write("\n".join(prefix) + "\n")
+            finally:
+                f.close()
+            if self.index == None:
+                self.index = cindex.Index.create()
+            build_time = time.time()
+            args = get_pch_args(key)
+            args.append(header)
+            # CXTranslationUnit_Incomplete | CXTranslationUnit_ForSerialization
+            tu = self.index.parse(None, args, [], 0x12)
+            if tu != None:
+                errors = [d for d in tu.diagnostics if d.severity >= cindex.Diagnostic.Error]
+                if len(errors) == 0 and tu.save(output):
+                    includes = [inc.include.name for inc in tu.get_includes()]
+                    pch = SharedPch(output, prefix, includes, build_time)
+                    self.set_status("Built shared precompiled header %s" % output)
+        finally:
+            groups = self.pch_groups.lock()
+            try:
+                group = groups.get(key)
+                if group != None:
+                    group["building"] = False
+                    if pch != None:
+                        group["pch"] = pch
+            finally:
+                self.pch_groups.unlock()
+        self.remove_unused_pchs()
+
+    def remove_unused_pchs(self):
+        """Deletes the precompiled headers no longer used by anything."""
+        used = set()
+        groups = self.pch_groups.lock()
+        try:
+            for group in groups.values():
+                if group["pch"] != None:
+                    used.add(group["pch"].filename)
+        finally:
+            self.pch_groups.unlock()
+        tus = self.translationUnits.lock()
+        try:
+            for tu in tus.values():
+                if tu.pch != None:
+                    used.add(tu.pch.filename)
+        finally:
+            self.translationUnits.unlock()
+        cache_dir = get_cache_dir()
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.startswith("pch-") and name.endswith(".pch") and path not in used:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
 
     def task_remove(self, data):
         if self.add_busy(data, self.task_remove, data):
             return
         try:
-            tus = self.translationUnits.lock()
-            try:
-                if data in tus:
-                    del tus[data]
-            finally:
-                self.translationUnits.unlock()
+            self.drop_translation_unit(data)
             cache = self.__options_cache.lock()
             try:
                 if data in cache:
@@ -1187,6 +1706,104 @@ class TranslationUnitCache(Worker):
             self.parsingList.unlock()
         return ret
 
+    def update_include_graph(self, filename, old_includes, new_includes):
+        includers = self.includers.lock()
+        try:
+            for inc in old_includes - new_includes:
+                s = includers.get(inc)
+                if s != None:
+                    s.discard(filename)
+                    if len(s) == 0:
+                        del includers[inc]
+            for inc in new_includes - old_includes:
+                includers.setdefault(inc, set()).add(filename)
+        finally:
+            self.includers.unlock()
+
+    def files_changed(self, paths):
+        """
+        Marks the cached translation units that are older than the given
+        normalized paths that changed on disk dirty, and returns their
+        filenames.
+        """
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                # Removed
+                mtimes[path] = time.time()
+        affected = {}
+        includers = self.includers.lock()
+        try:
+            for path in paths:
+                for filename in includers.get(path, set()):
+                    affected[filename] = max(affected.get(filename, 0), mtimes[path])
+        finally:
+            self.includers.unlock()
+        ret = []
+        tus = self.translationUnits.lock()
+        try:
+            for filename, tu in tus.items():
+                mtime = max(affected.get(filename, 0), mtimes.get(normalize_path(filename), 0))
+                if mtime > tu.parse_time:
+                    tu.dirty = True
+                if tu.dirty:
+                    ret.append(filename)
+            return sorted(ret)
+        finally:
+            self.translationUnits.unlock()
+
+    def reparse_dirty(self, filename, on_done=None):
+        """
+        Queues a reparse of filename with the options it was parsed with,
+        if it's still dirty. Returns whether a reparse was queued.
+        """
+        tus = self.translationUnits.lock()
+        try:
+            tu = tus.get(filename)
+        finally:
+            self.translationUnits.unlock()
+        if tu == None or not tu.dirty:
+            return False
+        pl = self.parsingList.lock()
+        try:
+            if filename in pl:
+                return False
+            pl.append(filename)
+        finally:
+            self.parsingList.unlock()
+        # The dirty buffers are read from their views, which is only done
+        # in the main thread
+        run_in_main_thread(lambda: self.tasks.put((
+            self.task_reparse,
+            (filename, tu.opts, tu.opts_script, unsaved_buffers.get(filename, tu.includes), on_done))))
+        return True
+
+    def get_dependents(self, filename):
+        """
+        Returns the files of the cached translation units that include
+        filename, directly or indirectly.
+        """
+        includers = self.includers.lock()
+        try:
+            return [f for f in includers.get(normalize_path(filename), set()) if f != filename]
+        finally:
+            self.includers.unlock()
+
+    def get_includes(self, filename):
+        """
+        Returns the normalized paths of the files included by the cached
+        translation unit for filename, or None if it isn't in the cache.
+        """
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                return tus[filename].includes
+        finally:
+            self.translationUnits.unlock()
+        return None
+
     def get_opts_script(self, view):
         return expand_path(get_setting("options_script", "", view), view.window())
 
@@ -1203,20 +1820,17 @@ class TranslationUnitCache(Worker):
         finally:
             self.__options_cache.unlock()
 
-    def get_opts(self, view):
-        key = view.file_name()
-        cache = self.__options_cache.lock()
-        try:
-            if key in cache:
-                return list(cache[key][1])
-        finally:
-            self.__options_cache.unlock()
-
+    def get_base_opts(self, view):
+        """Returns the options of view that don't depend on the language."""
         opts = get_path_setting("options", [], view)
         if not get_setting("dont_prepend_clang_includes", False, view):
             opts.insert(0, "-I%s/clang/include" % scriptpath)
+        return opts
+
+    def get_language_opts(self, view, language):
+        """Returns the options of view for files in the given language."""
+        opts = []
         if get_setting("add_language_option", True, view):
-            language = get_language(view)
             if language == "objc":
                 opts.append("-ObjC")
             elif language == "objc++":
@@ -1227,6 +1841,19 @@ class TranslationUnitCache(Worker):
             additional_language_options = get_setting("additional_language_options", {}, view)
             if language in additional_language_options:
                 opts.extend(additional_language_options[language] or [])
+        return opts
+
+    def get_opts(self, view):
+        key = view.file_name()
+        cache = self.__options_cache.lock()
+        try:
+            if key in cache:
+                return list(cache[key][1])
+        finally:
+            self.__options_cache.unlock()
+
+        opts = self.get_base_opts(view)
+        opts.extend(self.get_language_opts(view, get_language(view)))
         self.debug_options = get_setting("debug_options", False)
         self.index_parse_options = get_setting("index_parse_options", 13, view)
         if view.window() != None:
@@ -1240,7 +1867,9 @@ class TranslationUnitCache(Worker):
                 view.settings().add_on_change("sublimeclang.opts", lambda: run_in_main_thread(lambda: self.check_opts(view)))
         return list(opts)
 
-    def get_translation_unit(self, filename, opts=[], opts_script=None, unsaved_files=[]):
+    def get_translation_unit(self, filename, opts=[], opts_script=None, unsaved_files=[], parse_options=None):
+        if parse_options == None:
+            parse_options = self.index_parse_options
         if self.index == None:
             self.index = cindex.Index.create()
         tu = None
@@ -1248,35 +1877,25 @@ class TranslationUnitCache(Worker):
         if filename not in tus:
             self.translationUnits.unlock()
             pre_script_opts = list(opts)
-            opts2 = []
-            for option in opts:
-                opts2.extend(complete_path(option))
-            opts = opts2
-
-            if opts_script:
-                # shlex.split barfs if fed with an unicode strings
-                args = shlex.split(sencode(opts_script)) + [filename]
-                process = subprocess.Popen(args, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-                output = process.communicate()
-                if process.returncode:
-                    print("The options_script failed with code [%s]" % process.returncode)
-                    print(output[1])
-                else:
-                    opts += shlex.split(bdecode(output[0]))
+            opts = get_compile_args(filename, opts, opts_script)
+            pch = self.get_shared_pch(filename, opts)
+            if pch != None:
+                opts.extend(["-include-pch", pch.filename])
 
             if self.debug_options:
                 print("Will compile file %s with the following options:\n%s" % (filename, opts))
 
             opts.append(filename)
-            tu = self.index.parse(None, opts, unsaved_files,
-                                  self.index_parse_options)
+            tu = self.index.parse(None, opts, unsaved_files, parse_options)
             if tu != None:
-                tu = LockedTranslationUnit(tu, filename)
+                tu = LockedTranslationUnit(tu, filename, pch)
                 tu.opts = pre_script_opts
                 tu.opts_script = opts_script
+                tu.parse_options = parse_options
                 tus = self.translationUnits.lock()
                 tus[filename] = tu
                 self.translationUnits.unlock()
+                self.update_include_graph(filename, set(), tu.includes)
             else:
                 print("tu is None...")
         else:
@@ -1284,6 +1903,7 @@ class TranslationUnitCache(Worker):
             recompile = tu.opts != opts or tu.opts_script != opts_script
 
             if recompile:
+                self.update_include_graph(filename, tu.includes, set())
                 del tus[filename]
             self.translationUnits.unlock()
 
@@ -1292,6 +1912,37 @@ class TranslationUnitCache(Worker):
                 self.add_ex(filename, opts, opts_script, None)
         return tu
 
+    def get_scratch_translation_unit(self, filename, opts=[], opts_script=None):
+        """
+        Returns the cached translation unit of filename if there is one.
+        Otherwise a declaration-only translation unit is parsed, without
+        preamble or completion caching and without adding it to the cache.
+        Only "scratch_parse_threadcount" of those exist at the same time.
+        Either way the caller must call release() on it when done.
+        """
+        tus = self.translationUnits.lock()
+        try:
+            if filename in tus:
+                return tus[filename]
+        finally:
+            self.translationUnits.unlock()
+
+        self.scratch_slots.acquire()
+        tu = None
+        try:
+            if self.scratch_index == None:
+                self.scratch_index = cindex.Index.create()
+            opts = get_compile_args(filename, opts, opts_script)
+            opts.append(filename)
+            tu = self.scratch_index.parse(None, opts, [],
+                                          get_setting("scratch_parse_options", 64))
+        finally:
+            if tu == None:
+                self.scratch_slots.release()
+        if tu == None:
+            return None
+        return ScratchTranslationUnit(tu, filename, self.scratch_slots)
+
     def remove(self, filename):
         self.tasks.put((self.task_remove, filename))
 
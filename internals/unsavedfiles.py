@@ -0,0 +1,197 @@
+"""
+Copyright (c) 2011-2012 Fredrik Ehnbom
+
+This software is provided 'as-is', without any express or implied
+warranty. In no event will the authors be held liable for any damages
+arising from the use of this software.
+
+Permission is granted to anyone to use this software for any purpose,
+including commercial applications, and to alter it and redistribute it
+freely, subject to the following restrictions:
+
+   1. The origin of this software must not be misrepresented; you must not
+   claim that you wrote the original software. If you use this software
+   in a product, an acknowledgment in the product documentation would be
+   appreciated but is not required.
+
+   2. Altered source versions must be plainly marked as such, and must not be
+   misrepresented as being the original software.
+
+   3. This notice may not be removed or altered from any source
+   distribution.
+"""
+
+import threading
+
+from .common import bencode, normalize_path
+from .clang import cindex
+
+
+def encode_buffer(data):
+    if not isinstance(data, bytes):
+        data = data.encode("utf-8")
+    return data
+
+
+class UnsavedBuffer(object):
+    def __init__(self, name):
+        self.name = name
+        self.key = normalize_path(name)
+        self.raw_name = bencode(name)
+        self.change_count = None
+        self.contents = None
+        self.native = None
+        self.get_change_count = None
+        self.get_data = None
+
+
+class UnsavedBuffers(object):
+    """
+    A registry of the dirty buffers of all open views. Each buffer is
+    encoded once per change count, together with a ready made
+    _CXUnsavedFile array pointing at it, so that completions and reparses
+    can hand it to libclang without copying it again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.combined = {}
+        self.last_copied = 0
+        self.last_size = 0
+        self.total_copied = 0
+        self.total_size = 0
+
+    def get_buffer(self, filename):
+        self.lock.acquire()
+        try:
+            buf = self.buffers.get(filename)
+            if buf is None:
+                buf = UnsavedBuffer(filename)
+                self.buffers[filename] = buf
+            return buf
+        finally:
+            self.lock.release()
+
+    def refresh(self, buf, change_count, get_data):
+        uptodate = change_count != None and buf.change_count == change_count and \
+                   buf.native != None
+        if uptodate:
+            return 0
+        contents = encode_buffer(get_data())
+        native = (cindex._CXUnsavedFile * 1)()
+        native[0].name = buf.raw_name
+        native[0].contents = contents
+        native[0].length = len(contents)
+        self.lock.acquire()
+        try:
+            buf.contents = contents
+            buf.native = native
+            buf.change_count = change_count
+        finally:
+            self.lock.release()
+        return len(contents)
+
+    def track(self, filename, get_change_count, get_data):
+        """
+        Register a dirty buffer so that it can be handed to libclang for any
+        translation unit including it. get_change_count should return None
+        once the buffer is no longer dirty. Nothing is encoded until the
+        buffer is actually asked for.
+        """
+        buf = self.get_buffer(filename)
+        buf.get_change_count = get_change_count
+        buf.get_data = get_data
+
+    def get(self, filename, includes=None):
+        """
+        Return a _CXUnsavedFile array with the tracked dirty buffers of
+        filename and of the files in includes. If includes is None, every
+        tracked dirty buffer is returned.
+        """
+        self.lock.acquire()
+        try:
+            buffers = list(self.buffers.values())
+        finally:
+            self.lock.release()
+
+        copied = 0
+        size = 0
+        selected = []
+        for buf in buffers:
+            if buf.name != filename and includes != None and buf.key not in includes:
+                continue
+            if buf.get_change_count == None:
+                continue
+            change_count = buf.get_change_count()
+            if change_count == None:
+                self.remove(buf.name)
+                continue
+            copied += self.refresh(buf, change_count, buf.get_data)
+            size += len(buf.contents)
+            selected.append(buf)
+        self.account(copied, size)
+
+        if len(selected) == 0:
+            return []
+        elif len(selected) == 1:
+            return selected[0].native
+
+        selected.sort(key=lambda b: b.key)
+        key = tuple([(b.key, b.change_count) for b in selected])
+        self.lock.acquire()
+        try:
+            if filename in self.combined and self.combined[filename][0] == key:
+                return self.combined[filename][1]
+        finally:
+            self.lock.release()
+
+        # Only the pointers are copied here, the contents are shared with
+        # the individual buffers.
+        native = (cindex._CXUnsavedFile * len(selected))()
+        for i, buf in enumerate(selected):
+            native[i] = buf.native[0]
+        self.lock.acquire()
+        try:
+            self.combined[filename] = (key, native)
+        finally:
+            self.lock.release()
+        return native
+
+    def account(self, copied, size):
+        self.lock.acquire()
+        try:
+            self.last_copied = copied
+            self.last_size = size
+            self.total_copied += copied
+            self.total_size += size
+        finally:
+            self.lock.release()
+
+    def remove(self, filename):
+        self.lock.acquire()
+        try:
+            if filename in self.buffers:
+                del self.buffers[filename]
+            if filename in self.combined:
+                del self.combined[filename]
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.buffers.clear()
+            self.combined.clear()
+        finally:
+            self.lock.release()
+
+    def format_stats(self):
+        self.lock.acquire()
+        try:
+            return "copied %d of %d bytes (%d of %d in total)" % \
+                (self.last_copied, self.last_size, self.total_copied, self.total_size)
+        finally:
+            self.lock.release()
+
+
+unsaved_buffers = UnsavedBuffers()
@@ -25,6 +25,7 @@ freely, subject to the following restrictions:
 #include <string>
 #include <string.h>
 #include <vector>
+#include <deque>
 #include <map>
 #include <algorithm>
 #include <assert.h>
@@ -1477,10 +1478,164 @@ void NamespaceVisitorData::execute()
         trim(mEntries);
 }
 
+struct PackedDiagnostic
+{
+    unsigned int severity;
+    unsigned int file;
+    unsigned int line;
+    unsigned int column;
+    const char * spelling;
+    const char * disableOption;
+    unsigned int fixitStart;
+    unsigned int fixitCount;
+};
+
+struct PackedFixIt
+{
+    unsigned int file;
+    unsigned int startLine;
+    unsigned int startColumn;
+    unsigned int endLine;
+    unsigned int endColumn;
+    const char * value;
+};
+
+struct PackedDiagnostics
+{
+    unsigned int       count;
+    PackedDiagnostic * diagnostics;
+    unsigned int       fileCount;
+    const char **      files;
+    unsigned int       fixitCount;
+    PackedFixIt *      fixits;
+};
+
+// All the diagnostics of a translation unit in flat arrays, with the file
+// names interned so that a diagnostic just refers to its file by index.
+// File 0 is the empty name of diagnostics without a location.
+class DiagnosticResults : public PackedDiagnostics
+{
+public:
+    DiagnosticResults(CXTranslationUnit tu)
+    {
+        mFiles.push_back(store(std::string()));
+        unsigned int num = clang_getNumDiagnostics(tu);
+        mDiagnostics.reserve(num);
+        for (unsigned int i = 0; i < num; i++)
+        {
+            CXDiagnostic diag = clang_getDiagnostic(tu, i);
+            PackedDiagnostic d;
+            d.severity = clang_getDiagnosticSeverity(diag);
+            d.file = getLocation(clang_getDiagnosticLocation(diag), d.line, d.column);
+            d.spelling = store(clang_getDiagnosticSpelling(diag));
+            CXString disable;
+            clang_disposeString(clang_getDiagnosticOption(diag, &disable));
+            d.disableOption = store(disable);
+            d.fixitStart = mFixits.size();
+            d.fixitCount = clang_getDiagnosticNumFixIts(diag);
+            for (unsigned int j = 0; j < d.fixitCount; j++)
+            {
+                CXSourceRange range;
+                PackedFixIt f;
+                f.value = store(clang_getDiagnosticFixIt(diag, j, &range));
+                f.file = getLocation(clang_getRangeStart(range), f.startLine, f.startColumn);
+                getLocation(clang_getRangeEnd(range), f.endLine, f.endColumn);
+                mFixits.push_back(f);
+            }
+            mDiagnostics.push_back(d);
+            clang_disposeDiagnostic(diag);
+        }
+        count = mDiagnostics.size();
+        diagnostics = count ? &mDiagnostics[0] : NULL;
+        fileCount = mFiles.size();
+        files = &mFiles[0];
+        fixitCount = mFixits.size();
+        fixits = fixitCount ? &mFixits[0] : NULL;
+    }
+
+private:
+    unsigned int getLocation(CXSourceLocation loc, unsigned int &line, unsigned int &column)
+    {
+        CXFile file;
+        unsigned int offset;
+        clang_getInstantiationLocation(loc, &file, &line, &column, &offset);
+        if (file == NULL)
+            return 0;
+        FileMap::iterator i = mFileIds.find(file);
+        if (i != mFileIds.end())
+            return i->second;
+        unsigned int id = mFiles.size();
+        mFiles.push_back(store(clang_getFileName(file)));
+        mFileIds[file] = id;
+        return id;
+    }
+
+    const char * store(CXString str)
+    {
+        const char *cstr = clang_getCString(str);
+        const char *ret = store(std::string(cstr ? cstr : ""));
+        clang_disposeString(str);
+        return ret;
+    }
+
+    const char * store(const std::string &str)
+    {
+        // A deque doesn't move its elements when growing, so the
+        // returned pointers stay valid
+        mStrings.push_back(str);
+        return mStrings.back().c_str();
+    }
+
+    typedef std::map<CXFile, unsigned int> FileMap;
+    FileMap                       mFileIds;
+    std::deque<std::string>       mStrings;
+    std::vector<const char*>      mFiles;
+    std::vector<PackedDiagnostic> mDiagnostics;
+    std::vector<PackedFixIt>      mFixits;
+};
+
+struct ChildrenData
+{
+    int           kind;
+    CXCursor*     children;
+    unsigned int  size;
+    unsigned int  count;
+};
+
+CXChildVisitResult get_children_visitor(CXCursor cursor, CXCursor parent, CXClientData client_data)
+{
+    ChildrenData *data = (ChildrenData*) client_data;
+    if (clang_Cursor_isNull(cursor) || (data->kind >= 0 && cursor.kind != data->kind))
+        return CXChildVisit_Continue;
+    // Counted even when there's no room left, so that the caller knows how
+    // big an array is needed
+    if (data->count < data->size)
+        data->children[data->count] = cursor;
+    data->count++;
+    return CXChildVisit_Continue;
+}
+
 
 extern "C"
 {
 
+EXPORT unsigned int cursor_getChildren(CXCursor parent, int kind, CXCursor *children, unsigned int size)
+{
+    ChildrenData data = {kind, children, size, 0};
+    clang_visitChildren(parent, get_children_visitor, &data);
+    return data.count;
+}
+
+EXPORT PackedDiagnostics* diagnostics_get(CXTranslationUnit tu)
+{
+    return new DiagnosticResults(tu);
+}
+
+EXPORT void diagnostics_dispose(PackedDiagnostics *diagnostics)
+{
+    delete static_cast<DiagnosticResults*>(diagnostics);
+}
+
 EXPORT CacheCompletionResults* cache_clangComplete(Cache* cache, const char *filename, unsigned int row, unsigned int col, CXUnsavedFile *unsaved, unsigned int usLength, bool memberCompletion)
 {
     return cache->clangComplete(filename, row, col, unsaved, usLength, memberCompletion);
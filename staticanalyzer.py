@@ -21,86 +21,32 @@ freely, subject to the following restrictions:
    distribution.
 """
 
+import bisect
 import os
 import subprocess
 import sublime
 import sublime_plugin
-import time
+import tempfile
+from collections import deque
 import threading
 import traceback
+from xml.parsers import expat
 try:
     import Queue
-    from internals.common import get_setting, get_cpu_count, Worker
+    from internals.common import get_setting, get_cpu_count, get_free_memory, Worker, \
+        get_compile_args, is_supported_language, sencode, get_file_language, LANGUAGES
+    from internals import translationunitcache
+    from internals.fileinventory import fileInventory
+    from internals.plistreader import PlistReader
+    from internals.analyzercache import analyzerCache, get_key, parse_dependencies
 except:
     import queue as Queue
-    from .internals.common import get_setting, get_cpu_count, Worker
-
-
-def parse(l):
-    start = 0
-    i = 0
-    contents = ""
-    key = ""
-    pos = -1
-    containerList = []
-    keyList = []
-    result = None
-    indent = ""
-
-    while i < len(l):
-        c = l[i]
-        if c == "<":
-            contents = l[start:i]
-            start = i + 1
-        elif c == ">":
-            tag = l[start:i]
-            if tag[0] != "/":
-                indent += "\t"
-            if tag[0] == "/":
-                indent = indent[:-1]
-
-            start = i + 1
-            if tag == "/integer":
-                contents = int(contents)
-                if len(key) > 0:
-                    containerList[pos][key] = contents
-                else:
-                    containerList[pos].append(contents)
-                key = ""
-            elif tag == "/string":
-                if len(key) > 0:
-                    containerList[pos][key] = contents
-                else:
-                    containerList[pos].append(contents)
-                key = ""
-            elif tag == "/key":
-                key = contents
-            elif tag == "dict":
-                containerList.append({})
-                keyList.append(key)
-                key = ""
-                pos += 1
-            elif tag == "array":
-                containerList.append([])
-                keyList.append(key)
-                key = ""
-                pos += 1
-            elif tag == "/array" or tag == "/dict":
-                pos -= 1
-                cont = containerList.pop()
-                cur = None if pos == -1 else containerList[pos]
-                key = keyList.pop()
-
-                if len(containerList) == 0:
-                    result = cont
-                else:
-                    if len(key) > 0:
-                        cur[key] = cont
-                        key = ""
-                    else:
-                        cur.append(cont)
-        i += 1
-    return result
+    from .internals.common import get_setting, get_cpu_count, get_free_memory, Worker, \
+        get_compile_args, is_supported_language, sencode, get_file_language, LANGUAGES
+    from .internals import translationunitcache
+    from .internals.fileinventory import fileInventory
+    from .internals.plistreader import PlistReader
+    from .internals.analyzercache import analyzerCache, get_key, parse_dependencies
 
 
 class AnalyzerOutputView:
@@ -202,11 +148,33 @@ class Diagnostic:
 
 
 class Analyzer(Worker):
+    """
+    Shows static analyzer results. The clang processes are run by at most
+    "analyzer_jobs" threads at a time, and no more are started while less
+    than "analyzer_min_free_memory" is available. The files of a batch are
+    cancelled together.
+    """
     def __init__(self):
         self.lock = threading.Lock()
         self.diags = []
+        # The first output panel line of each diagnostic, in order
+        self.diag_lines = []
         self.line = 0
-        super(Analyzer, self).__init__()
+        self.jobs_lock = threading.Lock()
+        # (batch, filename, key) of the files waiting to be analyzed
+        self.queue = deque()
+        # job id -> clang process of the files being analyzed, None
+        # until the process has started
+        self.running = {}
+        self.job_id = 0
+        self.batch = 0
+        self.cancelled_batch = 0
+        self.total = 0
+        self.finished = 0
+        # batch -> its jobs not done yet, nice value and on_done callback
+        self.batches = {}
+        # Only for scanning the project, the analyzing is done by the jobs
+        super(Analyzer, self).__init__(1)
 
     def clear(self):
         sublime.active_window().active_view().erase_regions("clang.analyzer")
@@ -214,72 +182,315 @@ class Analyzer(Worker):
         self.lock.acquire()
         self.line = 0
         self.diags = []
+        self.diag_lines = []
         self.lock.release()
 
-    def update_settings(self):
-        cmdline = get_setting("analyzer_commandline", ["clang", "--analyze", "-o", "-"])
-        opts = get_setting("options")
-        for setting in opts:
-            cmdline.append(setting)
-        self.cmdline = cmdline
-        self.extensions = get_setting("analyzer_extensions")
-
-    def analyze_file(self, filename):
-        self.update_settings()
+    def update_settings(self, view):
+        """
+        Reads the settings of view, which are used for all the files
+        analyzed next. Files get the same options as when they're parsed,
+        with the language going by their extension unless it's the file of
+        view.
+        """
+        self.commandline = get_setting("analyzer_commandline", ["clang", "--analyze", "-o", "-"], view)
+        tuCache = translationunitcache.tuCache
+        self.opts_script = tuCache.get_opts_script(view)
+        self.base_opts = tuCache.get_base_opts(view)
+        self.language_opts = dict([(language, tuCache.get_language_opts(view, language))
+                                   for language in LANGUAGES])
+        self.view_filename = None
+        if is_supported_language(view):
+            self.view_filename = sencode(view.file_name())
+            self.view_opts = tuCache.get_opts(view)
+        # filename -> analyzer command line, as the options_script is run
+        # only once per file
+        self.cmdlines = {}
+        self.extensions = get_setting("analyzer_extensions", None, view)
+        self.max_jobs = get_setting("analyzer_jobs", 0)
+        if self.max_jobs <= 0:
+            self.max_jobs = get_cpu_count()
+        self.min_free_memory = get_setting("analyzer_min_free_memory", 512) * 1024
+        self.nice = get_setting("analyzer_nice", 10)
+
+    def analyze_file(self, view, filename):
+        self.update_settings(view)
         self.tasks.put((self.do_analyze_file, filename))
 
-    def analyze_project(self, folders):
-        self.update_settings()
+    def analyze_project(self, view, folders):
+        self.update_settings(view)
         self.tasks.put((self.do_analyze_project, folders))
 
+    def get_cmdline(self, filename):
+        cmdline = self.cmdlines.get(filename)
+        if cmdline == None:
+            if filename == self.view_filename:
+                opts = list(self.view_opts)
+            else:
+                opts = self.base_opts + self.language_opts[get_file_language(filename)]
+            cmdline = self.commandline + get_compile_args(filename, opts, self.opts_script)
+            self.cmdlines[filename] = cmdline
+        return cmdline
+
     def display_status(self):
         if get_setting("analyzer_status_messages", True):
             super(Analyzer, self).display_status()
 
-    def do_analyze_file(self, filename):
-        self.set_status("Analyzing %s" % filename)
+    def add_diagnostics(self, diagnostics, files):
+        """Adds the diagnostics of one file to the panel in one go."""
+        if len(diagnostics) == 0:
+            return
+        output = []
+        self.lock.acquire()
+        try:
+            for data in diagnostics:
+                d = Diagnostic(data, files, self.line)
+                self.diags.append(d)
+                self.diag_lines.append(d.line)
+                output.append(d.format())
+                self.line += d.lines
+            output_view.add_line("".join(output))
+        finally:
+            self.lock.release()
+        output_view.show()
+
+    def add_cached(self, filename, key):
+        """Shows the cached results of filename, if they're still valid."""
+        cached = analyzerCache.lookup(filename, key)
+        if cached == None:
+            return False
+        diagnostics, files = cached
+        self.add_diagnostics(diagnostics, files)
+        return True
+
+    def get_key(self, filename):
+        if not get_setting("analyzer_cache", True):
+            return None
+        return get_key(filename, self.get_cmdline(filename))
+
+    def start_jobs(self, jobs, nice, on_done):
+        """
+        Starts analyzing the (filename, key) jobs as a new batch, calling
+        on_done(cancelled) once all of them are done. The batches started
+        before it are finished too, not dropped.
+        """
+        self.jobs_lock.acquire()
+        try:
+            self.batch += 1
+            self.batches[self.batch] = {"remaining": len(jobs), "nice": nice, "on_done": on_done}
+            self.queue.extend([(self.batch, filename, key) for filename, key in jobs])
+            self.total = len(jobs)
+            self.finished = 0
+        finally:
+            self.jobs_lock.release()
+        self.schedule()
+
+    def schedule(self):
+        """
+        Starts as many of the queued jobs as the limits allow, and calls
+        on_done of the batches that are done.
+        """
+        done = []
+        self.jobs_lock.acquire()
+        try:
+            while len(self.queue) > 0 and len(self.running) < self.max_jobs:
+                # One job is always allowed so that the batch finishes
+                if len(self.running) > 0 and not self.has_free_memory():
+                    break
+                batch, filename, key = self.queue.popleft()
+                self.job_id += 1
+                self.running[self.job_id] = None
+                t = threading.Thread(target=self.run_job,
+                                     args=(batch, self.job_id, filename, key))
+                t.daemon = True
+                t.start()
+            for batch in sorted(self.batches.keys()):
+                if self.batches[batch]["remaining"] == 0:
+                    done.append((self.batches[batch]["on_done"], batch <= self.cancelled_batch))
+                    del self.batches[batch]
+        finally:
+            self.jobs_lock.release()
+        for on_done, cancelled in done:
+            on_done(cancelled)
+
+    def has_free_memory(self):
+        free = get_free_memory()
+        return free == None or free >= self.min_free_memory
+
+    def run_job(self, batch, job_id, filename, key):
+        try:
+            self.set_status("Analyzing %s%s" % (filename, self.get_progress()))
+            self.analyze(filename, key, batch, job_id)
+        except:
+            traceback.print_exc()
+        self.jobs_lock.acquire()
+        try:
+            del self.running[job_id]
+            self.batches[batch]["remaining"] -= 1
+            if batch == self.batch:
+                self.finished += 1
+        finally:
+            self.jobs_lock.release()
+        self.set_status("Analyzing %s done%s" % (filename, self.get_progress()))
+        self.schedule()
+
+    def get_progress(self):
+        if self.total <= 1:
+            return ""
+        return " [%d of %d files done]" % (self.finished, self.total)
+
+    def set_process(self, batch, job_id, process):
+        """
+        Makes the process of a job cancellable, returning False if its
+        batch has been cancelled already.
+        """
+        self.jobs_lock.acquire()
+        try:
+            if batch <= self.cancelled_batch:
+                return False
+            self.running[job_id] = process
+            return True
+        finally:
+            self.jobs_lock.release()
+
+    def cancel(self):
+        """Stops the batches started so far, killing the processes they're running."""
+        self.jobs_lock.acquire()
+        try:
+            self.cancelled_batch = self.batch
+            for batch, filename, key in self.queue:
+                self.batches[batch]["remaining"] -= 1
+            self.queue.clear()
+            processes = [p for p in self.running.values() if p != None]
+            running = len(self.running) > 0
+        finally:
+            self.jobs_lock.release()
+        for p in processes:
+            try:
+                p.kill()
+            except OSError:
+                # Already done
+                pass
+        if running:
+            self.set_status("Cancelling analysis")
+        # Done unless there were jobs running
+        self.schedule()
+
+    def get_popen_args(self, batch, cmdline):
+        """Returns the command line and Popen options to run a job of batch with."""
+        nice = self.batches[batch]["nice"]
+        if nice <= 0:
+            return cmdline, {}
+        if os.name == "nt":
+            # BELOW_NORMAL_PRIORITY_CLASS
+            return cmdline, {"creationflags": 0x00004000}
+        # Not a preexec_fn, which isn't safe with the other jobs' threads
+        # starting processes too
+        return ["nice", "-n", str(nice)] + cmdline, {}
 
-        cmdline = list(self.cmdline)
+    def do_analyze_file(self, filename):
+        key = self.get_key(filename)
+        if self.add_cached(filename, key):
+            self.set_status("Analyzing %s done (cached)" % filename)
+        else:
+            self.start_jobs([(filename, key)], 0, self.file_done)
+
+    def file_done(self, cancelled):
+        analyzerCache.save()
+        if cancelled:
+            self.set_status("Analysis cancelled")
+
+    def analyze(self, filename, key, batch, job_id):
+        """Runs the analyzer on filename, caching the results by key."""
+        cmdline = list(self.get_cmdline(filename))
+        depfile = None
+        if key != None:
+            # The includes are needed to tell when the results are stale
+            fd, depfile = tempfile.mkstemp(".d")
+            os.close(fd)
+            cmdline.extend(["-MD", "-MF", depfile])
         cmdline.append(filename)
 
-        p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = p.communicate()
+        diagnostics = []
+        files = []
+        state = {"files_read": False, "complete": False}
 
-        res = parse(stdout)
-        if res != None:
-            self.lock.acquire()
-            for diag in res["diagnostics"]:
-                d = Diagnostic(diag, res["files"], self.line)
-                self.diags.append(d)
-                output_view.add_line(d.format())
-                self.line += d.lines
-            self.lock.release()
+        def on_value(key, value):
+            if key == "files":
+                files.extend(value)
+                state["files_read"] = True
 
-            if len(res["diagnostics"]) > 0:
-                output_view.show()
-        self.set_status("Analyzing %s done" % filename)
+        reader = PlistReader(("diagnostics",), lambda key, data: diagnostics.append(data), on_value)
+        devnull = open(os.devnull, "w")
+        try:
+            cmdline, options = self.get_popen_args(batch, cmdline)
+            p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=devnull, **options)
+            if not self.set_process(batch, job_id, p):
+                p.kill()
+            try:
+                while True:
+                    data = p.stdout.read(65536)
+                    if not data:
+                        break
+                    reader.feed(data)
+                reader.close()
+                state["complete"] = True
+            except expat.ExpatError:
+                # Nothing or not a plist, which is what clang failing looks like
+                pass
+            p.stdout.close()
+            p.wait()
+            if depfile != None and state["complete"] and p.returncode == 0:
+                self.store(filename, key, depfile, diagnostics, files)
+        finally:
+            devnull.close()
+            if depfile != None and os.path.exists(depfile):
+                os.remove(depfile)
+
+        if batch <= self.cancelled_batch:
+            # Whatever it found isn't wanted anymore
+            return
+        # The diagnostics refer to the files by index, so they can't be
+        # shown without them
+        if state["files_read"]:
+            self.add_diagnostics(diagnostics, files)
+
+    def store(self, filename, key, depfile, diagnostics, files):
+        f = open(depfile)
+        try:
+            includes = parse_dependencies(f.read())
+        finally:
+            f.close()
+        if len(includes) == 0:
+            # Without the includes the results couldn't be validated
+            return
+        analyzerCache.store(filename, key, includes, diagnostics, files)
 
     def do_analyze_project(self, folders):
-        for dir in folders:
-            for dirpath, dirnames, filenames in os.walk(dir):
-                for file in filenames:
-                    if "." in file:
-                        extension = file[file.rfind(".") + 1:]
-                        if extension in self.extensions:
-                            self.tasks.put((self.do_analyze_file, "%s/%s" % (dirpath, file)))
-        if get_cpu_count() > 1:
-            while not self.tasks.empty():
-                time.sleep(0.25)
-        self.tasks.put((self.set_status, "Project analyzed"))
+        # Unchanged files are shown right away, the rest is analyzed
+        stale = []
+        for filename in fileInventory.get_files(folders, self.extensions):
+            key = self.get_key(filename)
+            if not self.add_cached(filename, key):
+                stale.append((filename, key))
+        self.start_jobs(stale, self.nice, self.project_done)
+
+    def project_done(self, cancelled):
+        analyzerCache.save()
+        if cancelled:
+            self.set_status("Project analysis cancelled")
+        else:
+            self.set_status("Project analyzed")
 
     def get_diagnostic_at_line(self, line):
-        for i in range(len(self.diags)):
-            if self.diags[i].line == line:
-                return self.diags[i]
-            elif self.diags[i].line > line:
-                return self.diags[i - 1]
-        if len(self.diags) > 0:
-            return self.diags[len(self.diags)-1]
+        """Returns the diagnostic the output panel line belongs to."""
+        self.lock.acquire()
+        try:
+            if len(self.diags) == 0:
+                return None
+            i = bisect.bisect_right(self.diag_lines, line) - 1
+            return self.diags[max(i, 0)]
+        finally:
+            self.lock.release()
 
 
 analyzer = Analyzer()
@@ -287,15 +498,21 @@ analyzer = Analyzer()
 
 class ClangAnalyzeFile(sublime_plugin.TextCommand):
     def run(self, edit):
+        analyzer.cancel()
         analyzer.clear()
-        fn = self.view.file_name().encode("utf-8")
-        analyzer.analyze_file(fn)
+        analyzer.analyze_file(self.view, sencode(self.view.file_name()))
 
 
 class ClangAnalyzeProject(sublime_plugin.TextCommand):
     def run(self, edit):
+        analyzer.cancel()
         analyzer.clear()
-        analyzer.analyze_project(self.view.window().folders())
+        analyzer.analyze_project(self.view, self.view.window().folders())
+
+
+class ClangAnalyzeCancel(sublime_plugin.TextCommand):
+    def run(self, edit):
+        analyzer.cancel()
 
 
 class ClangAnalyzeEventListener(sublime_plugin.EventListener):
@@ -331,6 +548,8 @@ class ClangAnalyzeEventListener(sublime_plugin.EventListener):
             v.add_regions("clang.analyze.selection", [region], get_setting("marker_analyzer_output_panel_scope", "invalid"), "", sublime.DRAW_OUTLINED)
             row, col = v.rowcol(v.sel()[0].a)
             diag = analyzer.get_diagnostic_at_line(row)
+            if diag == None:
+                return
             self.prepare_ranges(diag.get_ranges(row), diag.files)
             for f in self.ranges:
                 v = sublime.active_window().open_file(f, sublime.TRANSIENT)
@@ -29,29 +29,40 @@ Unfortunately ctypes can't be imported, so SublimeClang will not work.
 
 There is a work around for this to get it to work, \
 please see http://www.github.com/quarnster/SublimeClang for more details. """)
-import os
 import sys
 
 try:
     import Queue
     from internals.clang import cindex
-    from errormarkers import clear_error_marks, add_error_mark, show_error_marks, \
+    from errormarkers import clear_error_marks, set_error_marks, show_error_marks, \
                              update_statusbar, erase_error_marks, clang_error_panel
     from internals.common import get_setting, get_settings, is_supported_language, \
                                     get_language,get_cpu_count, run_in_main_thread, \
                                     status_message, sencode, are_we_there_yet, plugin_loaded
     from internals import translationunitcache
+    from internals.unsavedfiles import unsaved_buffers
+    from internals.symbolindex import symbolIndexer
+    from internals.filewatcher import fileWatcher
+    from internals.remotecache import remoteCache, get_tu_cache
+    from internals.diagnostics import diagnosticsBuilder
+    from internals.analyzercache import analyzerCache
     from internals.parsehelp import parsehelp
     plugin_loaded()
 except ImportError:
     import queue as Queue
     from .internals.clang import cindex
-    from .errormarkers import clear_error_marks, add_error_mark, show_error_marks, \
+    from .errormarkers import clear_error_marks, set_error_marks, show_error_marks, \
                              update_statusbar, erase_error_marks, clang_error_panel
     from .internals.common import get_setting, get_settings, is_supported_language, \
                                     get_language,get_cpu_count, run_in_main_thread, \
                                     status_message, sencode, are_we_there_yet, plugin_loaded
     from .internals import translationunitcache
+    from .internals.unsavedfiles import unsaved_buffers
+    from .internals.symbolindex import symbolIndexer
+    from .internals.filewatcher import fileWatcher
+    from .internals.remotecache import remoteCache, get_tu_cache
+    from .internals.diagnostics import diagnosticsBuilder
+    from .internals.analyzercache import analyzerCache
     from .internals.parsehelp import parsehelp
 
 import sublime_plugin
@@ -65,9 +76,9 @@ import traceback
 def warm_up_cache(view, filename=None):
     if filename == None:
         filename = sencode(view.file_name())
-    stat = translationunitcache.tuCache.get_status(filename)
+    stat = get_tu_cache().get_status(filename)
     if stat == translationunitcache.TranslationUnitCache.STATUS_NOT_IN_CACHE:
-        translationunitcache.tuCache.add(view, filename)
+        get_tu_cache().add(view, filename)
     return stat
 
 
@@ -81,9 +92,80 @@ def get_translation_unit(view, filename=None, blocking=False):
         elif stat == translationunitcache.TranslationUnitCache.STATUS_PARSING:
             sublime.status_message("Hold your horses, cache still warming up")
             return None
-    return translationunitcache.tuCache.get_translation_unit(filename, translationunitcache.tuCache.get_opts(view), translationunitcache.tuCache.get_opts_script(view))
+    tu_cache = get_tu_cache()
+    return tu_cache.get_translation_unit(filename, tu_cache.get_opts(view), tu_cache.get_opts_script(view))
+
+def index_project(view, filename=None):
+    window = view.window()
+    if window == None or not get_setting("index_project", True, view):
+        return
+    opts = translationunitcache.tuCache.get_opts(view)
+    opts_script = translationunitcache.tuCache.get_opts_script(view)
+    if filename == None:
+        symbolIndexer.index_project(window.folders(), opts, opts_script)
+    else:
+        symbolIndexer.index_file(window.folders(), filename, opts, opts_script)
+
+
+def track_unsaved_buffer(view):
+    def get_change_count():
+        if not view.is_dirty() or view.file_name() == None:
+            return None
+        return view.change_count()
+    unsaved_buffers.track(sencode(view.file_name()), get_change_count,
+                          lambda: view.substr(Region(0, view.size())))
+
+
+def get_unsaved_files(view):
+    filename = sencode(view.file_name())
+    if view.is_dirty():
+        track_unsaved_buffer(view)
+    return unsaved_buffers.get(filename, get_tu_cache().get_includes(filename))
+
+def touch_recently_used(view):
+    filename = sencode(view.file_name())
+    if filename in recently_used:
+        recently_used.remove(filename)
+    recently_used.append(filename)
+
+
+def reparse_dependents(filename):
+    """
+    Reparses the open files whose translation units include filename, one
+    at a time so that other work isn't queued up behind them, most
+    recently used first.
+    """
+    dependents = get_tu_cache().get_dependents(filename)
+    if len(dependents) == 0:
+        return
+    views = {}
+    for window in sublime.windows():
+        for view in window.views():
+            if view.file_name() != None:
+                views[sencode(view.file_name())] = view
+
+    def mru_index(f):
+        if f in recently_used:
+            return recently_used.index(f)
+        return -1
+    pending = sorted([f for f in dependents if f in views], key=mru_index, reverse=True)
+
+    def reparse_next():
+        while len(pending) > 0:
+            f = pending.pop(0)
+            view = views[f]
+            if view.window() == None:
+                # Closed since
+                continue
+            unsaved_files = []
+            if get_setting("reparse_use_dirty_buffer", False, view):
+                unsaved_files = get_unsaved_files(view)
+            if get_tu_cache().reparse(view, f, unsaved_files, reparse_next):
+                return
+    reparse_next()
 
 navigation_stack = []
+recently_used = []
 clang_complete_enabled = True
 clang_fast_completions = True
 
@@ -219,95 +301,94 @@ class ClangGotoDef(ClangGotoBase):
         return tu.get_definition(data, offset, found_callback, folders)
 
 
+class ClangFindReferences(ClangGotoBase):
+    def get_target(self, tu, data, offset, found_callback, folders):
+        return tu.find_references(data, offset, found_callback, folders)
+
+    def found_callback(self, target):
+        if target == None:
+            sublime.status_message("No references found in the project index")
+        else:
+            ClangGotoBase.found_callback(self, target)
+
+
 class ClangClearCache(sublime_plugin.TextCommand):
     def run(self, edit):
-        translationunitcache.tuCache.clear()
+        get_tu_cache().clear()
+        analyzerCache.clear()
         sublime.status_message("Cache cleared!")
 
 
 class ClangReparse(sublime_plugin.TextCommand):
     def run(self, edit):
         view = self.view
-        unsaved_files = []
-        if view.is_dirty():
-            unsaved_files.append((sencode(view.file_name()),
-                          view.substr(Region(0, view.size()))))
-        translationunitcache.tuCache.reparse(view, sencode(view.file_name()), unsaved_files)
+        unsaved_files = get_unsaved_files(view)
+        get_tu_cache().reparse(view, sencode(view.file_name()), unsaved_files)
 
 
-def ignore_diagnostic(path, ignoreDirs):
-    normalized_path = os.path.abspath(os.path.normpath(os.path.normcase(path)))
-    for d in ignoreDirs:
-        if normalized_path.startswith(d):
-            return True
-    return False
+# view id -> (key, model) of the diagnostics last shown for the view, the
+# key being the translation unit generation and the ignore settings used
+diagnostics_models = {}
 
 
 def display_compilation_results(view):
     tu = get_translation_unit(view)
-    errString = ""
-    show = False
-    clear_error_marks()  # clear visual error marks
-    erase_error_marks(view)
     if tu == None:
+        clear_error_marks()  # clear visual error marks
+        erase_error_marks(view)
         return
-
-    if not tu.try_lock():
+    ignoreDirs = get_setting("diagnostic_ignore_dirs", [], view)
+    ignore_regex_str = get_setting("diagnostic_ignore_regex", "pragma once in main file")
+    key = (tu.generation, tuple(ignoreDirs), ignore_regex_str)
+    cached = diagnostics_models.get(view.id())
+    if cached != None and cached[0] == key:
+        show_diagnostics(view, cached[1])
         return
+    if ignore_regex_str:
+        ignore_regex = re.compile(ignore_regex_str)
+    else:
+        ignore_regex = None
+
+    def built(model):
+        def show():
+            diagnostics_models[view.id()] = (key, model)
+            show_diagnostics(view, model)
+        run_in_main_thread(show)
+    # Formatting thousands of diagnostics would stall the ui
+    diagnosticsBuilder.build(sencode(view.file_name()), tu, ignoreDirs, ignore_regex, built)
+
+
+def is_up_to_date(view, change_count):
+    """
+    Tells whether the translation unit of the view is ready and not dirty,
+    and was parsed when the view was at change_count. Its diagnostics can
+    be shown as they are then, from the cached model if they're still the
+    ones shown last. Changes to other files are only known about with the
+    file watcher running.
+    """
+    if view.change_count() != change_count or get_setting("file_watcher_interval", 2) <= 0:
+        return False
+    filename = sencode(view.file_name())
+    tu_cache = get_tu_cache()
+    if tu_cache.get_status(filename) != translationunitcache.TranslationUnitCache.STATUS_READY:
+        return False
+    tus = tu_cache.translationUnits.lock()
     try:
-        errorCount = 0
-        warningCount = 0
-        ignoreDirs = [os.path.abspath(os.path.normpath(os.path.normcase(d))) for d in get_setting("diagnostic_ignore_dirs", [], view)]
-        ignore_regex_str = get_setting("diagnostic_ignore_regex", "pragma once in main file")
-        if ignore_regex_str:
-            ignore_regex = re.compile(ignore_regex_str)
-        else:
-            ignore_regex = None
-
-        if len(tu.var.diagnostics):
-            errString = ""
-            for diag in tu.var.diagnostics:
-                f = diag.location
-                filename = ""
-                if f.file != None:
-                    filename = f.file.name
-
-                if ignore_diagnostic(filename, ignoreDirs):
-                    continue
-
-                err = "%s:%d,%d - %s - %s" % (filename, f.line, f.column,
-                                              diag.severityName,
-                                              diag.spelling)
+        tu = tus.get(filename)
+    finally:
+        tu_cache.translationUnits.unlock()
+    return tu != None and not tu.dirty
 
-                if ignore_regex and ignore_regex.search(err):
-                    continue
 
-                try:
-                    if len(diag.disable_option) > 0:
-                        err = "%s [Disable with %s]" % (err, diag.disable_option)
-                except AttributeError:
-                    pass
-                if diag.severity == cindex.Diagnostic.Fatal and \
-                        "not found" in diag.spelling:
-                    err = "%s\nDid you configure the include path used by clang properly?\n" \
-                          "See http://github.com/quarnster/SublimeClang for more details on "\
-                          "how to configure SublimeClang." % (err)
-                errString = "%s%s\n" % (errString, err)
-                if diag.severity == cindex.Diagnostic.Warning:
-                    warningCount += 1
-                elif diag.severity >= cindex.Diagnostic.Error:
-                    errorCount += 1
-                """
-                for range in diag.ranges:
-                    errString = "%s%s\n" % (errString, range)
-                for fix in diag.fixits:
-                    errString = "%s%s\n" % (errString, fix)
-                """
-                add_error_mark(
-                    diag.severityName, filename, f.line - 1, diag.spelling)
-            show = errString and get_setting("show_output_panel", True, view)
-    finally:
-        tu.unlock()
+def show_diagnostics(view, model):
+    if view.window() == None:
+        # Closed since
+        return
+    errorCount = model.error_count
+    warningCount = model.warning_count
+    errString = model.get_text()
+    show = errString and get_setting("show_output_panel", True, view)
+    set_error_marks(model.errors, model.warnings)
     if (errorCount > 0 or warningCount > 0) and get_setting("show_status", True, view):
         statusString = "Clang Status: "
         if errorCount > 0:
@@ -323,6 +404,8 @@ def display_compilation_results(view):
     update_statusbar(view)
     if not get_setting("error_marks_on_panel_only", False, view):
         show_error_marks(view)
+    else:
+        erase_error_marks(view)
     if not window is None:
         if show:
             window.run_command("clang_toggle_panel", {"show": True})
@@ -374,10 +457,13 @@ class SublimeClangAutoComplete(sublime_plugin.EventListener):
         s.add_on_change("options", self.load_settings)
         are_we_there_yet(lambda: self.load_settings())
         self.recompile_timer = None
+        # view id -> change count of the view when it was last reparsed
+        self.reparsed_change_counts = {}
         self.not_code_regex = re.compile("(string.)|(comment.)")
 
     def load_settings(self):
         translationunitcache.tuCache.clear()
+        remoteCache.clear()
         self.dont_complete_startswith = get_setting("dont_complete_startswith",
                                               ['operator', '~'])
         self.recompile_delay = get_setting("recompile_delay", 1000)
@@ -444,11 +530,10 @@ class SublimeClangAutoComplete(sublime_plugin.EventListener):
             else:
                 # print("doing slow completions")
                 row, col = view.rowcol(locations[0] - len(prefix))
-                unsaved_files = []
-                if view.is_dirty():
-                    unsaved_files.append((sencode(view.file_name()),
-                                      view.substr(Region(0, view.size()))))
+                unsaved_files = get_unsaved_files(view)
                 ret = tu.cache.clangcomplete(sencode(view.file_name()), row+1, col+1, unsaved_files, is_member_completion(view, locations[0] - len(prefix)))
+                if self.time_completions:
+                    timing += ", Unsaved: %s" % unsaved_buffers.format_stats()
             if self.time_completions:
                 curr = (time.time() - start)*1000
                 tot += curr
@@ -497,27 +582,44 @@ class SublimeClangAutoComplete(sublime_plugin.EventListener):
     def recompile(self):
         view = self.view
         unsaved_files = []
-        if view.is_dirty() and get_setting("reparse_use_dirty_buffer", False, view):
-            unsaved_files.append((sencode(view.file_name()),
-                                  view.substr(Region(0, view.size()))))
-        if not translationunitcache.tuCache.reparse(view, sencode(view.file_name()), unsaved_files,
+        if get_setting("reparse_use_dirty_buffer", False, view):
+            unsaved_files = get_unsaved_files(view)
+        self.reparsed_change_counts[view.id()] = view.change_count()
+        if not get_tu_cache().reparse(view, sencode(view.file_name()), unsaved_files,
                         self.reparse_done):
 
             # Already parsing so retry in a bit
             self.restart_recompile_timer(1)
 
     def on_activated(self, view):
+        if is_supported_language(view):
+            touch_recently_used(view)
+            index_project(view)
+            if view.window() != None:
+                fileWatcher.watch(view.window().folders())
         if is_supported_language(view) and get_setting("reparse_on_activated", True, view):
             self.view = view
-            self.restart_recompile_timer(0.1)
+            if is_up_to_date(view, self.reparsed_change_counts.get(view.id())):
+                # Nothing changed since this view was last shown
+                display_compilation_results(view)
+            else:
+                self.restart_recompile_timer(0.1)
 
     def on_post_save(self, view):
+        if is_supported_language(view):
+            unsaved_buffers.remove(sencode(view.file_name()))
+            index_project(view, sencode(view.file_name()))
+            if get_setting("reparse_dependents_on_save", True, view):
+                reparse_dependents(sencode(view.file_name()))
         if is_supported_language(view) and get_setting("reparse_on_save", True, view):
             self.view = view
             self.restart_recompile_timer(0.1)
 
     def on_modified(self, view):
-        if (self.recompile_delay <= 0) or not is_supported_language(view):
+        if not is_supported_language(view):
+            return
+        track_unsaved_buffer(view)
+        if self.recompile_delay <= 0:
             return
 
         self.view = view
@@ -528,8 +630,14 @@ class SublimeClangAutoComplete(sublime_plugin.EventListener):
             warm_up_cache(view)
 
     def on_close(self, view):
+        diagnostics_models.pop(view.id(), None)
+        self.reparsed_change_counts.pop(view.id(), None)
+        if is_supported_language(view):
+            unsaved_buffers.remove(sencode(view.file_name()))
+            if sencode(view.file_name()) in recently_used:
+                recently_used.remove(sencode(view.file_name()))
         if self.remove_on_close and is_supported_language(view):
-            translationunitcache.tuCache.remove(sencode(view.file_name()))
+            get_tu_cache().remove(sencode(view.file_name()))
 
     def on_query_context(self, view, key, operator, operand, match_all):
         if key == "clang_supported_language":
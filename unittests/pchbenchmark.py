@@ -0,0 +1,94 @@
+"""
+Benchmarks parsing a set of files sharing the same include prelude, with
+and without a shared precompiled header. Run from the root of the
+repository:
+
+    python unittests/pchbenchmark.py [files] [headers]
+"""
+import sys
+sys.path.append(".")
+from internals import translationunitcache
+import gc
+import os
+import shutil
+import tempfile
+import time
+
+FILES = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+HEADERS = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+
+def get_rss():
+    """Returns the resident set size of this process in kB."""
+    try:
+        f = open("/proc/self/statm")
+        try:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+        finally:
+            f.close()
+    except (IOError, OSError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            rss //= 1024
+        return rss
+
+
+def create_project(path):
+    for i in range(HEADERS):
+        f = open(os.path.join(path, "header%d.h" % i), "w")
+        f.write("#pragma once\n#include <vector>\n#include <map>\n#include <string>\n")
+        f.write("namespace ns%d {\n" % i)
+        for j in range(50):
+            f.write("template<typename T> class Class%d {\npublic:\n" % j)
+            f.write("    std::map<std::string, std::vector<T> > member;\n")
+            f.write("    T method(const T& a, int b) { return b > 0 ? a : member.begin()->second[0]; }\n")
+            f.write("};\n")
+        f.write("}\n")
+        f.close()
+    files = []
+    for i in range(FILES):
+        name = os.path.join(path, "file%d.cpp" % i)
+        f = open(name, "w")
+        for j in range(HEADERS):
+            f.write("#include \"header%d.h\"\n" % j)
+        f.write("\nint function%d()\n{\n    ns0::Class0<int> c;\n    return c.method(%d, 1);\n}\n" % (i, i))
+        f.close()
+        files.append(name)
+    return files
+
+
+def run(files, shared_pch):
+    get_setting = translationunitcache.get_setting
+    def get_setting_override(key, default=None, view=None):
+        if key == "shared_pch":
+            return shared_pch
+        return get_setting(key, default, view)
+    translationunitcache.get_setting = get_setting_override
+    try:
+        cache = translationunitcache.TranslationUnitCache()
+        gc.collect()
+        rss = get_rss()
+        start = time.time()
+        for name in files:
+            cache.get_translation_unit(name, ["-x", "c++"])
+            # Give a queued precompiled header build the chance to finish
+            # so that the remaining files can use it
+            cache.tasks.join()
+        elapsed = time.time() - start
+        used = len([tu for tu in cache.translationUnits.var.values() if tu.pch != None])
+        return elapsed, get_rss() - rss, used
+    finally:
+        translationunitcache.get_setting = get_setting
+
+
+path = tempfile.mkdtemp()
+try:
+    files = create_project(path)
+    print("%d files including the same %d headers" % (FILES, HEADERS))
+    for shared_pch in [False, True]:
+        elapsed, rss, used = run(files, shared_pch)
+        print("shared_pch=%-5s parse time: %6.2f s, memory: %7d kB, files using the pch: %d" % \
+            (shared_pch, elapsed, rss, used))
+finally:
+    shutil.rmtree(path)
@@ -0,0 +1,143 @@
+"""
+Benchmarks reading large static analyzer plist outputs with the streaming
+plist reader against the character by character parser it replaced. Run
+from the root of the repository:
+
+    python unittests/plistbenchmark.py [diagnostics]
+"""
+import sys
+sys.path.append(".")
+from internals.plistreader import PlistReader, parse
+import time
+
+DIAGNOSTICS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+
+def legacy_parse(l):
+    start = 0
+    i = 0
+    contents = ""
+    key = ""
+    pos = -1
+    containerList = []
+    keyList = []
+    result = None
+    indent = ""
+
+    while i < len(l):
+        c = l[i]
+        if c == "<":
+            contents = l[start:i]
+            start = i + 1
+        elif c == ">":
+            tag = l[start:i]
+            if tag[0] != "/":
+                indent += "\t"
+            if tag[0] == "/":
+                indent = indent[:-1]
+
+            start = i + 1
+            if tag == "/integer":
+                contents = int(contents)
+                if len(key) > 0:
+                    containerList[pos][key] = contents
+                else:
+                    containerList[pos].append(contents)
+                key = ""
+            elif tag == "/string":
+                if len(key) > 0:
+                    containerList[pos][key] = contents
+                else:
+                    containerList[pos].append(contents)
+                key = ""
+            elif tag == "/key":
+                key = contents
+            elif tag == "dict":
+                containerList.append({})
+                keyList.append(key)
+                key = ""
+                pos += 1
+            elif tag == "array":
+                containerList.append([])
+                keyList.append(key)
+                key = ""
+                pos += 1
+            elif tag == "/array" or tag == "/dict":
+                pos -= 1
+                cont = containerList.pop()
+                cur = None if pos == -1 else containerList[pos]
+                key = keyList.pop()
+
+                if len(containerList) == 0:
+                    result = cont
+                else:
+                    if len(key) > 0:
+                        cur[key] = cont
+                        key = ""
+                    else:
+                        cur.append(cont)
+        i += 1
+    return result
+
+
+def create_output(count):
+    """Returns the plist of count diagnostics the way clang --analyze writes it."""
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+           '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" '
+           '"http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n',
+           '<plist version="1.0">\n<dict>\n <key>clang_version</key>\n <string>clang version 3.1</string>\n',
+           ' <key>diagnostics</key>\n <array>\n']
+
+    def location(line, col, f):
+        return "<dict><key>line</key><integer>%d</integer><key>col</key><integer>%d</integer>" \
+               "<key>file</key><integer>%d</integer></dict>" % (line, col, f)
+
+    for i in range(count):
+        f = i % 10
+        out.append("  <dict>\n   <key>path</key>\n   <array>\n")
+        for j in range(5):
+            out.append("    <dict><key>kind</key><string>event</string><key>location</key>%s"
+                       "<key>ranges</key><array><array>%s%s</array></array>"
+                       "<key>depth</key><integer>0</integer>"
+                       "<key>extended_message</key><string>Assuming &apos;x&apos; is %d</string>"
+                       "<key>message</key><string>Assuming &apos;x&apos; is %d</string></dict>\n" %
+                       (location(i + j, 5, f), location(i + j, 5, f), location(i + j, 9, f), j, j))
+        out.append("   </array>\n")
+        out.append("   <key>description</key><string>Dereference of null pointer (loaded from variable &apos;p&apos;)</string>\n")
+        out.append("   <key>category</key><string>Logic error</string>\n")
+        out.append("   <key>type</key><string>Dereference of null pointer</string>\n")
+        out.append("   <key>location</key>%s\n  </dict>\n" % location(i + 4, 9, f))
+    out.append(" </array>\n <key>files</key>\n <array>\n")
+    for f in range(10):
+        out.append("  <string>/path/to/project/src/file%d.cpp</string>\n" % f)
+    out.append(" </array>\n</dict>\n</plist>\n")
+    return "".join(out)
+
+
+def time_call(name, function):
+    start = time.time()
+    ret = function()
+    print("%-32s %8.3f s" % (name, time.time() - start))
+    return ret
+
+
+def stream(data):
+    diagnostics = []
+    reader = PlistReader(("diagnostics",), lambda key, item: diagnostics.append(item))
+    for i in range(0, len(data), 65536):
+        reader.feed(data[i:i + 65536])
+    reader.close()
+    return diagnostics
+
+
+text = create_output(DIAGNOSTICS)
+data = text.encode("utf-8")
+print("%d diagnostics, %d kB of plist" % (DIAGNOSTICS, len(data) // 1024))
+
+old = time_call("character by character parser", lambda: legacy_parse(text))
+new = time_call("expat plist reader", lambda: parse(data))
+streamed = time_call("expat plist reader, streamed", lambda: stream(data))
+
+assert len(old["diagnostics"]) == len(new["diagnostics"]) == len(streamed) == DIAGNOSTICS
+assert old["files"] == new["files"]
+assert new["diagnostics"][-1]["location"] == old["diagnostics"][-1]["location"]
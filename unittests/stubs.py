@@ -0,0 +1,134 @@
+"""
+Stand-ins for the editor, for testing the plugin modules outside of it.
+Run the tests from the root of the repository:
+
+    python -m unittest discover -s unittests -p "test_*.py"
+"""
+import importlib
+import os
+import sys
+import tempfile
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = tempfile.mkdtemp(prefix="sublimeclang-test")
+
+
+def get_module_name(name):
+    """
+    Returns the name a module of the plugin is imported as, which is
+    relative to the package root with Python 3 like in the editor.
+    """
+    if sys.version[0] == '2':
+        return name
+    return "%s.%s" % (os.path.basename(ROOT), name)
+
+
+def import_module(name):
+    """Imports the plugin module name, even if another test stubbed it."""
+    if getattr(sys.modules.get(get_module_name(name)), "is_stub", False):
+        del sys.modules[get_module_name(name)]
+    if sys.version[0] == '2':
+        path = ROOT
+    else:
+        path = os.path.dirname(ROOT)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(get_module_name(name))
+
+
+def set_module(name, module):
+    """Makes the plugin module name be the given stand-in."""
+    sys.modules[get_module_name(name)] = module
+    if "." in name:
+        package, attribute = name.rsplit(".", 1)
+        setattr(import_module(package), attribute, module)
+
+
+def stub_module(name):
+    """
+    Returns the stand-in for the plugin module name, which is shared by
+    all the tests that need it.
+    """
+    module = sys.modules.get(get_module_name(name))
+    if module == None or not getattr(module, "is_stub", False):
+        module = types.ModuleType(get_module_name(name))
+        module.is_stub = True
+        set_module(name, module)
+    return module
+
+
+class Settings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def has(self, key):
+        return key in self
+
+    def add_on_change(self, key, callback):
+        pass
+
+    def clear_on_change(self, key):
+        pass
+
+
+class Selection(object):
+    def __init__(self, a):
+        self.a = a
+        self.b = a
+
+
+class View(object):
+    def __init__(self, filename=None, settings={}, scope="source.c++"):
+        self.filename = filename
+        self.view_settings = Settings(settings)
+        self.scope = scope
+
+    def file_name(self):
+        return self.filename
+
+    def is_scratch(self):
+        return False
+
+    def sel(self):
+        return [Selection(0)]
+
+    def scope_name(self, point):
+        return self.scope
+
+    def settings(self):
+        return self.view_settings
+
+    def window(self):
+        return None
+
+
+settings = Settings()
+status_messages = []
+
+
+def install_sublime():
+    """
+    Installs the sublime and sublime_plugin modules, with the settings
+    read from stubs.settings and what's run in the main thread run right
+    away.
+    """
+    if "sublime" in sys.modules:
+        return
+    sublime = types.ModuleType("sublime")
+    sublime.load_settings = lambda name: settings
+    sublime.set_timeout = lambda func, delay: func()
+    sublime.status_message = lambda msg: status_messages.append(msg)
+    sublime.error_message = lambda msg: status_messages.append(msg)
+    sublime.active_window = lambda: None
+    sublime.cache_path = lambda: CACHE_DIR
+    sublime.Region = lambda a, b: (a, b)
+    sublime.TRANSIENT = 4
+    sublime.DRAW_OUTLINED = 32
+    sys.modules["sublime"] = sublime
+
+    sublime_plugin = types.ModuleType("sublime_plugin")
+    sublime_plugin.TextCommand = object
+    sublime_plugin.WindowCommand = object
+    sublime_plugin.EventListener = object
+    sys.modules["sublime_plugin"] = sublime_plugin
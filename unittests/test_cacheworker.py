@@ -0,0 +1,128 @@
+import json
+import threading
+import time
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+translationunitcache = stubs.stub_module("internals.translationunitcache")
+cacheworker = stubs.import_module("internals.cacheworker")
+
+
+class FakeTranslationUnit(object):
+    def locate(self, kind, data, offset):
+        return {"index": {"usr": None, "word": "f", "exclude": None, "definition": True},
+                "search": {"cursor": None, "word": "f"}}
+
+
+class FakeCache(object):
+    def __init__(self):
+        self.index_parse_options = 13
+        self.parse_options = []
+
+    def get_translation_unit(self, filename, opts, opts_script, unsaved_files, parse_options):
+        self.parse_options.append(parse_options)
+        return FakeTranslationUnit()
+
+
+class CacheServiceGotoTest(unittest.TestCase):
+    def setUp(self):
+        self.plans = []
+
+        def finish_goto(plan, filename, found_callback, folders, opts, opts_script, companion_finder):
+            self.plans.append(plan)
+            found_callback(None)
+        translationunitcache.finish_goto = finish_goto
+        self.service = cacheworker.CacheService(FakeCache())
+
+    def test_goto_never_asks_about_an_extensive_search(self):
+        self.assertEqual(self.service.goto("implementation", "/project/main.cpp", [], None, "f();", 1, []), None)
+        self.assertEqual(self.plans, [{"index": {"usr": None, "word": "f", "exclude": None, "definition": True}}])
+
+    def test_prompts_are_declined(self):
+        answers = []
+        cacheworker.decline_user_selection([["Yes", ""], ["No", ""]], answers.append)
+        self.assertEqual(answers, [-1])
+
+
+class CacheServiceParseOptionsTest(unittest.TestCase):
+    def test_parse_options_are_per_request(self):
+        cache = FakeCache()
+        service = cacheworker.CacheService(cache)
+        service.get_tu("/project/a.cpp", [], None, 1)
+        service.get_tu("/project/b.cpp", [], None)
+        self.assertEqual(cache.parse_options, [1, None])
+        self.assertEqual(cache.index_parse_options, 13)
+
+
+class Lines(object):
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.written = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def readline(self):
+        if len(self.lines) == 0:
+            return ""
+        return self.lines.pop(0)
+
+    def write(self, data):
+        self.lock.acquire()
+        try:
+            if self.closed:
+                raise ValueError("I/O operation on closed file")
+            self.written.append(json.loads(data))
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.lock.acquire()
+        self.closed = True
+        self.lock.release()
+
+
+class ServeTest(unittest.TestCase):
+    def test_requests_share_the_threads(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        threads = set()
+
+        def handle(request):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running)
+            threads.add(threading.current_thread())
+            lock.release()
+            time.sleep(0.05)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return request
+
+        lines = Lines(["[%d]\n" % i for i in range(8)])
+        cacheworker.serve(handle, lines, lines, 2)
+        self.assertEqual(sorted(lines.written), [[i] for i in range(8)])
+        self.assertEqual(running[1], 2)
+        self.assertEqual(len(threads), 2)
+
+    def test_answers_after_the_input_ends(self):
+        def handle(request):
+            time.sleep(0.2)
+            return request
+
+        # The client closed its end for writing right after the request,
+        # the connection is closed once serve returns
+        lines = Lines(["[1]\n"])
+        cacheworker.serve(handle, lines, lines, 2)
+        lines.close()
+        self.assertEqual(lines.written, [[1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+candidatescan = stubs.import_module("internals.candidatescan")
+
+
+class ScanProcessesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="sublimeclang-scan")
+        stubs.settings.clear()
+        stubs.settings["worker_python"] = sys.executable
+        self.files = []
+        for i in range(5):
+            filename = os.path.join(self.folder, "%d.cpp" % i)
+            f = open(filename, "w")
+            try:
+                f.write("int other;\n" * i + "void Shape::area%d() {}\n" % i)
+            finally:
+                f.close()
+            self.files.append(filename)
+        self.pattern = r"(\w+)::(area\d)\s*\("
+        self.processes = candidatescan.ScanProcesses(2)
+
+    def tearDown(self):
+        for process in self.processes.processes:
+            if process != None:
+                process.stdin.close()
+                process.wait()
+        shutil.rmtree(self.folder)
+
+    def get_expected(self):
+        return [candidatescan.scan_file((name, b"area", self.pattern)) for name in self.files]
+
+    def test_scanned_in_processes(self):
+        self.assertEqual(self.processes.scan(self.files, "area", self.pattern), self.get_expected())
+        self.assertEqual(self.processes.scan(self.files, "area", self.pattern)[4],
+                         (self.files[4], [("Shape::area4(", 5, 13)]))
+        for process in self.processes.processes:
+            self.assertEqual(process.poll(), None)
+
+    def test_dead_process_is_restarted(self):
+        self.processes.scan(self.files, "area", self.pattern)
+        dead = self.processes.processes[0]
+        dead.kill()
+        dead.wait()
+        self.assertEqual(self.processes.scan(self.files, "area", self.pattern), self.get_expected())
+        self.assertNotEqual(self.processes.processes[0], dead)
+
+    def test_scanned_here_without_python(self):
+        stubs.settings["worker_python"] = os.path.join(self.folder, "missing-python")
+        self.assertEqual(self.processes.scan(self.files, "area", self.pattern), self.get_expected())
+
+
+class ScanFileTest(unittest.TestCase):
+    def test_locations(self):
+        fd, filename = tempfile.mkstemp(".cpp")
+        os.close(fd)
+        try:
+            f = open(filename, "w")
+            try:
+                for i in range(200):
+                    f.write("// %d\n" % i + "\n" * (i % 3) + "%sint area%d();\n" % (" " * (i % 5), i))
+            finally:
+                f.close()
+            name, matches = candidatescan.scan_file((filename, b"area", r"int\s+(area\d+)\s*\("))
+            f = open(filename)
+            try:
+                lines = f.read().split("\n")
+            finally:
+                f.close()
+            expected = []
+            for i, line in enumerate(lines):
+                if "area" in line:
+                    expected.append((line.strip()[:-2], i + 1, line.index("area") + 1))
+            self.assertEqual(matches, expected)
+            self.assertEqual(len(matches), 200)
+        finally:
+            os.remove(filename)
+
+
+class CandidateScannerTest(unittest.TestCase):
+    def setUp(self):
+        stubs.settings.clear()
+        self.can_use_processes = candidatescan.can_use_processes
+        # Like inside the editor
+        candidatescan.can_use_processes = lambda: False
+
+    def tearDown(self):
+        candidatescan.can_use_processes = self.can_use_processes
+
+    def test_editor_uses_worker_python(self):
+        pool = candidatescan.CandidateScanner().get_pool()
+        self.assertTrue(isinstance(pool, candidatescan.ScanProcesses))
+
+    def test_threads_when_disabled(self):
+        stubs.settings["search_use_processes"] = False
+        pool = candidatescan.CandidateScanner().get_pool()
+        self.assertFalse(isinstance(pool, candidatescan.ScanProcesses))
+        pool.terminate()
+
+
+if __name__ == "__main__":
+    unittest.main()
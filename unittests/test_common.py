@@ -0,0 +1,27 @@
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+common = stubs.import_module("internals.common")
+
+
+class FileLanguageTest(unittest.TestCase):
+    def test_extensions(self):
+        languages = [(common.get_file_language(name), name) for name in [
+            "a.c", "b.h", "c.cpp", "d.cxx", "e.cc", "f.hpp", "g.C", "h.m", "i.mm", "j.M",
+            "k.CPP", "l.MM", "m.inl", "Makefile", "/project.m/include/vector"]]
+        self.assertEqual(languages, [
+            ("c", "a.c"), ("c++", "b.h"), ("c++", "c.cpp"), ("c++", "d.cxx"), ("c++", "e.cc"),
+            ("c++", "f.hpp"), ("c++", "g.C"), ("objc", "h.m"), ("objc++", "i.mm"),
+            ("objc++", "j.M"), ("c++", "k.CPP"), ("objc++", "l.MM"), ("c++", "m.inl"),
+            ("c++", "Makefile"), ("c++", "/project.m/include/vector")])
+
+    def test_every_language_is_known(self):
+        for language in common.EXTENSION_LANGUAGES.values():
+            self.assertTrue(language in common.LANGUAGES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+fileinventory = stubs.import_module("internals.fileinventory")
+
+
+class FolderInventoryTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="sublimeclang-inventory")
+        os.makedirs(os.path.join(self.folder, "src", "sub"))
+        for name in ["src/a.cpp", "src/a.h", "src/sub/b.cpp"]:
+            open(os.path.join(self.folder, name), "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def get_files(self, extensions=None):
+        inventory = fileinventory.FolderInventory(self.folder)
+        return sorted(os.path.relpath(f, self.folder) for f in inventory.get_files(extensions, [], 0))
+
+    def test_files_by_extension(self):
+        self.assertEqual(self.get_files(["cpp"]), ["src/a.cpp", "src/sub/b.cpp"])
+
+    def test_symlink_loop(self):
+        os.symlink(os.path.join(self.folder, "src"), os.path.join(self.folder, "src", "sub", "loop"))
+        os.symlink(self.folder, os.path.join(self.folder, "root"))
+        self.assertEqual(self.get_files(), ["src/a.cpp", "src/a.h", "src/sub/b.cpp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
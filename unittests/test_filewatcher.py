@@ -0,0 +1,53 @@
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+
+class Recorder(object):
+    def __init__(self):
+        self.changed = []
+
+    def files_changed(self, paths):
+        self.changed.append(set(paths))
+
+
+class FakeTranslationUnitCache(Recorder):
+    def __init__(self, dirty):
+        Recorder.__init__(self)
+        self.dirty = dirty
+        self.reparsed = []
+
+    def files_changed(self, paths):
+        Recorder.files_changed(self, paths)
+        return list(self.dirty)
+
+    def reparse_dirty(self, filename, on_done):
+        self.reparsed.append(filename)
+        on_done()
+        return True
+
+
+# The modules that need libclang
+searchcache = Recorder()
+symbolIndexer = Recorder()
+tuCache = FakeTranslationUnitCache(["/project/a.cpp", "/project/b.cpp"])
+stubs.stub_module("internals.translationunitcache").searchcache = searchcache
+stubs.stub_module("internals.symbolindex").symbolIndexer = symbolIndexer
+stubs.stub_module("internals.remotecache").get_tu_cache = lambda: tuCache
+filewatcher = stubs.import_module("internals.filewatcher")
+
+
+class DispatchTest(unittest.TestCase):
+    def test_dispatch_notifies_every_cache(self):
+        paths = set(["/project/a.h"])
+        filewatcher.FileWatcher().dispatch(paths)
+        self.assertEqual(searchcache.changed[-1], paths)
+        self.assertEqual(symbolIndexer.changed[-1], paths)
+        self.assertEqual(tuCache.changed[-1], paths)
+        self.assertEqual(tuCache.reparsed[-2:], ["/project/a.cpp", "/project/b.cpp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from xml.parsers import expat
+
+import stubs
+
+plistreader = stubs.import_module("internals.plistreader")
+
+HEADER = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+"""
+
+DIAGNOSTIC = b"""
+  <dict>
+   <key>description</key><string>Dead store %d</string>
+   <key>location</key>
+   <dict>
+    <key>line</key><integer>%d</integer>
+    <key>file</key><integer>0</integer>
+   </dict>
+   <key>path</key><array><dict><key>kind</key><string>event</string></dict></array>
+  </dict>
+"""
+
+# The files are listed after the diagnostics referring to them
+REPORT = HEADER + b"""<dict>
+ <key>clang_version</key><string>clang version 3.2</string>
+ <key>diagnostics</key>
+ <array>""" + DIAGNOSTIC % (1, 10) + DIAGNOSTIC % (2, 20) + b"""</array>
+ <key>files</key>
+ <array>
+  <string>/project/a.c</string>
+ </array>
+</dict>
+</plist>
+"""
+
+
+class PlistReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.items = []
+        self.values = []
+        self.reader = plistreader.PlistReader(
+            ("diagnostics",), lambda key, item: self.items.append((key, item)),
+            lambda key, value: self.values.append((key, value)))
+
+    def test_items_are_streamed(self):
+        end = REPORT.index(b"<key>files</key>")
+        for i in range(end):
+            self.reader.feed(REPORT[i:i+1])
+        self.assertEqual([(key, item["location"]["line"]) for key, item in self.items],
+                         [("diagnostics", 10), ("diagnostics", 20)])
+        self.assertEqual(self.items[1][1]["description"], "Dead store 2")
+        self.assertEqual(self.items[1][1]["path"], [{"kind": "event"}])
+        self.reader.feed(REPORT[end:])
+        result = self.reader.close()
+        self.assertEqual(len(self.items), 2)
+        # Streamed items aren't kept
+        self.assertEqual(result["diagnostics"], [])
+
+    def test_root_values(self):
+        self.reader.feed(REPORT)
+        self.reader.close()
+        self.assertEqual(self.values, [("clang_version", "clang version 3.2"),
+                                       ("diagnostics", []),
+                                       ("files", ["/project/a.c"])])
+
+    def test_values(self):
+        data = HEADER + b"""<dict>
+ <key>integer</key><integer>-42</integer>
+ <key>real</key><real>1.5</real>
+ <key>true</key><true/>
+ <key>false</key><false/>
+ <key>data</key><data>AAEC/w==</data>
+ <key>date</key><date>2012-06-01T12:00:00Z</date>
+ <key>empty</key><string></string>
+ <key>nested</key>
+ <dict>
+  <key>array</key><array><integer>1</integer><array><string>a &amp; b</string></array><dict/></array>
+ </dict>
+</dict>
+</plist>
+"""
+        self.reader.feed(data)
+        self.assertEqual(self.reader.close(), {
+            "integer": -42,
+            "real": 1.5,
+            "true": True,
+            "false": False,
+            "data": b"\x00\x01\x02\xff",
+            "date": "2012-06-01T12:00:00Z",
+            "empty": "",
+            "nested": {"array": [1, ["a & b"], {}]}
+        })
+
+    def test_truncated(self):
+        self.reader.feed(REPORT[:len(REPORT) // 2])
+        self.assertRaises(expat.ExpatError, self.reader.close)
+
+
+class ParseTest(unittest.TestCase):
+    def test_complete(self):
+        self.assertEqual(plistreader.parse(HEADER + b"<array><integer>1</integer></array></plist>"), [1])
+
+    def test_partial(self):
+        self.assertEqual(plistreader.parse(REPORT[:-20]), None)
+        self.assertEqual(plistreader.parse(b""), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+# The modules that need libclang
+translationunitcache = stubs.stub_module("internals.translationunitcache")
+translationunitcache.next_generation = lambda: 1
+stubs.stub_module("internals.unsavedfiles").unsaved_buffers = None
+diagnostics = stubs.stub_module("internals.diagnostics")
+diagnostics.DiagnosticFile = diagnostics.DiagnosticData = None
+remotecache = stubs.import_module("internals.remotecache")
+
+
+class FakeWorker(object):
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+        self.retiring = False
+
+    def call_async(self, method, params, callback):
+        self.calls.append((method, params))
+        callback(None, self.result)
+
+    def call(self, method, params):
+        self.calls.append((method, params))
+        return "/project/a.cpp:3:1"
+
+
+class RemoteGotoTest(unittest.TestCase):
+    def setUp(self):
+        self.finished = []
+        translationunitcache.finish_goto = lambda *args: self.finished.append(args)
+        self.plan = {"index": {"usr": "c:@F@f#", "word": "f", "exclude": None, "definition": True},
+                     "companion": ["/project/a.h", 3, 6]}
+        self.worker = FakeWorker(self.plan)
+        self.tu = remotecache.RemoteTranslationUnit(self.worker, "/project/main.cpp", ["-I."], None,
+                                                    {"diagnostics": [], "includes": []})
+
+    def test_worker_only_locates(self):
+        found_callback = lambda target: None
+        self.tu.get_implementation("f();", 1, found_callback, ["/project"])
+        self.assertEqual(self.worker.calls,
+                         [("locate", ["implementation", "/project/main.cpp", ["-I."], None, "f();", 1])])
+        plan, filename, callback, folders = self.finished[0][:4]
+        self.assertEqual((plan, filename, callback, folders),
+                         (self.plan, "/project/main.cpp", found_callback, ["/project"]))
+
+    def test_companion_is_parsed_by_the_worker(self):
+        self.tu.get_definition("f();", 1, lambda target: None, ["/project"])
+        companion_finder = self.finished[0][-1]
+        self.assertEqual(companion_finder("/project/a.cpp", ["/project/a.h", 3, 6]), "/project/a.cpp:3:1")
+        self.assertEqual(self.worker.calls[-1],
+                         ("companion", ["/project/a.cpp", ["/project/a.h", 3, 6], ["-I."], None]))
+
+
+class FakeUnsavedBuffers(object):
+    def __init__(self):
+        self.calls = []
+
+    def get(self, filename, includes=None):
+        self.calls.append((filename, includes))
+        return [("/project/a.h", "int a;")]
+
+
+class RemoteDirtyReparseTest(unittest.TestCase):
+    def setUp(self):
+        self.main_thread = []
+        self.run_in_main_thread = remotecache.run_in_main_thread
+        remotecache.run_in_main_thread = self.main_thread.append
+        self.unsaved_buffers = remotecache.unsaved_buffers
+        remotecache.unsaved_buffers = FakeUnsavedBuffers()
+        self.worker = FakeWorker({"diagnostics": [], "includes": ["/project/a.h"]})
+        self.worker.is_over_limit = lambda: False
+        self.cache = remotecache.RemoteTranslationUnitCache()
+        self.cache.get_worker = lambda filename: self.worker
+        tu = remotecache.RemoteTranslationUnit(self.worker, "/project/main.cpp", ["-I."], None,
+                                               {"diagnostics": [], "includes": ["/project/a.h"]})
+        tu.dirty = True
+        self.cache.translationUnits.var["/project/main.cpp"] = tu
+
+    def tearDown(self):
+        remotecache.run_in_main_thread = self.run_in_main_thread
+        remotecache.unsaved_buffers = self.unsaved_buffers
+
+    def test_buffers_are_read_in_the_main_thread(self):
+        self.assertTrue(self.cache.reparse_dirty("/project/main.cpp"))
+        self.assertFalse(self.cache.reparse_dirty("/project/main.cpp"))
+        self.assertEqual((remotecache.unsaved_buffers.calls, self.worker.calls), ([], []))
+        for func in self.main_thread:
+            func()
+        self.assertEqual(remotecache.unsaved_buffers.calls, [("/project/main.cpp", set(["/project/a.h"]))])
+        self.assertEqual(self.worker.calls,
+                         [("reparse", ["/project/main.cpp", ["-I."], None, [("/project/a.h", "int a;")], None])])
+        self.assertFalse(self.cache.translationUnits.var["/project/main.cpp"].dirty)
+
+
+if __name__ == "__main__":
+    unittest.main()
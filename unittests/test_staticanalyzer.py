@@ -0,0 +1,155 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+
+class FakeTranslationUnitCache(object):
+    def get_opts_script(self, view):
+        return None
+
+    def get_base_opts(self, view):
+        return ["-Iinclude"]
+
+    def get_language_opts(self, view, language):
+        return ["-x", language]
+
+    def get_opts(self, view):
+        return ["-Iinclude", "-ObjC++"]
+
+
+# The translation unit cache needs libclang. Like in the editor it doesn't
+# exist yet when the analyzer is imported.
+translationunitcache = stubs.stub_module("internals.translationunitcache")
+translationunitcache.tuCache = None
+staticanalyzer = stubs.import_module("staticanalyzer")
+translationunitcache.tuCache = FakeTranslationUnitCache()
+
+
+class AnalyzerSettingsTest(unittest.TestCase):
+    def setUp(self):
+        stubs.settings.clear()
+        stubs.settings["analyzer_commandline"] = ["clang", "--analyze"]
+        self.analyzer = staticanalyzer.Analyzer()
+
+    def test_view_file_uses_view_options(self):
+        self.analyzer.update_settings(stubs.View("/project/main.h"))
+        self.assertEqual(self.analyzer.get_cmdline("/project/main.h"),
+                         ["clang", "--analyze", "-Iinclude", "-ObjC++"])
+
+    def test_other_files_use_their_extension(self):
+        self.analyzer.update_settings(stubs.View("/project/main.h"))
+        self.assertEqual(self.analyzer.get_cmdline("/project/a.c"),
+                         ["clang", "--analyze", "-Iinclude", "-x", "c"])
+        self.assertEqual(self.analyzer.get_cmdline("/project/b.mm"),
+                         ["clang", "--analyze", "-Iinclude", "-x", "objc++"])
+        self.assertEqual(self.analyzer.get_cmdline("/project/c.cpp"),
+                         ["clang", "--analyze", "-Iinclude", "-x", "c++"])
+
+    def test_view_settings_override(self):
+        view = stubs.View("/project/main.cpp", {"sublimeclang_analyzer_commandline": ["scan-clang"]})
+        self.analyzer.update_settings(view)
+        self.assertEqual(self.analyzer.get_cmdline("/project/a.c")[0], "scan-clang")
+
+
+# Stands in for clang: writes the results for the file and its niceness,
+# then exits once told to
+ANALYZER = r"""
+import os, sys, time
+sys.stdout.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<plist version="1.0"><dict>'
+                 '<key>files</key><array><string>%s</string></array>'
+                 '<key>diagnostics</key><array><dict>'
+                 '<key>description</key><string>Dead store</string>'
+                 '</dict></array></dict></plist>' % sys.argv[-1])
+sys.stdout.flush()
+os.close(1)
+f = open(sys.argv[-1] + ".written", "w")
+f.write(str(os.nice(0)))
+f.close()
+while not os.path.exists(sys.argv[-1] + ".exit"):
+    time.sleep(0.01)
+"""
+
+
+class AnalyzerBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="sublimeclang-analyzer")
+        stubs.settings.clear()
+        stubs.settings["analyzer_commandline"] = [sys.executable, "-c", ANALYZER]
+        stubs.settings["analyzer_cache"] = False
+        stubs.settings["analyzer_jobs"] = 2
+        stubs.settings["analyzer_min_free_memory"] = 0
+        self.analyzer = staticanalyzer.Analyzer()
+        self.analyzer.update_settings(stubs.View(os.path.join(self.folder, "main.c")))
+        self.added = []
+        self.analyzer.add_diagnostics = lambda diagnostics, files: self.added.append(files)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def wait_for(self, condition):
+        timeout = time.time() + 10
+        while not condition():
+            if time.time() > timeout:
+                self.fail("Timed out")
+            time.sleep(0.01)
+
+    def start(self, name, nice=0):
+        """
+        Starts a batch analyzing name and waits for its results to be
+        written. Returns the list on_done appends to.
+        """
+        done = []
+        filename = os.path.join(self.folder, name)
+        self.analyzer.start_jobs([(filename, None)], nice, done.append)
+        self.wait_for(lambda: os.path.exists(filename + ".written"))
+        return done
+
+    def finish(self, name):
+        open(os.path.join(self.folder, name) + ".exit", "w").close()
+
+    def test_batch_is_done(self):
+        done = self.start("a.c")
+        self.finish("a.c")
+        self.wait_for(lambda: done)
+        self.assertEqual(done, [False])
+        self.assertEqual(self.added, [[os.path.join(self.folder, "a.c")]])
+
+    def test_cancelled_batch_adds_no_diagnostics(self):
+        done = self.start("a.c")
+        self.analyzer.cancel()
+        self.wait_for(lambda: done)
+        self.assertEqual(done, [True])
+        self.assertEqual(self.added, [])
+
+    def test_batches_finish_on_their_own(self):
+        first = self.start("a.c")
+        second = self.start("b.c")
+        self.finish("b.c")
+        self.wait_for(lambda: second)
+        self.assertEqual(first, [])
+        self.finish("a.c")
+        self.wait_for(lambda: first)
+        self.assertEqual((first, second), ([False], [False]))
+
+    @unittest.skipIf(os.name == "nt", "niceness is posix only")
+    def test_project_batch_is_niced(self):
+        done = self.start("a.c", 5)
+        self.finish("a.c")
+        self.wait_for(lambda: done)
+        f = open(os.path.join(self.folder, "a.c.written"))
+        try:
+            self.assertEqual(int(f.read()), min(os.nice(0) + 5, 19))
+        finally:
+            f.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+try:
+    cindex = stubs.import_module("internals.clang.cindex")
+    common = stubs.import_module("internals.common")
+    symbolindex = stubs.import_module("internals.symbolindex")
+except Exception:
+    # libclang can't be loaded
+    symbolindex = None
+
+
+class FakeProject(object):
+    def __init__(self):
+        self.shards = {}
+
+    def set_shard(self, filename, mtime, source, symbols, refs):
+        self.shards[filename] = (symbols, refs)
+
+
+if symbolindex != None:
+    class SharedTranslationUnit(common.LockedVariable):
+        """A translation unit reparsed once it has been locked reparse_after times."""
+        def __init__(self, var, reparse_after=None):
+            common.LockedVariable.__init__(self, var)
+            self.generation = 1
+            self.locks = 0
+            self.reparse_after = reparse_after
+
+        def lock(self):
+            self.locks += 1
+            if self.locks == self.reparse_after:
+                self.generation += 1
+            return common.LockedVariable.lock(self)
+
+
+@unittest.skipIf(symbolindex == None, "needs libclang")
+class IndexTranslationUnitTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="sublimeclang-index")
+        self.filename = os.path.join(self.folder, "a.cpp")
+        f = open(self.filename, "w")
+        try:
+            f.write("namespace ns {\nclass Shape {\npublic:\n    int area() const;\n};\n")
+            for i in range(20):
+                f.write("int function%d(const Shape& s) { return s.area() + %d; }\n" % (i, i))
+            f.write("}\n")
+        finally:
+            f.close()
+        self.tu = cindex.Index.create().parse(None, [self.filename], [], 0)
+        self.step = symbolindex.WALK_STEP
+        symbolindex.WALK_STEP = 5
+
+    def tearDown(self):
+        symbolindex.WALK_STEP = self.step
+        shutil.rmtree(self.folder)
+
+    def index(self, tu):
+        project = FakeProject()
+        symbolindex.symbolIndexer.task_index_translation_unit((project, self.filename, tu))
+        return project.shards
+
+    def test_walked_in_steps(self):
+        tu = SharedTranslationUnit(self.tu)
+        shards = self.index(tu)
+        self.assertTrue(tu.locks > 10)
+        expected = symbolindex.collect_symbols(self.tu, lambda name: name == self.filename)
+        self.assertEqual(shards, expected)
+        symbols, refs = shards[self.filename]
+        self.assertEqual([s[1] for s in symbols if s[1]][:3], ["ns", "Shape", "area"])
+        self.assertEqual(len([r for r in refs if r[1].startswith("ns::function")]), 40)
+
+    def test_reparse_stops_the_walk(self):
+        self.assertEqual(self.index(SharedTranslationUnit(self.tu, 3)), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import stubs
+
+stubs.install_sublime()
+
+try:
+    cindex = stubs.import_module("internals.clang.cindex")
+    common = stubs.import_module("internals.common")
+    # Other tests stub what needs libclang
+    for name in ["internals.diagnostics", "internals.unsavedfiles", "internals.symbolindex"]:
+        stubs.import_module(name)
+    translationunitcache = stubs.import_module("internals.translationunitcache")
+except Exception:
+    # libclang or libcache can't be loaded
+    translationunitcache = None
+
+
+@unittest.skipIf(translationunitcache == None, "needs libclang and libcache")
+class SharedPchIncludesTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="sublimeclang-pch")
+        self.prefix = self.write("prefix.h", "#define PREFIX 1\n")
+        self.header = self.write("b.h", "int b();\n")
+        self.source = self.write("a.cpp", "#include \"b.h\"\nint a() { return b(); }\n")
+        self.cache = translationunitcache.TranslationUnitCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, contents):
+        filename = os.path.join(self.folder, name)
+        f = open(filename, "w")
+        try:
+            f.write(contents)
+        finally:
+            f.close()
+        return filename
+
+    def test_precompiled_headers_have_includers(self):
+        pch = translationunitcache.SharedPch(os.path.join(self.folder, "prefix.pch"),
+                                             ["#include \"prefix.h\""], [self.prefix], time.time())
+        index = cindex.Index.create()
+        tu = translationunitcache.LockedTranslationUnit(index.parse(None, [self.source], [], 0), self.source, pch)
+        expected = set([common.normalize_path(self.header), common.normalize_path(self.prefix)])
+        self.assertEqual(tu.includes, expected)
+        self.cache.update_include_graph(self.source, set(), tu.includes)
+        self.assertEqual(self.cache.get_dependents(self.prefix), [self.source])
+
+        tu.var.reparse([])
+        tu.update_includes()
+        self.assertEqual(tu.includes, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()